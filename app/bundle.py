@@ -0,0 +1,105 @@
+import os
+import json
+import time
+import shutil
+import zipfile
+from app.log_util import Log
+from app.index import read_description_excerpt
+
+# Single file bundle of the command repository. A bundle is a zip archive with
+# one deflated member per file (`<command>/<file>`) and a small JSON index as
+# its first member, so a bundle can be listed, and a single command extracted,
+# without unpacking the whole archive.
+
+log = Log()
+
+BUNDLE_INDEX_NAME = ".mcmd_bundle.json"
+BUNDLE_VERSION = 1
+
+def write_bundle(commands_dir, commands, bundle_path):
+    """
+    Write the given command folders to a bundle file.
+
+    Returns:
+        dict: The bundle index that was written.
+    """
+    index = {"version": BUNDLE_VERSION, "created": int(time.time()), "commands": {}}
+    members = []
+    for cmd in sorted(commands):
+        command_dir = os.path.join(commands_dir, cmd)
+        files = []
+        for root, dirs, names in os.walk(command_dir):
+            for name in sorted(names):
+                path = os.path.join(root, name)
+                arcname = os.path.relpath(path, commands_dir).replace(os.sep, '/')
+                members.append((path, arcname))
+                files.append(arcname)
+        index["commands"][cmd] = {
+            "description": read_description_excerpt(os.path.join(command_dir, f"{cmd}.desc")),
+            "files": files,
+        }
+
+    temp_path = f"{bundle_path}.{os.getpid()}.tmp"
+    with zipfile.ZipFile(temp_path, 'w', compression=zipfile.ZIP_DEFLATED) as bundle:
+        bundle.writestr(BUNDLE_INDEX_NAME, json.dumps(index), compress_type=zipfile.ZIP_STORED)
+        for path, arcname in members:
+            # ZipFile.write records the file mode, so executables stay executable
+            bundle.write(path, arcname)
+    os.replace(temp_path, bundle_path)
+    return index
+
+def read_bundle_index(bundle):
+    try:
+        index = json.loads(bundle.read(BUNDLE_INDEX_NAME))
+    except KeyError:
+        raise Exception(f"'{bundle.filename}' is not an mcmd bundle.")
+    if index.get("version") != BUNDLE_VERSION:
+        raise Exception(f"Unsupported bundle version {index.get('version')} in '{bundle.filename}'.")
+    return index
+
+def list_bundle(bundle_path):
+    """
+    Return {command name: {'description', 'files'}} from a bundle's index.
+    """
+    with zipfile.ZipFile(bundle_path) as bundle:
+        return read_bundle_index(bundle)["commands"]
+
+def extract_member(bundle, info, dest_file):
+    # Stream the member straight into place, never unpacking to a temporary folder
+    os.makedirs(os.path.dirname(dest_file), exist_ok=True)
+    temp_file = f"{dest_file}.{os.getpid()}.tmp"
+    with bundle.open(info) as src, open(temp_file, 'wb') as dest:
+        shutil.copyfileobj(src, dest)
+    mode = (info.external_attr >> 16) & 0o7777
+    if mode:
+        os.chmod(temp_file, mode)
+    os.utime(temp_file, (time.time(), time.mktime(info.date_time + (0, 0, -1))))
+    os.replace(temp_file, dest_file)
+
+def extract_bundle(bundle_path, commands_dir, commands=None):
+    """
+    Import commands from a bundle into the command repository.
+
+    Args:
+        bundle_path (str): The bundle file.
+        commands_dir (str): The command repository.
+        commands (list): Only import these commands. Defaults to all of them.
+
+    Returns:
+        list: The command folders that were imported.
+    """
+    with zipfile.ZipFile(bundle_path) as bundle:
+        index = read_bundle_index(bundle)
+        selected = sorted(index["commands"]) if not commands else commands
+        missing = [cmd for cmd in selected if cmd not in index["commands"]]
+        if missing:
+            raise Exception(f"Commands not found in bundle: {', '.join(missing)}")
+
+        root = os.path.realpath(commands_dir)
+        for cmd in selected:
+            for arcname in index["commands"][cmd]["files"]:
+                dest_file = os.path.realpath(os.path.join(commands_dir, arcname))
+                if not dest_file.startswith(root + os.sep):
+                    raise Exception(f"Refusing to extract '{arcname}' outside of '{commands_dir}'.")
+                extract_member(bundle, bundle.getinfo(arcname), dest_file)
+    return selected
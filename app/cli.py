@@ -12,19 +12,31 @@ os.environ['TK_SILENCE_DEPRECATION'] = '1'
 
 app = typer.Typer()
 app.add_typer(settings, name="setting",help="List and edit the settings")
+cache = typer.Typer()
+app.add_typer(cache, name="cache", help="Inspect and clear the result cache")
+daemon = typer.Typer()
+app.add_typer(daemon, name="daemon", help="Run a resident daemon that serves list, help and stats")
+storage = typer.Typer()
+app.add_typer(storage, name="storage", help="Switch between command folders and a single database file")
 
 console = Console()
 log = Log()
 
 @app.command()
-def create():
+def create(manifest: Optional[str] = typer.Option(None, "--from", help="Create or update every command of a JSON or YAML manifest without prompting")):
     """Create or update a custom command."""
-    create_or_update_command()
+    if manifest:
+        create_from_manifest(manifest)
+    else:
+        create_or_update_command()
 
 @app.command()
-def list():
+def list(limit: Optional[int] = typer.Option(None, "--limit", "-n", min=0, help="Show at most this many commands"),
+         offset: int = typer.Option(0, "--offset", min=0, help="Skip this many commands first"),
+         sort: str = typer.Option("name", "--sort", help="name, path, mtime (newest first) or none (repository order, streamed)"),
+         output: str = typer.Option("table", "--format", help="table, plain (tab separated) or json (one object per line)")):
     """List all custom command."""
-    list_commands()
+    list_commands(limit=limit, offset=offset, sort=sort, output=output)
 
 @app.command()
 def remove():
@@ -34,7 +46,22 @@ def remove():
 @app.command()
 def exec(
     command_name: str,
-    args: Optional[List[str]] = typer.Argument(None, help="Arguments for the command")
+    args: Optional[List[str]] = typer.Argument(None, help="Arguments for the command"),
+    replace: Optional[bool] = typer.Option(
+        None, "--replace/--no-replace", help="Replace mcmd with the script instead of waiting for it (default: EXEC_MODE setting)."
+    ),
+    no_cache: bool = typer.Option(False, "--no-cache", help="Run the command even if a cached result exists."),
+    capture: Optional[bool] = typer.Option(
+        None, "--capture/--no-capture", help="Log the command's output under .mcmd/logs (default: metadata and CAPTURE_OUTPUT setting)."
+    ),
+    timeout: Optional[float] = typer.Option(None, "--timeout", help="Stop the command after this many seconds (exits with 124)."),
+    cpu_limit: Optional[int] = typer.Option(None, "--cpu-limit", help="CPU time limit of the command, in seconds."),
+    memory_limit: Optional[int] = typer.Option(None, "--memory-limit", help="Address space limit of the command, in MB."),
+    nice: Optional[int] = typer.Option(None, "--nice", help="Niceness increment for the command."),
+    kill_grace: Optional[float] = typer.Option(None, "--kill-grace", help="Seconds between SIGTERM and SIGKILL when the command is stopped (default: 5)."),
+    watch: Optional[List[str]] = typer.Option(None, "--watch", "-w", help="Run the command again when files under this path change (repeatable)."),
+    debounce: float = typer.Option(0.2, "--debounce", help="Seconds without changes before a burst of changes triggers a run."),
+    queue: bool = typer.Option(False, "--queue", help="In watch mode, let a running execution finish instead of stopping it."),
 ):
     """
     Entry point to execute custom commands if no other command is specified.
@@ -45,25 +72,115 @@ def exec(
                 display_help(command_name)
             else:
                 # If args is None, set it to an empty list
-                execute_command(command_name, args)
+                limits = {"timeout": timeout, "cpu": cpu_limit, "memory_mb": memory_limit, "nice": nice, "kill_grace": kill_grace}
+                if watch:
+                    raise typer.Exit(watch_command(command_name, args, watch, debounce=debounce, queue=queue, limits=limits))
+                raise typer.Exit(execute_command(command_name, args, replace=replace, use_cache=not no_cache, capture=capture, limits=limits))
         else:
             log.error("Invalid command name. Command names should only contain alphanumeric characters and underscores.")
     else:
         log.error("No command provided. Use help for options.")
 
 @app.command()
-def export():
+def run(
+    command_names: List[str] = typer.Argument(..., help="Commands to run"),
+    jobs: Optional[int] = typer.Option(None, "--jobs", "-j", help="Maximum number of commands running at once (default: CPU count)."),
+):
+    """
+    Run several custom commands, concurrently where their dependencies allow.
+    """
+    invalid = [name for name in command_names if not is_valid_command_name(name)]
+    if invalid:
+        log.error(f"Invalid command names: {', '.join(invalid)}. Command names should only contain alphanumeric characters and underscores.")
+        raise typer.Exit(1)
+    raise typer.Exit(run_commands(command_names, jobs=jobs))
+
+@app.command()
+def export(
+    prune: Optional[bool] = typer.Option(
+        None, "--prune/--no-prune", help="Remove exported commands that no longer exist (default: EXPORT_PRUNE setting)."
+    ),
+    bundle: Optional[str] = typer.Option(None, "--bundle", help="Export all commands to this single bundle file instead."),
+):
     """
     Export custom commands to the default folder else selected destination folder from the command repo.
     """
-    export_commands()
+    export_commands(prune=prune, bundle=bundle)
 
 @app.command()
-def imports():
+def imports(
+    full: bool = typer.Option(False, "--full", help="Copy every command instead of only the ones changed since the last import."),
+    bundle: Optional[str] = typer.Option(None, "--bundle", help="Import from this bundle file instead of a folder."),
+    command: Optional[List[str]] = typer.Option(None, "--command", "-c", help="Only import this command from the bundle."),
+    list_only: bool = typer.Option(False, "--list", help="List the commands in the bundle without importing them."),
+):
     """
     Import custom commands from the default folder else selected destination folder to the command repo.
     """
-    import_commands()
+    import_commands(full=full, bundle=bundle, commands=command, list_only=list_only)
+
+@app.command()
+def search(query: List[str] = typer.Argument(..., help="Words to look for in command names and descriptions"),
+           limit: int = typer.Option(20, "--limit", "-n", help="Maximum number of results")):
+    """
+    Search commands by name and description, tolerating prefixes and typos.
+    """
+    search_commands(" ".join(query), limit)
+
+@app.command()
+def logs(command_name: str, lines: int = typer.Option(20, "--lines", "-n", min=1, help="Number of lines to show")):
+    """Show the end of a command's captured output."""
+    show_command_log(command_name, lines)
+
+@app.command()
+def stats(command_name: Optional[str] = typer.Argument(None, help="Only show this command")):
+    """Show latency percentiles, failure rate and call counts per command."""
+    show_stats(command_name)
+
+@app.command()
+def completion(shell: str = typer.Argument("bash", help="bash or zsh")):
+    """
+    Print a shell completion function that reads a precomputed command list instead of starting mcmd.
+    """
+    show_completion_script(shell)
+
+@cache.command("stats")
+def cache_stats():
+    """Show the size and hit rate of the result cache."""
+    show_cache_stats()
+
+@cache.command("clear")
+def cache_clear():
+    """Remove every cached result."""
+    clear_result_cache()
+
+@daemon.command("start")
+def daemon_start(
+    idle_timeout: Optional[int] = typer.Option(None, "--idle-timeout", help="Seconds before an idle daemon exits (default: DAEMON_IDLE_TIMEOUT setting)."),
+    foreground: bool = typer.Option(False, "--foreground", help="Run in this terminal instead of in the background."),
+):
+    """Start the daemon."""
+    raise typer.Exit(start_daemon(idle_timeout, foreground))
+
+@daemon.command("stop")
+def daemon_stop():
+    """Stop the daemon."""
+    stop_daemon()
+
+@daemon.command("status")
+def daemon_status():
+    """Show whether the daemon is running."""
+    show_daemon_status()
+
+@storage.command("migrate")
+def storage_migrate(backend: str = typer.Argument(..., help="files or sqlite")):
+    """Move every command to the given storage backend and switch to it."""
+    migrate_storage(backend)
+
+@storage.command("status")
+def storage_status():
+    """Show the storage backend and how many commands it holds."""
+    show_storage_status()
 
 @app.callback(invoke_without_command=True)
 def main(
@@ -0,0 +1,83 @@
+import os
+
+# Static shell completion. A plain `name<TAB>description` file of the
+# executable commands is rewritten together with the command index, and the
+# shell functions below read it directly, so pressing TAB never starts Python.
+
+COMPLETION_FILE_NAME = "completion.tsv"
+
+TOP_LEVEL_COMMANDS = ["create", "list", "remove", "search", "exec", "run", "logs", "export", "imports", "stats", "cache", "setting", "storage", "completion", "daemon"]
+
+BASH_SCRIPT = r'''_mcmd_complete() {
+    local cur="${COMP_WORDS[COMP_CWORD]}"
+    local cache="__CACHE__"
+    if [ "$COMP_CWORD" -eq 1 ]; then
+        COMPREPLY=($(compgen -W "__COMMANDS__" -- "$cur"))
+    elif [ -r "$cache" ] && { [ "${COMP_WORDS[1]}" = "run" ] || { [ "${COMP_WORDS[1]}" = "exec" ] && [ "$COMP_CWORD" -eq 2 ]; }; }; then
+        # One awk call instead of a bash read loop, which is slow on large repositories
+        COMPREPLY=($(awk -F '\t' -v prefix="$cur" 'index($1, prefix) == 1 { print $1 }' "$cache"))
+    fi
+}
+complete -o default -F _mcmd_complete mcmd
+'''
+
+ZSH_SCRIPT = r'''_mcmd() {
+    local cache="__CACHE__"
+    local -a commands
+    if (( CURRENT == 2 )); then
+        compadd __COMMANDS__
+    elif [[ -r "$cache" ]] && [[ "${words[2]}" == run || ( "${words[2]}" == exec && CURRENT -eq 3 ) ]]; then
+        commands=("${(@f)$(<$cache)}")
+        commands=("${(@)commands//:/\\:}")
+        commands=("${(@)commands//$'\t'/:}")
+        _describe 'command' commands
+    else
+        _files
+    fi
+}
+compdef _mcmd mcmd
+'''
+
+SHELL_SCRIPTS = {"bash": BASH_SCRIPT, "zsh": ZSH_SCRIPT}
+
+def first_line(description):
+    if not description:
+        return ""
+    return description.splitlines()[0].replace('\t', ' ').strip()
+
+def is_runnable(item):
+    """
+    Check that `mcmd exec` can run an indexed command: `<name>/<name>.sh` in
+    the repository, or any command of an extra root (absolute path), unlike
+    helper scripts such as `utility/logger.sh`.
+    """
+    return os.path.isabs(item["path"]) or item["path"] == os.path.join(item["name"], f"{item['name']}.sh")
+
+def write_completion_cache(state_dir, commands):
+    """
+    Write the completion file from the indexed commands.
+
+    Only commands that `mcmd exec` can run are listed.
+    """
+    lines = []
+    for item in sorted(commands, key=lambda item: item["name"]):
+        if is_runnable(item):
+            lines.append(f"{item['name']}\t{first_line(item['description'])}\n")
+
+    completion_file = os.path.join(state_dir, COMPLETION_FILE_NAME)
+    temp_file = f"{completion_file}.{os.getpid()}.tmp"
+    with open(temp_file, 'w') as file:
+        file.writelines(lines)
+    os.replace(temp_file, completion_file)
+
+def get_shell_script(shell, state_dir):
+    """
+    Return the completion function for a shell, reading the cache in state_dir.
+
+    Raises:
+        KeyError: If the shell is not supported.
+    """
+    script = SHELL_SCRIPTS[shell]
+    return (script
+            .replace("__CACHE__", os.path.join(state_dir, COMPLETION_FILE_NAME))
+            .replace("__COMMANDS__", " ".join(TOP_LEVEL_COMMANDS)))
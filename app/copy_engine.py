@@ -0,0 +1,58 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from app.settings_store import get_settings
+from app.repository import atomic_copy
+
+# Bulk file copies for export and imports. On NFS and other high-latency
+# filesystems the cost of a copy is dominated by per-file round trips, so the
+# files of many command folders are copied at once on a bounded thread pool.
+# Each file is copied next to its destination and renamed into place, so a
+# command being run while it is imported is never seen half-written.
+
+def list_tree_files(src_dir, dest_dir):
+    """
+    Return (src, dest) pairs for every file under src_dir, mirrored into dest_dir.
+    """
+    pairs = []
+    for root, dirs, files in os.walk(src_dir):
+        rel_root = os.path.relpath(root, src_dir)
+        for file in files:
+            pairs.append((os.path.join(root, file), os.path.normpath(os.path.join(dest_dir, rel_root, file))))
+    return pairs
+
+def copy_file(pair):
+    # copy2 keeps the mode, so the executable bit set at install and create time survives
+    return atomic_copy(*pair)
+
+def copy_files(pairs, workers=None):
+    """
+    Copy files on a bounded thread pool.
+
+    Args:
+        pairs (list): (src, dest) file paths.
+        workers (int): Number of copy threads. Defaults to the COPY_WORKERS setting.
+
+    Returns:
+        dict: 'files' and 'bytes' copied, and the wall time in 'seconds'.
+    """
+    if workers is None:
+        workers = get_settings("COPY_WORKERS")
+    start = time.perf_counter()
+
+    # Create the destination folders up front so the workers never race on them
+    for folder in sorted({os.path.dirname(dest) for _, dest in pairs}):
+        os.makedirs(folder, exist_ok=True)
+
+    if len(pairs) <= 1 or workers <= 1:
+        sizes = [copy_file(pair) for pair in pairs]
+    else:
+        with ThreadPoolExecutor(max_workers=min(workers, len(pairs))) as pool:
+            sizes = list(pool.map(copy_file, pairs))
+
+    return {"files": len(pairs), "bytes": sum(sizes), "seconds": time.perf_counter() - start}
+
+def format_throughput(stats):
+    seconds = max(stats["seconds"], 1e-6)
+    return (f"{stats['files']} files, {stats['bytes'] / 1024:.1f} KB in {stats['seconds']:.2f}s "
+            f"({stats['files'] / seconds:.0f} files/s, {stats['bytes'] / 1024 / 1024 / seconds:.2f} MB/s)")
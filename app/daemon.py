@@ -0,0 +1,285 @@
+import io
+import os
+import sys
+import json
+import time
+import threading
+import contextlib
+import socketserver
+from app.log_util import Log
+from app.settings_store import get_settings
+from app.index import get_index_file, get_state_dir
+from app.runner import get_commands_dir
+from app.storage import get_storage, get_database_file
+from app.roots import get_extra_roots, load_root_table
+from app.daemon_client import get_socket_path, get_settings_dir, is_private_dir, request
+from app.telemetry import iter_records, summarize
+
+# Resident mcmd daemon. It keeps settings, the command index and rendered
+# output of `--help`, `list` and `stats` warm in memory and serves them over a
+# Unix socket, one JSON request and one JSON response line per connection.
+# There is one socket per settings folder, in a folder only the user can
+# open. Every response carries the daemon's settings folder, so the client can
+# tell that it talks to the daemon of its own repository. A watcher thread
+# keeps the index fresh and stops the daemon once it has been idle for
+# DAEMON_IDLE_TIMEOUT seconds, or when the settings point to another
+# repository.
+#
+# Requests:
+#     {"op": "ping"}
+#     {"op": "list"}                              -> {"commands": [...]}
+#     {"op": "stats", "name": null}               -> {"stats": [...]}
+#     {"op": "render", "argv": ["list"], "width": 120, "color": true}
+#     {"op": "stop"}
+
+log = Log()
+
+# Interval of the cheap change check (root and index mtime), and of the full
+# check that stats every script, description and metadata file, which catches
+# files edited in place without touching the mtime of their folder
+QUICK_CHECK_INTERVAL = 0.5
+FULL_CHECK_INTERVAL = 10.0
+
+class State:
+    def __init__(self):
+        self.commands_dir = get_commands_dir()
+        self.settings_dir = get_settings_dir()
+        self.started = time.time()
+        self.last_request = time.time()
+        self.lock = threading.Lock()
+        self.render_lock = threading.Lock()
+        self.renders = {}
+        self.signature = None
+        self.commands = []
+        self.refresh()
+        self.files = self.file_signature()
+
+    def repository_signature(self):
+        signature = []
+        for path in [self.commands_dir, get_index_file(self.commands_dir), get_database_file(self.commands_dir),
+                     os.path.join(self.settings_dir, "settings.json")] + get_extra_roots(self.commands_dir):
+            try:
+                stat = os.stat(path)
+                signature.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                signature.append(None)
+        return signature
+
+    def file_signature(self):
+        """
+        Return {path: (mtime, size)} of the files of every indexed command.
+        """
+        signature = {}
+        if get_storage(self.commands_dir).backend != "files":
+            # Packed commands are covered by the database's mtime
+            return signature
+        with self.lock:
+            commands = self.commands
+        for item in commands:
+            command_file = os.path.join(self.commands_dir, item["path"])
+            base = os.path.join(os.path.dirname(command_file), item["name"])
+            for path in (command_file, base + ".desc", base + ".meta"):
+                try:
+                    stat = os.stat(path)
+                    signature[path] = (stat.st_mtime_ns, stat.st_size)
+                except FileNotFoundError:
+                    signature[path] = None
+        return signature
+
+    def full_check(self):
+        """
+        Rescan the folders whose files changed in place since the last full
+        check, and the extra roots, then refresh.
+        """
+        files = self.file_signature()
+        changed = {os.path.relpath(path, self.commands_dir).split(os.sep)[0]
+                   for path in files.keys() | self.files.keys() if files.get(path) != self.files.get(path)}
+        if changed:
+            get_storage(self.commands_dir).refresh_index(sorted(changed))
+        load_root_table(self.commands_dir, full_check=True)
+        self.refresh()
+        self.files = self.file_signature()
+
+    def refresh(self):
+        storage = get_storage(self.commands_dir)
+        commands = storage.get_commands()
+        with self.lock:
+            self.commands = commands
+            # Rendered output depends on the index and the settings
+            self.renders = {}
+            self.signature = self.repository_signature()
+
+    def render(self, argv, width, color):
+        # Stats change with every run, so only help and list are kept
+        if argv[0] == "stats":
+            return render_cli(argv, width, color)
+        key = (tuple(argv), width, color)
+        with self.lock:
+            if key in self.renders:
+                return self.renders[key]
+        output = render_cli(argv, width, color)
+        with self.lock:
+            self.renders[key] = output
+        return output
+
+def render_cli(argv, width, color):
+    """
+    Run a CLI invocation in the daemon and capture what it prints.
+    """
+    from rich.console import Console
+    import app.operations as operations
+    from app.cli import app as cli
+
+    environ = {"COLUMNS": str(width) if width else None, "FORCE_COLOR": "1" if color else None,
+               "NO_COLOR": None if color else "1"}
+    with STATE.render_lock:
+        saved_environ = {name: os.environ.get(name) for name in environ}
+        saved_console = operations.console
+        buffer = io.StringIO()
+        try:
+            for name, value in environ.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+            operations.console = Console()
+            with contextlib.redirect_stdout(buffer):
+                try:
+                    cli(argv, prog_name="mcmd", standalone_mode=False)
+                except SystemExit:
+                    pass
+        finally:
+            operations.console = saved_console
+            for name, value in saved_environ.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+    return buffer.getvalue()
+
+def handle_request(payload):
+    op = payload.get("op")
+    if op == "ping":
+        return {"ok": True, "pid": os.getpid(), "commands_dir": STATE.commands_dir,
+                "uptime": round(time.time() - STATE.started, 1), "commands": len(STATE.commands)}
+    if op == "list":
+        with STATE.lock:
+            return {"ok": True, "commands": STATE.commands}
+    if op == "stats":
+        records = iter_records(STATE.commands_dir)
+        if payload.get("name"):
+            records = (record for record in records if record["command"] == payload["name"])
+        return {"ok": True, "stats": summarize(records)}
+    if op == "render":
+        return {"ok": True, "output": STATE.render(payload["argv"], payload.get("width"), bool(payload.get("color")))}
+    if op == "stop":
+        threading.Thread(target=SERVER.shutdown, daemon=True).start()
+        return {"ok": True}
+    return {"ok": False, "error": f"Unknown op '{op}'"}
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        STATE.last_request = time.time()
+        try:
+            response = handle_request(json.loads(self.rfile.readline()))
+        except Exception as e:
+            response = {"ok": False, "error": str(e)}
+        response["settings_dir"] = STATE.settings_dir
+        self.wfile.write(json.dumps(response).encode() + b"\n")
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def watch(idle_timeout):
+    last_full_check = time.time()
+    while True:
+        time.sleep(QUICK_CHECK_INTERVAL)
+        if time.time() - STATE.last_request > idle_timeout:
+            log.info(f"Idle for {idle_timeout}s, shutting down.")
+            SERVER.shutdown()
+            return
+        try:
+            changed = STATE.repository_signature() != STATE.signature
+            if changed and get_commands_dir() != STATE.commands_dir:
+                log.info("The settings point to another command repository, shutting down.")
+                SERVER.shutdown()
+                return
+            if time.time() - last_full_check > FULL_CHECK_INTERVAL:
+                STATE.full_check()
+                last_full_check = time.time()
+            elif changed:
+                STATE.refresh()
+        except Exception as e:
+            log.error(f"Error refreshing the command index: {e}")
+
+STATE = None
+SERVER = None
+
+def serve(idle_timeout=None):
+    """
+    Run the daemon in the foreground until it is stopped or idle for too long.
+    """
+    global STATE, SERVER
+
+    if idle_timeout is None:
+        idle_timeout = get_settings("DAEMON_IDLE_TIMEOUT")
+    socket_path = get_socket_path()
+    if request({"op": "ping"}, socket_path):
+        log.error(f"A daemon is already listening on {socket_path}.")
+        return 1
+    os.makedirs(os.path.dirname(socket_path), mode=0o700, exist_ok=True)
+    if not is_private_dir(os.path.dirname(socket_path)):
+        log.error(f"{os.path.dirname(socket_path)} must be a folder owned by you with mode 0700, not starting the daemon.")
+        return 1
+    if os.path.exists(socket_path):
+        # Left behind by a daemon that did not shut down cleanly
+        os.remove(socket_path)
+
+    STATE = State()
+    SERVER = Server(socket_path, RequestHandler)
+    os.chmod(socket_path, 0o600)
+    threading.Thread(target=watch, args=(idle_timeout,), daemon=True).start()
+    log.info(f"mcmd daemon {os.getpid()} listening on {socket_path}")
+    sys.stdout.flush()
+    try:
+        SERVER.serve_forever()
+    finally:
+        SERVER.server_close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+    return 0
+
+def start_background(idle_timeout=None, wait=5.0):
+    """
+    Start the daemon as a detached process, logging to .mcmd/daemon.log.
+
+    Returns:
+        dict: The daemon's ping response, or None if it did not come up.
+    """
+    import subprocess
+
+    commands_dir = get_commands_dir()
+    log_file = os.path.join(get_state_dir(commands_dir), "daemon.log")
+    os.makedirs(os.path.dirname(log_file), exist_ok=True)
+    command = [sys.executable, "-m", "app.daemon"]
+    if idle_timeout is not None:
+        command.append(str(idle_timeout))
+    with open(log_file, 'a') as output:
+        subprocess.Popen(
+            command,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            stdin=subprocess.DEVNULL,
+            stdout=output,
+            stderr=output,
+            start_new_session=True,
+        )
+    deadline = time.time() + wait
+    while time.time() < deadline:
+        response = request({"op": "ping"})
+        if response:
+            return response
+        time.sleep(0.05)
+    return None
+
+if __name__ == "__main__":
+    sys.exit(serve(int(sys.argv[1]) if len(sys.argv) > 1 else None))
@@ -0,0 +1,94 @@
+import os
+import sys
+import json
+import stat
+import zlib
+
+# Thin client of the mcmd daemon (app/daemon.py). Loaded by app.main before
+# anything else, so it only imports the standard library, and every failure
+# means "no daemon": the caller then falls back to the normal path.
+
+CONNECT_TIMEOUT = 2.0
+
+# Invocations the daemon can answer with pre-rendered output
+SERVED_COMMANDS = (["--help"], ["-h"], ["list"], ["stats"])
+
+def get_settings_dir():
+    # Where settings.json lives, it decides which command repository mcmd uses
+    return os.path.realpath(os.path.expanduser("~/.mcmd_commands"))
+
+def get_socket_path():
+    """
+    Return the daemon's socket for the current settings, so mcmd with another
+    HOME never talks to a daemon serving a different command repository.
+    """
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if not (runtime_dir and os.path.isdir(runtime_dir)):
+        runtime_dir = os.path.join("/tmp", f"mcmd-{os.getuid()}")
+    key = zlib.crc32(get_settings_dir().encode())
+    return os.path.join(runtime_dir, f"mcmd-daemon-{key:08x}.sock")
+
+def is_private_dir(directory):
+    """
+    Check that a folder is ours and closed to everyone else, so nobody can
+    put a socket of their own in place of the daemon's.
+    """
+    try:
+        info = os.lstat(directory)
+    except OSError:
+        return False
+    return stat.S_ISDIR(info.st_mode) and info.st_uid == os.getuid() and info.st_mode & 0o077 == 0
+
+def request(payload, socket_path=None, timeout=CONNECT_TIMEOUT):
+    """
+    Send one request to the daemon.
+
+    Returns:
+        dict: The daemon's response, or None if no daemon answered.
+    """
+    socket_path = socket_path or get_socket_path()
+    if not os.path.exists(socket_path) or not is_private_dir(os.path.dirname(socket_path)):
+        return None
+
+    import socket
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(timeout)
+            client.connect(socket_path)
+            client.sendall(json.dumps(payload).encode() + b"\n")
+            with client.makefile('rb') as reader:
+                line = reader.readline()
+        response = json.loads(line) if line else None
+    except (OSError, ValueError):
+        return None
+    if not response or response.get("settings_dir") != get_settings_dir():
+        # A daemon for other settings, its answers would be about another repository
+        return None
+    return response
+
+def is_served(argv):
+    return argv in SERVED_COMMANDS or (len(argv) == 2 and argv[0] == "stats" and argv[1].isidentifier())
+
+def render_from_daemon(argv):
+    """
+    Ask the daemon for the output of a served invocation.
+
+    Returns:
+        str: The rendered output, or None to fall back to the normal path.
+    """
+    if not is_served(argv):
+        return None
+    try:
+        width = os.get_terminal_size(sys.stdout.fileno()).columns
+    except OSError:
+        width = None
+    response = request({
+        "op": "render",
+        "argv": argv,
+        "width": width,
+        "color": sys.stdout.isatty() and "NO_COLOR" not in os.environ,
+    })
+    if not response or not response.get("ok"):
+        return None
+    return response["output"]
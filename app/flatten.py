@@ -0,0 +1,156 @@
+import os
+import re
+import json
+
+# Flattened commands. A command that sources helpers from the repository, e.g.
+#
+#     source ~/.mcmd_commands/utility/logger.sh
+#
+# gets a `<name>.flat.sh` next to its `<name>.sh` with every such helper
+# inlined, so running it opens one file and an exported copy still works
+# without the helper. The second line of the flat file records the mtime and
+# size of the script and of every inlined helper; `mcmd exec` uses the flat
+# file only while they all still match, and rebuilds it otherwise.
+#
+# Only `source`/`.` lines naming one repository-local file, with no other
+# variables than $HOME, are inlined. Helpers that use BASH_SOURCE or a top
+# level `return` depend on being sourced and are left as they are.
+#
+# This module is loaded on the `mcmd exec` fast path, keep its imports light.
+
+FLAT_SUFFIX = ".flat.sh"
+HEADER_PREFIX = "# mcmd-flat: "
+MAX_DEPTH = 8
+
+SOURCE_PATTERN = re.compile(r"""^(\s*)(?:source|\.)\s+(["']?)([^\s"';&|]+)\2\s*(#.*)?$""")
+SOURCED_ONLY_PATTERN = re.compile(r"BASH_SOURCE|^return\b", re.MULTILINE)
+
+def get_flat_file(command_file):
+    return command_file[:-len(".sh")] + FLAT_SUFFIX
+
+def is_flat_file(file_name):
+    return file_name.endswith(FLAT_SUFFIX)
+
+def file_signature(path):
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+def resolve_include(commands_dir, script_dir, target):
+    """
+    Return the real path of a sourced file if it is a helper inside the
+    repository, else None.
+    """
+    target = target.replace("${HOME}", "~").replace("$HOME", "~")
+    if "$" in target or "`" in target:
+        return None
+    path = os.path.realpath(os.path.join(script_dir, os.path.expanduser(target)))
+    root = os.path.realpath(commands_dir)
+    if not path.startswith(root + os.sep) or not os.path.isfile(path):
+        return None
+    return path
+
+def inline_includes(commands_dir, script_file, includes, stack):
+    """
+    Return the lines of a script with its repository-local helpers inlined,
+    adding every inlined helper to includes.
+    """
+    with open(script_file, 'r') as file:
+        lines = file.read().splitlines()
+    output = []
+    for line in lines:
+        match = SOURCE_PATTERN.match(line)
+        helper = match and resolve_include(commands_dir, os.path.dirname(script_file), match.group(3))
+        if not helper or helper in stack or len(stack) >= MAX_DEPTH:
+            output.append(line)
+            continue
+        with open(helper, 'r') as file:
+            if SOURCED_ONLY_PATTERN.search(file.read()):
+                output.append(line)
+                continue
+        includes.setdefault(helper, file_signature(helper))
+        name = os.path.relpath(helper, os.path.realpath(commands_dir))
+        output.append(f"{match.group(1)}# --- begin {name} ---")
+        helper_lines = inline_includes(commands_dir, helper, includes, stack + [helper])
+        if helper_lines and helper_lines[0].startswith("#!"):
+            helper_lines = helper_lines[1:]
+        output.extend(helper_lines)
+        output.append(f"{match.group(1)}# --- end {name} ---")
+    return output
+
+def flatten_command(commands_dir, command_file):
+    """
+    Write, refresh or remove the flat file of a command.
+
+    Returns:
+        str: The flat file, or None if the script sources no repository helpers.
+    """
+    flat_file = get_flat_file(command_file)
+    includes = {}
+    lines = inline_includes(commands_dir, command_file, includes, [os.path.realpath(command_file)])
+    if not includes:
+        if os.path.exists(flat_file):
+            os.remove(flat_file)
+        return None
+
+    header = {"script": file_signature(command_file), "includes": includes}
+    if lines and lines[0].startswith("#!"):
+        shebang, lines = lines[0], lines[1:]
+    else:
+        shebang = "#!/bin/bash"
+    content = "\n".join([shebang, HEADER_PREFIX + json.dumps(header)] + lines) + "\n"
+
+    temp_file = f"{flat_file}.{os.getpid()}.tmp"
+    with open(temp_file, 'w') as file:
+        file.write(content)
+    os.chmod(temp_file, 0o755)
+    os.replace(temp_file, flat_file)
+    return flat_file
+
+def is_fresh(command_file, flat_file):
+    try:
+        with open(flat_file, 'r') as file:
+            file.readline()
+            header = file.readline()
+        if not header.startswith(HEADER_PREFIX):
+            return False
+        header = json.loads(header[len(HEADER_PREFIX):])
+        if file_signature(command_file) != header["script"]:
+            return False
+        return all(file_signature(path) == signature for path, signature in header["includes"].items())
+    except (OSError, ValueError, KeyError):
+        return False
+
+def get_runnable_file(commands_dir, command_file):
+    """
+    Return the file to run for a command: its flat file when there is an up to
+    date one, rebuilding it if a helper changed, else the script itself.
+    """
+    flat_file = get_flat_file(command_file)
+    if not os.path.exists(flat_file):
+        return command_file
+    if is_fresh(command_file, flat_file):
+        return flat_file
+    try:
+        return flatten_command(commands_dir, command_file) or command_file
+    except (OSError, UnicodeDecodeError):
+        return command_file
+
+def flatten_all(commands_dir):
+    """
+    Flatten every `<name>/<name>.sh` command of the repository.
+
+    Returns:
+        int: The number of commands that have a flat file.
+    """
+    flattened = 0
+    with os.scandir(commands_dir) as entries:
+        for entry in entries:
+            command_file = os.path.join(entry.path, f"{entry.name}.sh")
+            if entry.name.startswith('.') or not os.path.isfile(command_file):
+                continue
+            try:
+                if flatten_command(commands_dir, command_file):
+                    flattened += 1
+            except (OSError, UnicodeDecodeError):
+                continue
+    return flattened
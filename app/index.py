@@ -0,0 +1,250 @@
+import os
+import json
+from app.log_util import Log
+from app.settings_store import get_settings
+from app.completion import COMPLETION_FILE_NAME, write_completion_cache
+from app.search import SEARCH_FILE_NAMES, update_search_index
+from app.flatten import is_flat_file
+from app.roots import get_roots_stamp, get_root_commands, get_state_dir, STATE_DIR_NAME  # noqa: F401, re-exported
+
+# On-disk index of the command repository, so list/remove do not have to
+# os.walk the whole tree and read every .desc file on each call.
+#
+# Entries are grouped by top-level folder of the repository. A group is
+# rescanned only when the mtime of its folder changes, and folders are added
+# or dropped when the mtime of the repository root changes. Mutations done by
+# mcmd itself (create, remove, imports) update the index explicitly, because
+# rewriting a file in place does not touch the mtime of its folder.
+#
+# The completion file and the search index are derived from the index and the
+# commands of the extra roots (see app/roots.py). They carry a stamp of what
+# they were built from, so a reader can tell cheaply whether they are current.
+
+log = Log()
+
+INDEX_FILE_NAME = "index.json"
+INDEX_VERSION = 1
+DESCRIPTION_EXCERPT_LENGTH = 200
+
+def get_index_file(commands_dir):
+    return os.path.join(get_state_dir(commands_dir), INDEX_FILE_NAME)
+
+def read_description_excerpt(desc_file, length=DESCRIPTION_EXCERPT_LENGTH):
+    """
+    Read the start of a description file, truncated the way `mcmd list` shows it.
+
+    Returns:
+        str: The excerpt, or None if the description file does not exist.
+    """
+    try:
+        with open(desc_file, 'r') as file:
+            # Read a little past the limit so leading whitespace does not eat the excerpt
+            description = file.read(length * 4 + 1).strip()
+    except FileNotFoundError:
+        return None
+    if len(description) > length:
+        description = description[:length] + "..."
+    return description
+
+def scan_folder(commands_dir, folder):
+    """
+    Collect the commands found under one top-level folder of the repository.
+    """
+    items = []
+    for root, dirs, files in os.walk(os.path.join(commands_dir, folder)):
+        dirs.sort()
+        for file in sorted(files):
+            if not file.endswith('.sh') or is_flat_file(file):
+                continue
+            command_name = file[:-3]
+            command_path = os.path.join(root, file)
+            try:
+                stat = os.stat(command_path)
+            except FileNotFoundError:
+                continue
+            items.append({
+                "name": command_name,
+                "path": os.path.relpath(command_path, commands_dir),
+                "description": read_description_excerpt(os.path.join(root, f"{command_name}.desc")),
+                "mtime": stat.st_mtime_ns,
+                "size": stat.st_size,
+            })
+    return items
+
+def list_folders(commands_dir):
+    folders = []
+    with os.scandir(commands_dir) as entries:
+        for entry in entries:
+            if not entry.name.startswith('.') and entry.is_dir():
+                folders.append(entry.name)
+    return folders
+
+def read_index(commands_dir):
+    try:
+        with open(get_index_file(commands_dir), 'r') as file:
+            index = json.load(file)
+        if index.get("version") == INDEX_VERSION:
+            return index
+    except (FileNotFoundError, json.JSONDecodeError):
+        pass
+    return {"version": INDEX_VERSION, "root_mtime": None, "folders": {}}
+
+def write_index(commands_dir, index, changed_folders=None):
+    """
+    Save the index and the files derived from it.
+
+    Args:
+        commands_dir (str): The command repository.
+        index (dict): The index to save.
+        changed_folders (iterable): Top-level folders rescanned since the last
+            save, None if any folder may have changed.
+    """
+    index_file = get_index_file(commands_dir)
+    roots_stamp = get_roots_stamp(commands_dir)
+    if index.get("roots_stamp") != roots_stamp:
+        # The extra roots changed, their commands are re-read too
+        changed_folders = None
+    index["roots_stamp"] = roots_stamp
+    try:
+        os.makedirs(os.path.dirname(index_file), exist_ok=True)
+        temp_file = f"{index_file}.{os.getpid()}.tmp"
+        with open(temp_file, 'w') as file:
+            json.dump(index, file)
+        os.replace(temp_file, index_file)
+        # Derived files that must follow every change of the repository, with
+        # the sqlite backend they are written from the database instead
+        if get_settings("STORAGE_BACKEND") == "files":
+            commands = [item for group in index["folders"].values() for item in group["items"]]
+            commands += get_root_commands(commands_dir, {item["name"] for item in commands}, full_check=False)
+            write_completion_cache(get_state_dir(commands_dir), commands)
+            update_search_index(commands_dir, get_state_dir(commands_dir), commands, changed_folders,
+                                make_stamp(index["root_mtime"], roots_stamp))
+    except OSError as e:
+        # The index is only a cache, a read-only repository still works without it
+        log.warn(f"Could not save the command index: {e}")
+
+def make_stamp(root_mtime, roots_stamp):
+    return f"{root_mtime}:{roots_stamp}"
+
+def get_current_stamp(commands_dir):
+    """
+    Return the stamp of up to date derived files: the repository root's mtime
+    and when the root table was rebuilt.
+    """
+    return make_stamp(os.stat(commands_dir).st_mtime_ns, get_roots_stamp(commands_dir))
+
+def folder_mtime(commands_dir, folder):
+    try:
+        return os.stat(os.path.join(commands_dir, folder)).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+def refresh_folders(commands_dir, index, folders):
+    """
+    Rescan the given folders in the index, dropping the ones that no longer exist.
+    """
+    for folder in folders:
+        mtime = folder_mtime(commands_dir, folder)
+        if mtime is None:
+            index["folders"].pop(folder, None)
+        else:
+            index["folders"][folder] = {"mtime": mtime, "items": scan_folder(commands_dir, folder)}
+
+def load_index(commands_dir, changed=()):
+    """
+    Load the command index, rescanning only the folders whose mtime changed.
+
+    Args:
+        commands_dir (str): The command repository.
+        changed (iterable): Top-level folders to rescan regardless of their mtime.
+    """
+    index = read_index(commands_dir)
+    root_mtime = os.stat(commands_dir).st_mtime_ns
+    stale = list(changed)
+    root_changed = index["root_mtime"] != root_mtime or index.get("roots_stamp") != get_roots_stamp(commands_dir)
+
+    if root_changed:
+        current = set(list_folders(commands_dir))
+        known = set(index["folders"])
+        stale.extend(folder for folder in current ^ known if folder not in stale)
+        index["root_mtime"] = root_mtime
+
+    for folder, group in index["folders"].items():
+        if folder not in stale and folder_mtime(commands_dir, folder) != group["mtime"]:
+            stale.append(folder)
+
+    state_dir = get_state_dir(commands_dir)
+    derived_files = [get_index_file(commands_dir)]
+    if get_settings("STORAGE_BACKEND") == "files":
+        derived_files += [os.path.join(state_dir, name) for name in (COMPLETION_FILE_NAME,) + SEARCH_FILE_NAMES]
+    # A new stamp is saved even when no folder changed, `mcmd search` checks it
+    if stale or root_changed or not all(os.path.exists(path) for path in derived_files):
+        refresh_folders(commands_dir, index, stale)
+        write_index(commands_dir, index, stale)
+    return index
+
+def get_commands(commands_dir):
+    """
+    Return the indexed commands sorted by name.
+
+    Returns:
+        list: Dicts with name, path (relative to the repository), description, mtime and size.
+    """
+    if not os.path.exists(commands_dir):
+        return []
+    index = load_index(commands_dir)
+    items = [item for group in index["folders"].values() for item in group["items"]]
+    items.sort(key=lambda item: (item["name"], item["path"]))
+    return items
+
+def iter_commands(commands_dir):
+    """
+    Yield the commands folder by folder, in repository order, without waiting
+    for the whole repository to be checked.
+
+    Folders that changed since the last scan are rescanned as they are reached.
+    The index is saved when the iteration ends, also when the caller stops
+    early; folders not reached yet are then simply checked again next time.
+    """
+    if not os.path.exists(commands_dir):
+        return
+    index = read_index(commands_dir)
+    root_mtime = os.stat(commands_dir).st_mtime_ns
+    folders = sorted(set(list_folders(commands_dir)) if index["root_mtime"] != root_mtime else index["folders"])
+    rescanned = []
+    try:
+        for folder in folders:
+            group = index["folders"].get(folder)
+            mtime = folder_mtime(commands_dir, folder)
+            if group is None or group["mtime"] != mtime:
+                refresh_folders(commands_dir, index, [folder])
+                rescanned.append(folder)
+                group = index["folders"].get(folder)
+                if group is None:
+                    continue
+            yield from group["items"]
+        # Every folder was reached, so the ones that disappeared can be dropped
+        for folder in set(index["folders"]) - set(folders):
+            del index["folders"][folder]
+            rescanned.append(folder)
+        if index["root_mtime"] != root_mtime:
+            index["root_mtime"] = root_mtime
+            write_index(commands_dir, index, rescanned)
+            rescanned = []
+    finally:
+        if rescanned:
+            write_index(commands_dir, index, rescanned)
+
+def update_index(commands_dir, folders):
+    """
+    Rescan the given top-level folders after mcmd changed them.
+    """
+    load_index(commands_dir, changed=folders)
+
+def rebuild_index(commands_dir):
+    """
+    Rescan the whole repository, used after bulk changes such as an import.
+    """
+    index = {"version": INDEX_VERSION, "root_mtime": os.stat(commands_dir).st_mtime_ns, "folders": {}}
+    refresh_folders(commands_dir, index, list_folders(commands_dir))
+    write_index(commands_dir, index)
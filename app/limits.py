@@ -0,0 +1,278 @@
+import os
+import sys
+import time
+import signal
+import threading
+import subprocess
+from app.log_util import Log
+
+# Limits for commands run by `mcmd exec`, declared in the command's metadata
+#
+#     {"limits": {"timeout": 600, "cpu": 300, "memory_mb": 2048, "nice": 10, "kill_grace": 5}}
+#
+# or given on the command line. The command runs in its own process group,
+# which gets the terminal while it runs, like a job started by a shell (in a
+# pipeline it stays in the shell's job, see ProcessGroup.plan_terminal). On a
+# timeout, or when mcmd itself is interrupted or terminated, the whole group
+# gets SIGTERM (SIGINT for Ctrl-C) and, after the grace period, SIGKILL, so no
+# grandchildren are left behind.
+#
+# This module is loaded on the `mcmd exec` fast path, keep its imports light.
+
+log = Log()
+
+LIMIT_TYPES = {"timeout": float, "cpu": int, "memory_mb": int, "nice": int, "kill_grace": float}
+DEFAULT_KILL_GRACE = 5.0
+TIMEOUT_STATUS = 124
+
+def get_limits(metadata, overrides=None):
+    """
+    Merge the limits of a command's metadata with the ones given on the
+    command line, which win.
+
+    Returns:
+        dict: The limits that are set.
+
+    Raises:
+        ValueError: If a limit is unknown or not a positive number.
+    """
+    limits = dict(metadata.get("limits") or {})
+    limits.update({key: value for key, value in (overrides or {}).items() if value is not None})
+    for key, value in limits.items():
+        if key not in LIMIT_TYPES:
+            raise ValueError(f"Unknown limit '{key}', expected one of: {', '.join(LIMIT_TYPES)}.")
+        try:
+            limits[key] = LIMIT_TYPES[key](value)
+        except (TypeError, ValueError):
+            raise ValueError(f"Limit '{key}' expects a number, got '{value}'.")
+        if key != "nice" and limits[key] <= 0:
+            raise ValueError(f"Limit '{key}' must be greater than 0.")
+    return limits
+
+def apply_limits(limits):
+    """
+    Set the rlimits and niceness of the current process.
+    """
+    import resource
+
+    if limits.get("cpu"):
+        # SIGXCPU at the limit, SIGKILL a second later if it is ignored
+        resource.setrlimit(resource.RLIMIT_CPU, (limits["cpu"], limits["cpu"] + 1))
+    if limits.get("memory_mb"):
+        memory = limits["memory_mb"] * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+    if limits.get("nice"):
+        os.nice(limits["nice"])
+
+# Limits that are set in the child between fork and exec
+CHILD_LIMITS = ("cpu", "memory_mb", "nice")
+
+def get_spawn_args(limits, own_group):
+    """
+    Return the Popen arguments that put the child in its own process group and
+    apply its limits.
+
+    A preexec_fn is unsafe while other threads run (the workers of `mcmd run`,
+    the capture threads) and rules out the posix_spawn/vfork fast path, so it
+    is only used when a limit has to be set in the child.
+    """
+    spawn_args = {}
+    if own_group and sys.version_info >= (3, 11):
+        spawn_args["process_group"] = 0
+        own_group = False
+    if own_group or any(limits.get(key) for key in CHILD_LIMITS):
+        import resource  # noqa: F401, imported here so the child does not import after fork
+
+        def preexec():
+            if own_group:
+                os.setpgid(0, 0)
+            apply_limits(limits)
+        spawn_args["preexec_fn"] = preexec
+    return spawn_args
+
+def set_foreground(fd, pgid):
+    # tcsetpgrp from a background group raises SIGTTOU, which would stop mcmd
+    previous = signal.signal(signal.SIGTTOU, signal.SIG_IGN)
+    try:
+        os.tcsetpgrp(fd, pgid)
+    finally:
+        signal.signal(signal.SIGTTOU, previous)
+
+def group_exists(pgid):
+    try:
+        os.killpg(pgid, 0)
+        return True
+    except (ProcessLookupError, PermissionError):
+        return False
+
+class ProcessGroup:
+    """
+    A child started in its own process group with limits, torn down as a whole.
+
+    When mcmd shares the terminal's foreground job with other processes (a
+    pipeline, or the workers of `mcmd run`), the child stays in that job instead.
+    """
+    def __init__(self, command, limits=None, **popen_args):
+        self.limits = limits or {}
+        self.reason = None
+        self.timers = []
+        self.main_thread = threading.current_thread() is threading.main_thread()
+        terminal, self.own_group = self.plan_terminal()
+        self.process = subprocess.Popen(command, **get_spawn_args(self.limits, self.own_group), **popen_args)
+        self.pgid = self.process.pid if self.own_group else None
+        self.terminal = None
+        if self.own_group:
+            try:
+                # Also from the parent, so the group exists before we signal or hand it the terminal
+                os.setpgid(self.pgid, self.pgid)
+            except OSError:
+                pass
+            if terminal is not None:
+                self.terminal = self.take_terminal(terminal)
+        self.previous_sigterm = None
+        if self.main_thread:
+            self.previous_sigterm = signal.signal(signal.SIGTERM, lambda signum, frame: self.stop("terminated", signal.SIGTERM))
+        if self.limits.get("timeout"):
+            self.schedule(self.limits["timeout"], lambda: self.stop("timeout", signal.SIGTERM))
+
+    def plan_terminal(self):
+        """
+        Decide how the child relates to the terminal mcmd runs on.
+
+        Returns:
+            tuple: (terminal fd to hand to the child's group or None, whether
+            the child gets its own process group).
+        """
+        try:
+            fd = sys.stdin.fileno()
+            if not os.isatty(fd) or os.tcgetpgrp(fd) != os.getpgrp():
+                # No terminal, or mcmd runs in the background: nothing reads it through us
+                return None, True
+            out_fd = sys.stdout.fileno()
+            if self.main_thread and os.isatty(out_fd) and os.path.samestat(os.fstat(fd), os.fstat(out_fd)):
+                # mcmd runs alone in the foreground: hand the terminal over, like a shell
+                return fd, True
+        except (OSError, ValueError, AttributeError):
+            return None, True
+        # In a pipeline like `mcmd exec x | less` the other members keep the
+        # terminal, and the workers of `mcmd run` cannot all own it. The child
+        # stays in the shell's job, so it can still read the terminal and gets
+        # Ctrl-C, and only the child itself is signalled on a timeout.
+        return None, False
+
+    def take_terminal(self, fd):
+        try:
+            set_foreground(fd, self.pgid)
+            return fd
+        except OSError:
+            return None
+
+    def schedule(self, delay, action):
+        timer = threading.Timer(delay, action)
+        timer.daemon = True
+        timer.start()
+        self.timers.append(timer)
+
+    def signal_group(self, signum):
+        try:
+            if self.own_group:
+                os.killpg(self.pgid, signum)
+            else:
+                os.kill(self.process.pid, signum)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    def stop(self, reason, signum):
+        """
+        Ask the whole group to exit, and kill it after the grace period.
+        """
+        if self.reason is None:
+            self.reason = reason
+        self.signal_group(signum)
+        self.schedule(self.limits.get("kill_grace", DEFAULT_KILL_GRACE), lambda: self.signal_group(signal.SIGKILL))
+
+    def wait(self):
+        """
+        Wait for the child and report a limit it hit. Ctrl-C while waiting is
+        forwarded to the group.
+
+        Returns:
+            tuple: (return code, resource usage from os.wait4), the return code
+            being TIMEOUT_STATUS if the command timed out.
+        """
+        from app.runner import wait_process
+
+        try:
+            # A child in mcmd's own process group got the Ctrl-C from the terminal already
+            on_interrupt = (lambda: self.stop("interrupt", signal.SIGINT)) if self.own_group else None
+            _, usage = wait_process(self.process, on_interrupt=on_interrupt)
+        finally:
+            self.release()
+        return self.finish(usage)
+
+    def poll(self):
+        """
+        Like wait, but return None at once if the child is still running.
+        """
+        from app.runner import returncode_from_status
+
+        pid, status, usage = os.wait4(self.process.pid, os.WNOHANG)
+        if pid == 0:
+            return None
+        self.process.returncode = returncode_from_status(status)
+        self.release()
+        return self.finish(usage)
+
+    def release(self):
+        # The child is gone: cancel pending signals and take the terminal back
+        for timer in self.timers:
+            timer.cancel()
+        if self.terminal is not None:
+            try:
+                set_foreground(self.terminal, os.getpgrp())
+            except OSError:
+                # The terminal went away (hangup) while the command ran
+                pass
+        if self.main_thread:
+            signal.signal(signal.SIGTERM, self.previous_sigterm)
+
+    def finish(self, usage):
+        returncode = self.process.returncode
+        if self.reason is None and returncode in (-signal.SIGINT, 128 + signal.SIGINT):
+            self.reason = "interrupt"
+        if self.reason is None and returncode == -signal.SIGXCPU:
+            self.reason = "cpu"
+        if self.reason in ("timeout", "interrupt", "terminated", "restart"):
+            self.reap_group()
+        message = self.describe()
+        if message:
+            log.warn(f"Command {message}.")
+        if self.reason == "timeout":
+            returncode = self.process.returncode = TIMEOUT_STATUS
+        return returncode, usage
+
+    def reap_group(self):
+        # Grandchildren may outlive the child, give them the grace period too
+        if not self.own_group or not group_exists(self.pgid):
+            return
+        self.signal_group(signal.SIGTERM)
+        deadline = time.monotonic() + self.limits.get("kill_grace", DEFAULT_KILL_GRACE)
+        while time.monotonic() < deadline and group_exists(self.pgid):
+            time.sleep(0.05)
+        self.signal_group(signal.SIGKILL)
+
+    def describe(self):
+        """
+        Return a message about the limit the command hit, or None.
+        """
+        if self.reason == "restart":
+            return None
+        if self.reason == "timeout":
+            return f"timed out after {self.limits['timeout']:g}s, its process group was stopped"
+        if self.reason == "cpu":
+            return f"exceeded its CPU time limit of {self.limits['cpu']}s"
+        if self.reason == "terminated":
+            return "was stopped because mcmd was terminated"
+        if self.process.returncode != 0 and self.limits.get("memory_mb"):
+            return f"failed with a memory limit of {self.limits['memory_mb']} MB, it may have run out of memory"
+        return None
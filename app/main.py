@@ -0,0 +1,74 @@
+import os
+import sys
+import time
+
+START = time.perf_counter()
+
+from app import profiling
+
+# Console entry point. Plain `mcmd exec <name> [args...]` invocations are
+# served by app.runner directly so that resolving and launching a command does
+# not pay for typer, rich, tkinter and pkg_resources. Everything else (help,
+# options, management commands) goes through the full typer app in app.cli.
+
+def is_fast_exec(argv):
+    """
+    Check whether the arguments are a plain exec the fast path can serve.
+
+    Args:
+        argv (list): Command line arguments without the program name.
+
+    Returns:
+        bool: True for `exec <name> [args...]` without options or a trailing 'help'.
+    """
+    if len(argv) < 2 or argv[0] != 'exec':
+        return False
+    command_name, args = argv[1], argv[2:]
+    if not command_name.isidentifier():
+        return False
+    if args and args[-1] == 'help':
+        return False
+    return not any(arg.startswith('-') for arg in args)
+
+def strip_profile_flag(argv):
+    """
+    Remove a leading `--profile` or `--profile=FILE.json` flag.
+
+    Returns:
+        tuple: (remaining arguments, True or the output file if the flag was given, else None)
+    """
+    if argv and argv[0] == '--profile':
+        return argv[1:], True
+    if argv and argv[0].startswith('--profile='):
+        return argv[1:], argv[0][len('--profile='):]
+    return argv, None
+
+def main():
+    argv, profile_flag = strip_profile_flag(sys.argv[1:])
+    if profile_flag:
+        output = profile_flag if isinstance(profile_flag, str) else None
+        profiling.enable(START, output=output, cprofile_output=os.environ.get(profiling.CPROFILE_ENV))
+        # typer parses sys.argv itself
+        sys.argv[1:] = argv
+    else:
+        profiling.enable_from_env(START)
+
+    if not profiling.profile.enabled:
+        from app.daemon_client import render_from_daemon
+
+        output = render_from_daemon(argv)
+        if output is not None:
+            sys.stdout.write(output)
+            return
+
+    if is_fast_exec(argv):
+        with profiling.phase("imports"):
+            from app.runner import run_command
+        sys.exit(run_command(argv[1], argv[2:]))
+
+    with profiling.phase("imports"):
+        from app.cli import app
+    app()
+
+if __name__ == "__main__":
+    main()
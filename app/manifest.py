@@ -0,0 +1,102 @@
+import os
+import json
+
+# Manifest for `mcmd create --from`, which creates or updates many commands in
+# one pass without prompts. A manifest is a JSON (or, with PyYAML installed,
+# YAML) list of entries, or an object with such a list under "commands":
+#
+#     {"commands": [
+#         {"name": "hello", "description": "Say hi", "script": "echo hi"},
+#         {"name": "deploy", "description": "Deploy the app", "source": "scripts/deploy.sh"}
+#     ]}
+#
+# Each entry gives the script either inline ("script") or as a file ("source",
+# relative to the manifest). An optional "meta" object is saved as the
+# command's .meta file.
+
+ENTRY_KEYS = {"name", "description", "script", "source", "meta"}
+
+def parse_manifest(manifest_path):
+    with open(manifest_path, 'r') as file:
+        content = file.read()
+    if manifest_path.endswith(('.yaml', '.yml')):
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError("YAML manifests need PyYAML, install it with 'pip install pyyaml' or use JSON.")
+        try:
+            return yaml.safe_load(content)
+        except yaml.YAMLError as e:
+            raise ValueError(f"Error decoding YAML in '{manifest_path}': {e}")
+    try:
+        return json.loads(content)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Error decoding JSON in '{manifest_path}': {e}")
+
+def load_manifest(manifest_path):
+    """
+    Read a manifest and check the shape of its entries.
+
+    Returns:
+        list: Entries as dicts with name, description (or None), script and meta (or None),
+        with "source" files already read into "script".
+
+    Raises:
+        ValueError: If the manifest cannot be read, listing every problem found.
+    """
+    manifest = parse_manifest(manifest_path)
+    if isinstance(manifest, dict):
+        manifest = manifest.get("commands")
+    if not isinstance(manifest, list):
+        raise ValueError(f"'{manifest_path}' must contain a list of commands.")
+
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    entries, errors, seen = [], [], set()
+    for position, entry in enumerate(manifest, start=1):
+        if not isinstance(entry, dict) or not isinstance(entry.get("name"), str):
+            errors.append(f"Entry {position} must be an object with a 'name'.")
+            continue
+        name = entry["name"]
+        label = f"Entry {position} ('{name}')"
+        unknown = set(entry) - ENTRY_KEYS
+        if unknown:
+            errors.append(f"{label} has unknown keys: {', '.join(sorted(unknown))}.")
+        if name in seen:
+            errors.append(f"{label} repeats a command name.")
+        seen.add(name)
+
+        description = entry.get("description")
+        if description is not None and not isinstance(description, str):
+            errors.append(f"{label} must have a text 'description'.")
+        meta = entry.get("meta")
+        if meta is not None and not isinstance(meta, dict):
+            errors.append(f"{label} must have an object as 'meta'.")
+
+        if ("script" in entry) == ("source" in entry):
+            errors.append(f"{label} must have exactly one of 'script' or 'source'.")
+            continue
+        if "script" in entry:
+            script = entry["script"]
+            if not isinstance(script, str):
+                errors.append(f"{label} must have a text 'script'.")
+                continue
+        else:
+            source = os.path.join(base_dir, os.path.expanduser(str(entry["source"])))
+            try:
+                with open(source, 'r') as file:
+                    script = file.read()
+            except OSError as e:
+                errors.append(f"{label} cannot read its source: {e}")
+                continue
+        entries.append({"name": name, "description": description, "script": script, "meta": meta})
+
+    if errors:
+        raise ValueError("\n".join(errors))
+    return entries
+
+def with_shebang(script):
+    if not script.startswith('#!'):
+        script = '#!/bin/bash\n' + script
+    if not script.endswith('\n'):
+        script += '\n'
+    return script
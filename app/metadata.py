@@ -0,0 +1,53 @@
+import os
+import json
+from app.roots import resolve_command
+
+# Optional per-command metadata, kept as JSON in `<name>.meta` next to the
+# command's `.sh` and `.desc` files. For example:
+#
+#     {"depends_on": ["cleanup", "build"]}
+#
+# Commands without a .meta file simply have no metadata. With the sqlite
+# storage backend the metadata is kept in the database instead.
+
+def get_metadata_file(commands_dir, command_name):
+    return os.path.join(commands_dir, command_name, f"{command_name}.meta")
+
+def load_metadata(commands_dir, command_name, command_file=None):
+    """
+    Load the metadata of a command.
+
+    Args:
+        commands_dir (str): The command repository.
+        command_name (str): The command.
+        command_file (str): The script the command resolves to, if already known.
+
+    Returns:
+        dict: The metadata, empty if the command has no .meta file.
+
+    Raises:
+        ValueError: If the .meta file is not a valid JSON object.
+    """
+    # Read next to the script the command resolves to, which may be in another
+    # command root or, with the sqlite backend, materialized from the database
+    if command_file is None:
+        command_file = resolve_command(command_name, commands_dir)
+    if command_file is None:
+        return {}
+    metadata_file = os.path.join(os.path.dirname(command_file), f"{command_name}.meta")
+    try:
+        with open(metadata_file, 'r') as file:
+            metadata = json.load(file)
+    except FileNotFoundError:
+        return {}
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Error decoding JSON in '{metadata_file}': {e}")
+    if not isinstance(metadata, dict):
+        raise ValueError(f"'{metadata_file}' must contain a JSON object.")
+    return metadata
+
+def get_dependencies(commands_dir, command_name):
+    depends_on = load_metadata(commands_dir, command_name).get("depends_on", [])
+    if not isinstance(depends_on, list) or not all(isinstance(dep, str) for dep in depends_on):
+        raise ValueError(f"'depends_on' of '{command_name}' must be a list of command names.")
+    return depends_on
@@ -1,25 +1,43 @@
 import os
+import sys
 import typer
 from rich.console import Console
 from app.log_util import Log
 from app.operations import *
+import time
+import json
+import itertools
+import tempfile
 import subprocess
 import shutil
-import pkg_resources
 from rich.table import Table
-import tkinter as tk
-from tkinter import filedialog
 from app.settings import get_settings
+from app.runner import run_command
+from app.watch import watch_and_run
+from app.roots import resolve_command, get_root_commands, is_valid_command_name
+from app.output_capture import get_log_file, read_log_tail
+from app.index import update_index, rebuild_index, get_state_dir, get_current_stamp
+from app.completion import get_shell_script, is_runnable, SHELL_SCRIPTS
+from app.sync import sync_commands, get_last_import, record_import, apply_changes
+from app.copy_engine import copy_files, list_tree_files, format_throughput
+from app.bundle import write_bundle, list_bundle, extract_bundle
+from app.scheduler import build_graph, run_graph
+from app.result_cache import get_cache_stats, clear_cache
+from app.telemetry import iter_records, summarize
+from app.search import search, get_search_stamp
+from app.manifest import load_manifest, with_shebang
+from app.storage import get_storage, FileStorage, SqliteStorage, migrate, DATABASE_NAME, STORAGE_BACKENDS
+from app.settings_store import set_setting
+from app.flatten import flatten_command
+from app.repository import atomic_write, write_lock, read_lock
+from app.profiling import phase
+from app.daemon_client import request as daemon_request, get_socket_path
 
 MCMD_COMMANDS_DIR = os.path.expanduser(get_settings("MCMD_COMMANDS_DIR"))
 
 log = Log()
 console = Console()
 
-def is_valid_command_name(command_name):
-    # Simple validation: only allows alphanumeric characters and underscores
-    return command_name.isidentifier()
-
 def get_input(message):
     """
     Display a message in blue and read the user's input.
@@ -40,13 +58,11 @@ def get_input(message):
 def add_shebang_if_missing(file_path):
     # Check if the file has a .sh extension and add a shebang if missing
     if file_path.endswith('.sh'):
-        with open(file_path, 'r+') as file:
-            lines = file.readlines()
-            if not lines or not lines[0].startswith('#!'):
-                file.seek(0, 0)
-                file.write('#!/bin/bash\n' + ''.join(lines))
-                file.flush()
-                log.info(f"Added shebang to '{file_path}'.")
+        with open(file_path, 'r') as file:
+            content = file.read()
+        if not content.startswith('#!'):
+            atomic_write(file_path, '#!/bin/bash\n' + content)
+            log.info(f"Added shebang to '{file_path}'.")
 
 def create_or_update_command():
     command_name = get_input("Enter the command name: mcmd exec ")
@@ -56,8 +72,16 @@ def create_or_update_command():
         log.error("Invalid command name. Command names should only contain alphanumeric characters and underscores.")
         return
 
+    # Commands are edited in a scratch folder and stored at the end in one step,
+    # so other mcmd processes never see a half-edited script
+    storage = get_storage(MCMD_COMMANDS_DIR)
+    scratch_dir = tempfile.mkdtemp(prefix="mcmd-")
+    existing = storage.read(command_name)
+    if existing:
+        FileStorage(scratch_dir).write(command_name, existing["script"], existing["description"])
+    command_dir = os.path.join(scratch_dir, command_name)
+
     # Define paths for command logic and description files
-    command_dir = os.path.join(MCMD_COMMANDS_DIR, command_name)
     command_file = os.path.join(command_dir, f"{command_name}.sh")
     description_file = os.path.join(command_dir, f"{command_name}.desc")
     
@@ -73,12 +97,12 @@ def create_or_update_command():
                 command_description = get_input(f"Update a description for 'mcmd exec {command_name}'. (Presss enter to ignore..)").strip()
                 # Only write description if it's not empty
                 if command_description.strip():
-                    with open(description_file, 'w') as file:
-                        file.write(command_description + "\n")
+                    atomic_write(description_file, command_description + "\n")
                 accept_command_details("update", command_file, command_name)
                 break
             elif response == 'n':
                 log.info("Command update canceled.")
+                shutil.rmtree(scratch_dir, ignore_errors=True)
                 return
             else:
                 log.error("Invalid input. Please enter 'y' or 'n'.")
@@ -90,8 +114,7 @@ def create_or_update_command():
             command_description = get_input(f"Enter a description for 'mcmd exec {command_name}': ").strip()
             if command_description:
                 try:
-                    with open(description_file, 'w') as file:
-                        file.write(command_description + "\n")
+                    atomic_write(description_file, command_description + "\n")
                     break
                 except Exception as e:
                     log.error(f"Error saving command description: {e}")
@@ -100,12 +123,75 @@ def create_or_update_command():
         
         accept_command_details("create", command_file, command_name)
 
+    with write_lock(MCMD_COMMANDS_DIR):
+        if store_edited_command(storage, command_dir, command_name):
+            flatten_saved_command(os.path.join(MCMD_COMMANDS_DIR, command_name, f"{command_name}.sh"), command_name)
+        storage.refresh_index([command_name])
+    auto_export()
+
+def store_edited_command(storage, command_dir, command_name):
+    """
+    Save a command edited in a scratch folder to the storage and drop the folder.
+
+    Returns:
+        bool: True if the command was saved.
+    """
+    command = FileStorage(os.path.dirname(command_dir)).read(command_name)
     try:
-        # Make the command file executable
-        os.chmod(command_file, 0o755)
+        if command:
+            storage.write(command_name, command["script"], command["description"])
+            return True
+        log.error(f"No script saved for 'mcmd {command_name}'.")
     except Exception as e:
-        log.error(f"Error while changing the permission: {e}")
-    auto_export()
+        log.error(f"Error saving command 'mcmd {command_name}': {e}")
+    finally:
+        shutil.rmtree(os.path.dirname(command_dir), ignore_errors=True)
+    return False
+
+def create_from_manifest(manifest_path):
+    """
+    Create or update every command of a manifest without prompting. Nothing
+    is written unless the whole manifest is valid, and the index and auto
+    export are refreshed once at the end.
+    """
+    try:
+        entries = load_manifest(os.path.expanduser(manifest_path))
+    except (OSError, ValueError) as e:
+        log.error(f"Invalid manifest: {e}")
+        return
+
+    storage = get_storage(MCMD_COMMANDS_DIR)
+    existing = set(storage.names())
+    errors = []
+    for entry in entries:
+        if not is_valid_command_name(entry["name"]):
+            errors.append(f"Invalid command name '{entry['name']}'. Command names should only contain alphanumeric characters and underscores.")
+        elif not (entry["description"] or "").strip() and entry["name"] not in existing:
+            errors.append(f"New command '{entry['name']}' needs a description.")
+    if errors:
+        for error in errors:
+            log.error(error)
+        log.error("No commands created.")
+        return
+
+    commands = [{"name": entry["name"], "script": with_shebang(entry["script"]),
+                 "description": (entry["description"] or "").strip() or None, "meta": entry["meta"]}
+                for entry in entries]
+    with write_lock(MCMD_COMMANDS_DIR):
+        try:
+            changed = storage.write_many(commands)
+        except (OSError, ValueError) as e:
+            log.error(f"Error writing commands: {e}")
+            return
+
+        created = [name for name in changed if name not in existing]
+        for command_name in changed:
+            flatten_saved_command(os.path.join(MCMD_COMMANDS_DIR, command_name, f"{command_name}.sh"), command_name)
+        if changed:
+            storage.refresh_index(changed)
+    log.info(f"Created {len(created)}, updated {len(changed) - len(created)}, unchanged {len(commands) - len(changed)} commands.")
+    if changed:
+        auto_export()
 
 def auto_export():
     try:
@@ -116,7 +202,22 @@ def auto_export():
     except Exception as e:
         log.error(f"Error while performing auto export : {e}")
 
+def flatten_saved_command(command_file, command_name):
+    """
+    Refresh the flat file of a command after its script was saved.
+    """
+    if not get_settings("ENABLE_FLATTEN") or get_settings("STORAGE_BACKEND") != "files":
+        return
+    try:
+        if flatten_command(MCMD_COMMANDS_DIR, command_file):
+            log.info(f"Inlined the helpers sourced by 'mcmd {command_name}'.")
+    except (OSError, UnicodeDecodeError) as e:
+        log.warn(f"Could not inline the helpers of 'mcmd {command_name}': {e}")
+
 def accept_command_details(operation, command_file, command_name):
+    import tkinter as tk
+    from tkinter import filedialog
+
     root = tk.Tk()
     root.withdraw()  # Hide the main window
 
@@ -155,42 +256,25 @@ def remove_command():
         log.error("No commands found.")
         return
 
-    list_commands()
-
-    command_items = []
-    for root, dirs, files in os.walk(MCMD_COMMANDS_DIR):
-        for file in files:
-            if file.endswith('.sh'):
-                command_name = file[:-3]
-                command_path = os.path.join(root, file)
-                # Get the relative path to use for listing commands
-                relative_path = os.path.relpath(command_path, MCMD_COMMANDS_DIR)
-                command_items.append((command_name, relative_path))
-
+    storage = get_storage(MCMD_COMMANDS_DIR)
+    with phase("index"):
+        command_items = storage.get_commands()
     if not command_items:
         log.error("No commands found.")
         return
 
+    print_commands(command_items)
+
     try:
         choice = int(get_input("Enter the number of the command to remove: "))
         if 1 <= choice <= len(command_items):
-            command_name, command_path = command_items[choice - 1]
-            command_dir = os.path.dirname(os.path.join(MCMD_COMMANDS_DIR, command_path))
-            
-            # Remove .sh and .desc files
-            os.remove(os.path.join(MCMD_COMMANDS_DIR, command_path))
-            desc_path = os.path.join(command_dir, f"{command_name}.desc")
-            if os.path.exists(desc_path):
-                os.remove(desc_path)
-            
-            # Remove empty directories
-            while command_dir != MCMD_COMMANDS_DIR:
-                if not os.listdir(command_dir):
-                    os.rmdir(command_dir)
-                    command_dir = os.path.dirname(command_dir)
-                else:
-                    break
+            item = command_items[choice - 1]
+            command_name, command_path = item["name"], item["path"]
 
+            # Removes the script, its description and metadata, and folders left empty
+            with write_lock(MCMD_COMMANDS_DIR):
+                storage.delete(command_name, command_path)
+                storage.refresh_index([command_path.split(os.sep)[0]])
             log.info(f"Command 'mcmd {command_name}' removed successfully.")
         else:
             log.error("Invalid choice. No command removed.")
@@ -199,73 +283,318 @@ def remove_command():
     except Exception as e:
         log.error(f"Error removing command: {e}")
         
-def list_commands():
+LIST_SORT_KEYS = {
+    "name": lambda item: (item["name"], item["path"]),
+    "path": lambda item: item["path"],
+    "mtime": lambda item: (-item["mtime"], item["name"]),
+}
+LIST_FORMATS = ["table", "plain", "json"]
+
+def list_commands(limit=None, offset=0, sort="name", output="table"):
     if not os.path.exists(MCMD_COMMANDS_DIR):
         log.error("Commands directory does not exist.")
         return
+    if sort != "none" and sort not in LIST_SORT_KEYS:
+        log.error(f"Unknown sort order '{sort}', expected one of: none, {', '.join(LIST_SORT_KEYS)}.")
+        return
+    if output not in LIST_FORMATS:
+        log.error(f"Unknown format '{output}', expected one of: {', '.join(LIST_FORMATS)}.")
+        return
 
-    command_items = []
-    for root, dirs, files in os.walk(MCMD_COMMANDS_DIR):
-        for file in files:
-            if file.endswith('.sh'):
-                command_name = file[:-3]
-                command_path = os.path.join(root, file)
-                # Get the relative path to use for listing commands
-                relative_path = os.path.relpath(command_path, MCMD_COMMANDS_DIR)
-                command_items.append((command_name, relative_path))
+    with phase("index"):
+        command_items = iter_all_commands(get_storage(MCMD_COMMANDS_DIR))
+        if sort != "none":
+            # Repository order needs no full pass, so with "none" rows go out as folders are read
+            command_items = sorted(command_items, key=LIST_SORT_KEYS[sort])
+        stop = None if limit is None else offset + limit
+        command_items = itertools.islice(command_items, offset, stop)
+
+        if output == "table":
+            command_items = list(command_items)
+            if not command_items:
+                log.error("No commands found.")
+                return
+            print_commands(command_items, start=offset + 1)
+        else:
+            stream_commands(command_items, output)
 
-    if not command_items:
-        log.error("No commands found.")
-        return
-    
+def iter_all_commands(storage):
+    """
+    Yield the runnable commands of the repository, then those of the extra
+    command roots that are not shadowed by an earlier one. Helper scripts that
+    `mcmd exec` cannot run are left out, like in the completion file.
+    """
+    names = set()
+    for item in storage.iter_commands():
+        if not is_runnable(item):
+            continue
+        names.add(item["name"])
+        yield item
+    yield from get_root_commands(MCMD_COMMANDS_DIR, names)
+
+def stream_commands(command_items, output):
+    """
+    Write one line per command as soon as it is known, for scripts and pipes.
+
+    Args:
+        command_items (iterable): Commands as returned by the index.
+        output (str): 'plain' for tab separated name, path and description,
+            'json' for one JSON object per line.
+    """
+    try:
+        for item in command_items:
+            if output == "json":
+                line = json.dumps({"name": item["name"], "path": item["path"], "description": item["description"]})
+            else:
+                description = " ".join((item["description"] or "").split())
+                line = f"{item['name']}\t{item['path']}\t{description}"
+            sys.stdout.write(line + "\n")
+            sys.stdout.flush()
+    except BrokenPipeError:
+        # The reader went away, e.g. `mcmd list --format plain | head`; point
+        # stdout at /dev/null so the interpreter does not fail flushing it on exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+
+def print_commands(command_items, start=1):
     log.warn("CUSTOM COMMANDS:")
     table = Table(show_header=True, header_style="bold blue")
     table.add_column("No.", style="dim")
     table.add_column("Command", style="dim")
     table.add_column("Description")
 
-    for index, (cmd_name, rel_path) in enumerate(command_items, start=1):
-        command_dir = os.path.dirname(os.path.join(MCMD_COMMANDS_DIR, rel_path))
-        desc_file = os.path.join(command_dir, f"{cmd_name}.desc")
-        description = ""
-        
-        if os.path.exists(desc_file):
-            with open(desc_file, 'r') as file:
-                description = file.read().strip()
-            
-            if len(description) > 200:
-                description = description[:200] + "..."
-        else: continue
-        
-        table.add_row(str(index), f"mcmd exec {cmd_name}", description)
+    for index, item in enumerate(command_items, start=start):
+        description = item["description"]
+        if description is None:
+            description = "[dim](no description)[/dim]"
+
+        table.add_row(str(index), f"mcmd exec {item['name']}", description)
         table.add_row("")  
     console.print(table)
 
-def execute_command(command_name: str, args):
-    if args is None:
-        args = []
+def execute_command(command_name: str, args, replace=None, use_cache=True, capture=None, limits=None):
+    return run_command(command_name, args, replace=replace, use_cache=use_cache, capture=capture, limits=limits)
+
+def watch_command(command_name: str, args, paths, debounce=0.2, queue=False, limits=None):
+    return watch_and_run(command_name, args or [], paths, debounce=debounce, queue=queue, limits=limits)
+
+def show_command_log(command_name, lines=20):
+    log_file = get_log_file(MCMD_COMMANDS_DIR, command_name)
+    if not os.path.exists(log_file):
+        log.error(f"No captured output for 'mcmd {command_name}'. Capture it with 'mcmd exec --capture {command_name}'.")
+        return
+    for line in read_log_tail(log_file, lines):
+        print(line)
+
+def run_commands(command_names, jobs=None):
+    """
+    Run several custom commands, with their declared dependencies, and report
+    the wall time of each.
+
+    Returns:
+        int: 0 if every command succeeded, else 1.
+    """
+    if jobs is None:
+        jobs = os.cpu_count() or 1
 
-    command_file = os.path.join(MCMD_COMMANDS_DIR, command_name, f"{command_name}.sh")
-    
     try:
-        if os.path.exists(command_file):
-            subprocess.run([command_file] + args, check=True)
-        else:
-            log.error(f"Command 'mcmd {command_name}' not found.")
-    except subprocess.CalledProcessError as e:
-        log.error(f"Error executing command '{command_name}': {e}")
-    except Exception as e:
-        log.error(f"An unexpected error occurred: {e}")
+        graph = build_graph(MCMD_COMMANDS_DIR, command_names)
+    except ValueError as e:
+        log.error(str(e))
+        return 1
+
+    start = time.perf_counter()
+    results = run_graph(MCMD_COMMANDS_DIR, graph, max(jobs, 1))
+    elapsed = time.perf_counter() - start
+
+    table = Table(show_header=True, header_style="bold blue")
+    table.add_column("Command", style="dim")
+    table.add_column("Status")
+    table.add_column("Exit code")
+    table.add_column("Wall time")
+    status_styles = {"ok": "green", "failed": "red", "not found": "red", "skipped": "yellow"}
+    for result in results:
+        table.add_row(
+            f"mcmd exec {result['name']}",
+            f"[{status_styles[result['status']]}]{result['status']}[/]",
+            "" if result["returncode"] is None else str(result["returncode"]),
+            "" if result["seconds"] is None else f"{result['seconds']:.2f}s",
+        )
+    console.print(table)
+
+    failed = [result for result in results if result["status"] != "ok"]
+    if failed:
+        log.error(f"{len(failed)} of {len(results)} commands did not succeed ({elapsed:.2f}s).")
+        return 1
+    log.info(f"All {len(results)} commands succeeded ({elapsed:.2f}s).")
+    return 0
+
+def show_stats(command_name=None):
+    records = iter_records(MCMD_COMMANDS_DIR)
+    if command_name:
+        records = (record for record in records if record["command"] == command_name)
+    summary = summarize(records)
+    if not summary:
+        log.warn("No runs recorded yet.")
+        return
+
+    def seconds(value):
+        return "-" if value is None else f"{value:.3f}s"
+
+    def megabytes(value):
+        # Below mcmd's own footprint, the child's peak cannot be measured
+        if value is None:
+            return "-"
+        return f"{value / 1024:.1f} MB" if sys.platform != "darwin" else f"{value / 1024 / 1024:.1f} MB"
+
+    table = Table(show_header=True, header_style="bold blue")
+    for column in ("Command", "Calls", "Failure rate", "p50", "p95", "p99", "Mean CPU", "Peak RSS"):
+        table.add_column(column)
+    for item in summary:
+        table.add_row(
+            item["command"],
+            str(item["calls"]),
+            f"{item['failure_rate']:.1%}",
+            seconds(item["p50"]),
+            seconds(item["p95"]),
+            seconds(item["p99"]),
+            seconds(item["cpu"]),
+            megabytes(item["peak_rss"]),
+        )
+    console.print(table)
+
+def show_completion_script(shell):
+    if shell not in SHELL_SCRIPTS:
+        log.error(f"Unsupported shell '{shell}'. Use one of: {', '.join(SHELL_SCRIPTS)}.")
+        return
+    # Make sure the command list exists before the shell starts reading it
+    get_storage(MCMD_COMMANDS_DIR).refresh_index()
+    print(get_shell_script(shell, get_state_dir(MCMD_COMMANDS_DIR)), end="")
+
+def start_daemon(idle_timeout=None, foreground=False):
+    from app.daemon import serve, start_background
+
+    if foreground:
+        return serve(idle_timeout)
+    if daemon_request({"op": "ping"}):
+        log.warn("The mcmd daemon is already running.")
+        return 0
+    response = start_background(idle_timeout)
+    if not response:
+        log.error("The mcmd daemon did not start, see daemon.log in the .mcmd folder of the command repository.")
+        return 1
+    log.info(f"mcmd daemon started (pid {response['pid']}) on {get_socket_path()}")
+    return 0
+
+def stop_daemon():
+    if daemon_request({"op": "stop"}):
+        log.info("mcmd daemon stopped.")
+    else:
+        log.warn("The mcmd daemon is not running.")
+
+def show_daemon_status():
+    response = daemon_request({"op": "ping"})
+    if response:
+        log.info(f"mcmd daemon running (pid {response['pid']}, up {response['uptime']}s, "
+                 f"{response['commands']} commands from {response['commands_dir']}) on {get_socket_path()}")
+    else:
+        log.warn("The mcmd daemon is not running.")
+
+def search_commands(query, limit=20):
+    if not os.path.exists(MCMD_COMMANDS_DIR):
+        log.error("Command repository does not exist.")
+        return
+    state_dir = get_state_dir(MCMD_COMMANDS_DIR)
+    with phase("index"):
+        # Commands added or removed outside mcmd change the repository root's
+        # mtime or the root table. Only then is the index refreshed, which
+        # stats every folder; edits inside a folder are picked up by the next
+        # `mcmd list`.
+        if get_search_stamp(state_dir) != get_current_stamp(MCMD_COMMANDS_DIR):
+            get_storage(MCMD_COMMANDS_DIR).refresh_index()
+    results = search(state_dir, query, limit)
+    if not results:
+        log.info(f"No commands match '{query}'.")
+        return
+
+    table = Table(show_header=True, header_style="bold blue")
+    table.add_column("Command")
+    table.add_column("Description")
+    table.add_column("Score", justify="right")
+    for result in results:
+        table.add_row(result["name"], result["excerpt"], f"{result['score']:.2f}")
+    console.print(table)
+
+def migrate_storage(backend):
+    if backend not in STORAGE_BACKENDS:
+        log.error(f"Unknown storage backend '{backend}', expected one of: {', '.join(STORAGE_BACKENDS)}.")
+        return
+    if not os.path.exists(MCMD_COMMANDS_DIR):
+        log.error("Commands directory does not exist.")
+        return
+
+    with write_lock(MCMD_COMMANDS_DIR):
+        try:
+            migrated = migrate(MCMD_COMMANDS_DIR, backend)
+            set_setting("STORAGE_BACKEND", backend)
+        except Exception as e:
+            log.error(f"Error during migration: {e}")
+            return
+        rebuild_index(MCMD_COMMANDS_DIR)
+        get_storage(MCMD_COMMANDS_DIR).refresh_index()
+    log.info(f"Moved {len(migrated)} commands to the '{backend}' storage.")
+
+def show_storage_status():
+    storage = get_storage(MCMD_COMMANDS_DIR)
+    table = Table(show_header=True, header_style="bold blue")
+    table.add_column("Backend")
+    table.add_column("Commands")
+    table.add_column("Location")
+    if storage.backend == "sqlite":
+        size = os.path.getsize(storage.database_file) if os.path.exists(storage.database_file) else 0
+        location = f"{storage.database_file} ({size / 1024:.1f} KB)"
+    else:
+        location = MCMD_COMMANDS_DIR
+    table.add_row(storage.backend, str(len(storage.names())), location)
+    console.print(table)
+
+def show_cache_stats():
+    stats = get_cache_stats(MCMD_COMMANDS_DIR)
+    lookups = stats["hits"] + stats["misses"]
+    table = Table(show_header=True, header_style="bold blue")
+    table.add_column("Entries")
+    table.add_column("Size")
+    table.add_column("Hits")
+    table.add_column("Misses")
+    table.add_column("Hit rate")
+    table.add_row(
+        str(stats["entries"]),
+        f"{stats['bytes'] / 1024 / 1024:.2f} / {stats['max_bytes'] / 1024 / 1024:.0f} MB",
+        str(stats["hits"]),
+        str(stats["misses"]),
+        f"{stats['hits'] / lookups:.0%}" if lookups else "-",
+    )
+    console.print(table)
+
+def clear_result_cache():
+    removed = clear_cache(MCMD_COMMANDS_DIR)
+    log.info(f"Removed {removed} cached results.")
+
+def export_commands(prune=None, bundle=None):
+    if bundle:
+        export_bundle(bundle)
+        return
 
-def export_commands():
     export_dir = get_settings("MCMD_EXPORT_DIR")
     if export_dir:
         while True:
             response = get_input("Do you want to export to default location (y/n): ").lower()
             if response == 'y':
-                export(export_dir)
+                export(export_dir, prune=prune)
                 break
             elif response == 'n':
+                import tkinter as tk
+                from tkinter import filedialog
+
                 root = tk.Tk()
                 root.withdraw()
 
@@ -276,13 +605,13 @@ def export_commands():
                     log.error("No destination folder selected. Export canceled.")
                     return
                 
-                export(destination_path)
+                export(destination_path, prune=prune)
                 break
             else:
                 log.error("Invalid input. Please enter 'y' or 'n'.")
                 continue   
 
-def export(destination_path):
+def export(destination_path, prune=None):
     
     destination_path = os.path.join(destination_path, "mcmd")
     if not os.path.exists(destination_path):
@@ -292,28 +621,72 @@ def export(destination_path):
         log.error(f"Source directory '{MCMD_COMMANDS_DIR}' does not exist.")
         return
     
+    if prune is None:
+        prune = get_settings("EXPORT_PRUNE")
+
     try:
-        subfolders = [f for f in os.listdir(MCMD_COMMANDS_DIR) if os.path.isdir(os.path.join(MCMD_COMMANDS_DIR, f))]
-        
-        if subfolders:
-            for cmd in subfolders:
-                src_dir = os.path.join(MCMD_COMMANDS_DIR, cmd)
-                shutil.copytree(src_dir, os.path.join(destination_path, cmd), dirs_exist_ok=True)
-            
-        else:
-            log.warn("No commands found to move.")
+        with read_lock(MCMD_COMMANDS_DIR):
+            export_snapshot(destination_path, prune)
     except Exception as e:
         log.error(f"Error during export: {e}")
 
-def import_commands():
+def export_snapshot(destination_path, prune):
+    """
+    Copy the commands to an export folder while no writer changes them.
+    """
+    # Skip hidden folders such as the .mcmd index folder
+    subfolders = [f for f in os.listdir(MCMD_COMMANDS_DIR) if os.path.isdir(os.path.join(MCMD_COMMANDS_DIR, f)) and not f.startswith('.')]
+
+    if not subfolders:
+        log.warn("No commands found to move.")
+
+    if subfolders or prune:
+        result = sync_commands(MCMD_COMMANDS_DIR, subfolders, destination_path, prune=prune)
+        log.info(f"Exported to '{destination_path}': {len(result['copied'])} copied, "
+                 f"{len(result['skipped'])} unchanged, {len(result['removed'])} removed.")
+        if result["stats"]["files"]:
+            log.info(f"Copied {format_throughput(result['stats'])}")
+        for cmd in result["removed"]:
+            log.warn(f"Removed '{cmd}' from the export.")
+
+    storage = get_storage(MCMD_COMMANDS_DIR)
+    if storage.backend == "sqlite" and os.path.exists(storage.database_file):
+        storage.snapshot(os.path.join(destination_path, DATABASE_NAME))
+        log.info(f"Exported {len(storage.names())} packed commands to '{os.path.join(destination_path, DATABASE_NAME)}'.")
+
+def export_bundle(bundle_path):
+    if not os.path.exists(MCMD_COMMANDS_DIR):
+        log.error(f"Source directory '{MCMD_COMMANDS_DIR}' does not exist.")
+        return
+
+    if get_settings("STORAGE_BACKEND") == "sqlite":
+        log.error("Bundles hold commands in folders, run 'mcmd storage migrate files' first or export to a folder.")
+        return
+
+    try:
+        with read_lock(MCMD_COMMANDS_DIR):
+            subfolders = [f for f in os.listdir(MCMD_COMMANDS_DIR) if os.path.isdir(os.path.join(MCMD_COMMANDS_DIR, f)) and not f.startswith('.')]
+            index = write_bundle(MCMD_COMMANDS_DIR, subfolders, bundle_path)
+        log.info(f"Exported {len(index['commands'])} commands to bundle '{bundle_path}' ({os.path.getsize(bundle_path) / 1024:.1f} KB).")
+    except Exception as e:
+        log.error(f"Error during export: {e}")
+
+def import_commands(full=False, bundle=None, commands=None, list_only=False):
+    if bundle:
+        import_bundle(bundle, commands=commands, list_only=list_only)
+        return
+
     import_dir = get_settings("MCMD_EXPORT_DIR")
     if import_dir:
         while True:
             response = get_input("Do you want to import from default location (y/n): ").lower()
             if response == 'y':
-                imports(import_dir)
+                imports(import_dir, full=full)
                 break
             elif response == 'n':
+                import tkinter as tk
+                from tkinter import filedialog
+
                 root = tk.Tk()
                 root.withdraw()
 
@@ -324,19 +697,20 @@ def import_commands():
                     log.error("No folder selected. Export canceled.")
                     return
                 
-                imports(destination_path)
+                imports(destination_path, full=full)
                 break
             else:
                 log.error("Invalid input. Please enter 'y' or 'n'.")
                 continue   
 
-def imports(import_dir):
+def imports(import_dir, full=False):
     try:
         import_path = os.path.join(import_dir, "mcmd")
         if not os.path.exists(import_path):
             log.error(f"Invalid Directory '{import_path}' does not exist.")
             return
     
+        head = None
         if is_git_repo(import_dir):
             log.info(f"{import_dir} is a git repository.")
             changes = get_git_status(import_dir)
@@ -347,24 +721,134 @@ def imports(import_dir):
                 log.info("Please commit the changes before import...")
                 return
             else:
-                result = subprocess.run(['git', 'pull'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+                result = subprocess.run(['git', 'pull'], cwd=import_dir, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
 
                 if result.returncode == 0:
                     log.info(f"Successfully pulled latest changes in {import_dir}")
                 else:
                     log.warn(f"Error pulling changes in {import_dir}: {result.stderr}")
+                head = get_git_head(import_dir)
                 
         else:
             log.warn(f"'{import_path}' is not a Git repository.")
-        
-        shutil.copytree(import_path, MCMD_COMMANDS_DIR, dirs_exist_ok=True)
+
+        # Writers are serialized, exec and list keep reading while files are replaced
+        with write_lock(MCMD_COMMANDS_DIR):
+            # Only apply what changed since the last imported commit when it is known
+            last_commit = None if full or not head else get_last_import(MCMD_COMMANDS_DIR, import_dir)
+            changes = get_git_changes(import_dir, last_commit, head) if last_commit else None
+
+            # A packed export is merged into the storage rather than copied over the repository
+            packed_file = os.path.join(import_path, DATABASE_NAME)
+            packed_changed = changes is None or any(path == DATABASE_NAME for _, path in changes)
+            if changes is not None:
+                changes = [(status, path) for status, path in changes if path != DATABASE_NAME]
+
+            if changes is None:
+                pairs = [pair for pair in list_tree_files(import_path, MCMD_COMMANDS_DIR) if pair[0] != packed_file]
+                stats = copy_files(pairs)
+                rebuild_index(MCMD_COMMANDS_DIR)
+                log.info(f"Copied {format_throughput(stats)}")
+            elif changes:
+                folders, stats = apply_changes(import_path, MCMD_COMMANDS_DIR, changes)
+                update_index(MCMD_COMMANDS_DIR, folders)
+                log.info(f"Applied {len(changes)} changed files in {len(folders)} commands since {last_commit[:12]}.")
+                log.info(f"Copied {format_throughput(stats)}")
+            elif not packed_changed:
+                log.info(f"Already up to date with {head[:12]}.")
+
+            if packed_changed and os.path.exists(packed_file):
+                merge_packed_commands(packed_file)
+            if get_settings("STORAGE_BACKEND") == "sqlite":
+                pack_imported_commands()
+
+            if head:
+                record_import(MCMD_COMMANDS_DIR, import_dir, head)
         log.info(f"Imported Successfully from '{import_path}'")
     except Exception as e:
         log.error(f"Error during export: {e}")
 
+def merge_packed_commands(packed_file):
+    """
+    Create or update the commands of an exported database in the storage.
+    """
+    packed = SqliteStorage(MCMD_COMMANDS_DIR, packed_file)
+    storage = get_storage(MCMD_COMMANDS_DIR)
+    changed = storage.write_many([packed.read(name) for name in packed.names()])
+    storage.refresh_index(changed)
+    log.info(f"Merged {len(changed)} changed commands from '{packed_file}'.")
+
+def pack_imported_commands():
+    """
+    Move commands imported as folders into the database of the sqlite backend.
+    """
+    packed = migrate(MCMD_COMMANDS_DIR, "sqlite")
+    if packed:
+        rebuild_index(MCMD_COMMANDS_DIR)
+        get_storage(MCMD_COMMANDS_DIR).refresh_index()
+        log.info(f"Packed {len(packed)} imported commands into the database.")
+
+def import_bundle(bundle_path, commands=None, list_only=False):
+    try:
+        if list_only:
+            bundled = list_bundle(bundle_path)
+            table = Table(show_header=True, header_style="bold blue")
+            table.add_column("Command", style="dim")
+            table.add_column("Description")
+            for cmd, details in sorted(bundled.items()):
+                table.add_row(cmd, details["description"] or "")
+            console.print(table)
+            return
+
+        os.makedirs(MCMD_COMMANDS_DIR, exist_ok=True)
+        with write_lock(MCMD_COMMANDS_DIR):
+            imported = extract_bundle(bundle_path, MCMD_COMMANDS_DIR, commands)
+            update_index(MCMD_COMMANDS_DIR, imported)
+            if get_settings("STORAGE_BACKEND") == "sqlite":
+                pack_imported_commands()
+        log.info(f"Imported {len(imported)} commands from bundle '{bundle_path}'")
+    except Exception as e:
+        log.error(f"Error during import: {e}")
+
 def is_git_repo(path):
     return os.path.isdir(os.path.join(path, '.git'))
 
+def get_git_head(path):
+    result = subprocess.run(
+        ['git', 'rev-parse', 'HEAD'],
+        cwd=path,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True
+    )
+    if result.returncode != 0:
+        return None
+    return result.stdout.strip()
+
+def get_git_changes(path, old_commit, new_commit, subdir="mcmd"):
+    """
+    List the files under subdir that changed between two commits.
+
+    Returns:
+        list: (status, path relative to subdir) tuples, or None if the diff
+        cannot be computed, e.g. because old_commit is no longer in the history.
+    """
+    result = subprocess.run(
+        ['git', 'diff', '--name-status', '--no-renames', '-z', old_commit, new_commit, '--', subdir],
+        cwd=path,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True
+    )
+    if result.returncode != 0:
+        return None
+
+    fields = result.stdout.split('\0')
+    changes = []
+    for status, file_path in zip(fields[0::2], fields[1::2]):
+        changes.append((status[0], os.path.relpath(file_path, subdir)))
+    return changes
+
 def get_git_status(path):
     try:
         result = subprocess.run(
@@ -383,10 +867,8 @@ def display_help(command_name: str):
     """
     Display the help message for the command, including usage, description, and arguments.
     """
-    description_file = os.path.join(MCMD_COMMANDS_DIR, command_name, f"{command_name}.desc")
-    if os.path.exists(description_file):
-        with open(description_file, 'r') as file:
-            description = file.read()
+    description = get_command_description(command_name)
+    if description is not None:
         table = Table(show_header=True, header_style="bold blue")
         table.add_column("Command", style="dim")
         table.add_column("Description")
@@ -395,7 +877,27 @@ def display_help(command_name: str):
     else:
         log.error(f"Description file for 'mcmd {command_name}' does not exist.")
 
+def get_command_description(command_name):
+    """
+    Return the full description of the command a name resolves to, or None.
+    """
+    command_file = resolve_command(command_name, MCMD_COMMANDS_DIR)
+    if command_file is None:
+        return None
+    if get_settings("STORAGE_BACKEND") == "sqlite" and command_file.startswith(get_state_dir(MCMD_COMMANDS_DIR)):
+        command = SqliteStorage(MCMD_COMMANDS_DIR).read(command_name)
+        return command and command["description"]
+    description_file = os.path.join(os.path.dirname(command_file), f"{command_name}.desc")
+    try:
+        with open(description_file, 'r') as file:
+            return file.read()
+    except FileNotFoundError:
+        return None
+
 def get_banner_file_path():
+    # pkg_resources is slow to import, so only load it when the banner is shown
+    import pkg_resources
+
     return pkg_resources.resource_filename(__name__, 'banner.txt')
 
 def read_banner_file(file_path):
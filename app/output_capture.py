@@ -0,0 +1,245 @@
+import os
+import sys
+import time
+import gzip
+import shutil
+import threading
+import collections
+import subprocess
+from app.index import get_state_dir
+from app.settings_store import get_settings
+from app.telemetry import record_run
+
+# Opt-in capture of what a command prints. The child's stdout and stderr are
+# forwarded to ours as they arrive and appended to `.mcmd/logs/<name>.log`,
+# which is rotated by size into gzip files. The last bytes of output are kept
+# in a fixed-size ring buffer and shown when the command fails. Output is
+# moved in fixed-size chunks with os.read/os.write, so memory stays constant
+# however much a command prints.
+#
+# A command opts in with the CAPTURE_OUTPUT setting, `mcmd exec --capture`,
+# or in its metadata:
+#
+#     {"capture": {"max_mb": 10, "keep": 5}}
+
+LOGS_DIR_NAME = "logs"
+CHUNK_SIZE = 65536
+TAIL_BYTES = 16384
+TAIL_LINES = 20
+
+def get_logs_dir(commands_dir):
+    return os.path.join(get_state_dir(commands_dir), LOGS_DIR_NAME)
+
+def get_log_file(commands_dir, command_name):
+    return os.path.join(get_logs_dir(commands_dir), f"{command_name}.log")
+
+def get_capture_options(metadata, capture=None):
+    """
+    Return the capture options of a command, or None if its output is not captured.
+
+    Args:
+        metadata (dict): The command's metadata.
+        capture (bool): Explicit choice from the command line, None to use the
+            metadata and then the CAPTURE_OUTPUT setting.
+    """
+    options = metadata.get("capture")
+    if capture is False or (capture is None and not options and not get_settings("CAPTURE_OUTPUT")):
+        return None
+    if not isinstance(options, dict):
+        if options not in (None, True, False):
+            raise ValueError("'capture' must be true or an object with 'max_mb' and 'keep'.")
+        options = {}
+    return {
+        "max_bytes": int(options.get("max_mb", get_settings("CAPTURE_LOG_MAX_MB")) * 1024 * 1024),
+        "keep": int(options.get("keep", get_settings("CAPTURE_LOG_KEEP"))),
+    }
+
+class RingBuffer:
+    """
+    The last `capacity` bytes written to it.
+    """
+    def __init__(self, capacity):
+        self.buffer = bytearray(capacity)
+        self.capacity = capacity
+        self.end = 0
+        self.size = 0
+
+    def write(self, data):
+        if len(data) >= self.capacity:
+            self.buffer[:] = data[-self.capacity:]
+            self.end, self.size = 0, self.capacity
+            return
+        first = min(len(data), self.capacity - self.end)
+        self.buffer[self.end:self.end + first] = data[:first]
+        self.buffer[:len(data) - first] = data[first:]
+        self.end = (self.end + len(data)) % self.capacity
+        self.size = min(self.capacity, self.size + len(data))
+
+    def getvalue(self):
+        if self.size < self.capacity:
+            return bytes(self.buffer[:self.size])
+        return bytes(self.buffer[self.end:] + self.buffer[:self.end])
+
+class CaptureLog:
+    """
+    A per-command log file shared by the stdout and stderr forwarding threads,
+    rotated when it grows past max_bytes. Rotated files are compressed by a
+    background thread, so compression never stalls the command's output, and
+    files beyond `keep` are dropped at rotation time, before being compressed.
+    """
+    def __init__(self, log_file, max_bytes, keep):
+        self.log_file = log_file
+        self.max_bytes = max_bytes
+        self.keep = keep
+        self.lock = threading.Lock()
+        self.rotations = 0
+        # Rotated files waiting for the compressor, oldest first
+        self.pending = collections.deque()
+        self.pending_ready = threading.Condition()
+        self.closed = False
+        self.compressor = None
+        os.makedirs(os.path.dirname(log_file), exist_ok=True)
+        self.open()
+
+    def open(self):
+        self.fd = os.open(self.log_file, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self.size = os.fstat(self.fd).st_size
+
+    def write(self, data):
+        with self.lock:
+            if self.size >= self.max_bytes:
+                self.rotate()
+            os.write(self.fd, data)
+            self.size += len(data)
+
+    def rotate(self):
+        os.close(self.fd)
+        pending_file = f"{self.log_file}.{os.getpid()}.{self.rotations}"
+        self.rotations += 1
+        os.replace(self.log_file, pending_file)
+        self.open()
+        if self.keep <= 0:
+            os.remove(pending_file)
+            return
+        with self.pending_ready:
+            self.pending.append(pending_file)
+            # The compressor fell behind: the oldest files would be pruned right after compressing them
+            while len(self.pending) > self.keep:
+                os.remove(self.pending.popleft())
+            self.pending_ready.notify()
+        if self.compressor is None:
+            self.compressor = threading.Thread(target=self.compress_pending)
+            self.compressor.start()
+
+    def close(self):
+        os.close(self.fd)
+        with self.pending_ready:
+            self.closed = True
+            self.pending_ready.notify()
+        if self.compressor is not None:
+            self.compressor.join()
+
+    def compress_pending(self):
+        while True:
+            with self.pending_ready:
+                while not self.pending and not self.closed:
+                    self.pending_ready.wait()
+                if not self.pending:
+                    return
+                pending_file = self.pending.popleft()
+            self.compress(pending_file)
+
+    def compress(self, pending_file):
+        oldest = f"{self.log_file}.{self.keep}.gz"
+        if os.path.exists(oldest):
+            os.remove(oldest)
+        for number in range(self.keep - 1, 0, -1):
+            older = f"{self.log_file}.{number}.gz"
+            if os.path.exists(older):
+                os.replace(older, f"{self.log_file}.{number + 1}.gz")
+        with open(pending_file, 'rb') as source, gzip.open(f"{self.log_file}.1.gz", 'wb') as target:
+            shutil.copyfileobj(source, target, CHUNK_SIZE)
+        os.remove(pending_file)
+
+def write_all(fd, data):
+    while data:
+        written = os.write(fd, data)
+        data = data[written:]
+
+def forward(source, target_fd, capture_log, tail, tail_lock):
+    # Keeps draining the pipe when our own output is gone, so the child never blocks
+    source_fd = source.fileno()
+    while True:
+        chunk = os.read(source_fd, CHUNK_SIZE)
+        if not chunk:
+            break
+        if target_fd is not None:
+            try:
+                write_all(target_fd, chunk)
+            except OSError:
+                target_fd = None
+        capture_log.write(chunk)
+        with tail_lock:
+            tail.write(chunk)
+    source.close()
+
+def run_captured(commands_dir, command_name, command_file, args, options, limits=None):
+    """
+    Run a command as a child in its own process group, forwarding and logging
+    its output, and record the run in the telemetry log.
+
+    Returns:
+        int: The return code of the command.
+    """
+    from app.limits import ProcessGroup
+
+    log_file = get_log_file(commands_dir, command_name)
+    capture_log = CaptureLog(log_file, options["max_bytes"], options["keep"])
+    capture_log.write(f"==> {time.strftime('%Y-%m-%d %H:%M:%S')} mcmd exec {' '.join([command_name] + args)} <==\n".encode())
+    tail, tail_lock = RingBuffer(TAIL_BYTES), threading.Lock()
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+    start = time.time()
+    started = time.perf_counter()
+    group = ProcessGroup([command_file] + args, limits, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0)
+    process = group.process
+    threads = [
+        threading.Thread(target=forward, args=(process.stdout, sys.stdout.fileno(), capture_log, tail, tail_lock)),
+        threading.Thread(target=forward, args=(process.stderr, sys.stderr.fileno(), capture_log, tail, tail_lock)),
+    ]
+    for thread in threads:
+        thread.start()
+    returncode, usage = group.wait()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    capture_log.write(f"==> exit {returncode} after {wall:.2f}s <==\n".encode())
+    capture_log.close()
+    record_run(commands_dir, command_name, args, start, wall, usage, returncode)
+    if returncode != 0:
+        show_tail(command_name, tail.getvalue(), log_file)
+    return returncode
+
+def show_tail(command_name, output, log_file):
+    lines = output.decode(errors="replace").splitlines()[-TAIL_LINES:]
+    # The first line may start mid-way once the ring buffer wrapped
+    sys.stderr.write(f"--- last {len(lines)} lines of 'mcmd {command_name}', full output in {log_file} ---\n")
+    sys.stderr.write("\n".join(lines) + "\n")
+    sys.stderr.flush()
+
+def read_log_tail(log_file, lines=TAIL_LINES):
+    """
+    Return the last lines of a log, reading backwards from its end in chunks.
+    """
+    with open(log_file, 'rb') as file:
+        file.seek(0, os.SEEK_END)
+        position = file.tell()
+        data = b""
+        while position > 0 and data.count(b"\n") <= lines:
+            step = min(CHUNK_SIZE, position)
+            position -= step
+            file.seek(position)
+            data = file.read(step) + data
+    return data.decode(errors="replace").splitlines()[-lines:]
@@ -0,0 +1,128 @@
+import os
+import sys
+import json
+import time
+import _thread
+
+# Breakdown of where an mcmd invocation spends its time. Enabled with the
+# global `--profile[=FILE.json]` flag or the MCMD_PROFILE environment variable
+# (`1` prints the breakdown to stderr, anything else is a JSON file to write).
+# MCMD_CPROFILE=FILE.prof also dumps a cProfile of the Python portion.
+#
+# Phases are timed with `with phase("lookup"): ...`, which costs one attribute
+# check when profiling is off.
+
+PROFILE_ENV = "MCMD_PROFILE"
+CPROFILE_ENV = "MCMD_CPROFILE"
+
+# Phases that are the script's own time rather than mcmd overhead
+SCRIPT_PHASES = ("script",)
+
+class Profile:
+    def __init__(self):
+        self.enabled = False
+        self.start = None
+        self.output = None
+        self.cprofile_output = None
+        self.profiler = None
+        self.phases = {}
+        self.stack = []
+        self.thread = None
+        self.reported = False
+
+profile = Profile()
+
+class phase:
+    """
+    Context manager adding the time spent in its block to a named phase.
+
+    Time spent in a nested phase, e.g. reading settings while app.operations
+    is imported, only counts towards the innermost phase. Only the main thread
+    is timed, commands started by `mcmd run` overlap on worker threads.
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        if profile.enabled and _thread.get_ident() == profile.thread:
+            self.nested = 0.0
+            self.started = time.perf_counter()
+            profile.stack.append(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        if profile.enabled and profile.stack and profile.stack[-1] is self:
+            elapsed = time.perf_counter() - self.started
+            profile.stack.pop()
+            if profile.stack:
+                profile.stack[-1].nested += elapsed
+            profile.phases[self.name] = profile.phases.get(self.name, 0.0) + elapsed - self.nested
+        return False
+
+def enable(start, output=None, cprofile_output=None):
+    """
+    Turn profiling on for this process and report when it exits.
+
+    Args:
+        start (float): time.perf_counter() when mcmd's entry point started.
+        output (str): JSON file to write the breakdown to, else it is printed to stderr.
+        cprofile_output (str): File to dump cProfile stats of the Python portion to.
+    """
+    import atexit
+
+    profile.enabled = True
+    profile.thread = _thread.get_ident()
+    profile.start = start
+    profile.output = output
+    profile.cprofile_output = cprofile_output
+    if cprofile_output:
+        import cProfile
+
+        profile.profiler = cProfile.Profile()
+        profile.profiler.enable()
+    atexit.register(report)
+
+def enable_from_env(start):
+    value = os.environ.get(PROFILE_ENV)
+    cprofile_output = os.environ.get(CPROFILE_ENV)
+    if value or cprofile_output:
+        enable(start, output=None if value in (None, "", "1") else value, cprofile_output=cprofile_output)
+
+def get_breakdown():
+    total = time.perf_counter() - profile.start
+    phases = {name: round(seconds * 1000, 3) for name, seconds in profile.phases.items()}
+    script = sum(profile.phases.get(name, 0.0) for name in SCRIPT_PHASES)
+    return {
+        "argv": sys.argv[1:],
+        "phases_ms": phases,
+        "other_ms": round((total - sum(profile.phases.values())) * 1000, 3),
+        "mcmd_overhead_ms": round((total - script) * 1000, 3),
+        "total_ms": round(total * 1000, 3),
+    }
+
+def report():
+    """
+    Print or write the breakdown. Called at exit, or right before exec in replace mode.
+    """
+    if not profile.enabled or profile.reported:
+        return
+    profile.reported = True
+
+    if profile.profiler:
+        profile.profiler.disable()
+        profile.profiler.dump_stats(profile.cprofile_output)
+
+    breakdown = get_breakdown()
+    if profile.output:
+        with open(profile.output, 'w') as file:
+            json.dump(breakdown, file, indent=2)
+        return
+
+    lines = ["mcmd profile:"]
+    for name, milliseconds in breakdown["phases_ms"].items():
+        lines.append(f"  {name:<14}{milliseconds:10.2f} ms")
+    lines.append(f"  {'other':<14}{breakdown['other_ms']:10.2f} ms")
+    lines.append(f"  {'mcmd overhead':<14}{breakdown['mcmd_overhead_ms']:10.2f} ms")
+    lines.append(f"  {'total':<14}{breakdown['total_ms']:10.2f} ms")
+    sys.stderr.write("\n".join(lines) + "\n")
+    sys.stderr.flush()
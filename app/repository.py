@@ -0,0 +1,139 @@
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from app.log_util import Log
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Safe access to the command repository by concurrent mcmd processes, e.g. many
+# `mcmd exec` jobs in CI while an import or an auto export runs.
+#
+# Every file mcmd changes in the repository is written to a temporary file in
+# the same folder and renamed over the old one, so a reader sees either the old
+# or the new content, never a half-written file. Readers (exec, list, search)
+# therefore take no lock and never wait.
+#
+# Writers (create, remove, imports, settings changes, storage migration) hold
+# an exclusive flock on `.mcmd/lock` so their read-modify-write cycles do not
+# interleave. Operations that read many files and need them to be consistent
+# with each other, like an export, hold it shared: they wait for a running
+# writer but not for each other. The locks are advisory and released by the
+# kernel if mcmd dies. Where fcntl is not available they do nothing.
+#
+# This module is loaded on the `mcmd exec` fast path, keep its imports light.
+
+log = Log()
+
+LOCK_FILE_NAME = "lock"
+
+# commands_dir -> [lock file descriptor, "read" or "write", depth], so nested
+# locks in one process neither deadlock nor release the lock early
+_held = {}
+
+def temp_path(path):
+    # Unique per process and thread, the copy engine writes from a thread pool
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f".{name}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+def atomic_write(path, content, mode=None):
+    """
+    Replace a file with new content in one rename.
+
+    Args:
+        path (str): The file to write.
+        content (str or bytes): The new content.
+        mode (int): Permission bits for the file, by default those of the file
+            it replaces.
+    """
+    if mode is None:
+        try:
+            mode = os.stat(path).st_mode & 0o7777
+        except FileNotFoundError:
+            pass
+    temp_file = temp_path(path)
+    try:
+        with open(temp_file, 'wb' if isinstance(content, bytes) else 'w') as file:
+            file.write(content)
+        if mode is not None:
+            os.chmod(temp_file, mode)
+        os.replace(temp_file, path)
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+
+def atomic_copy(src, dest):
+    """
+    Copy a file with its mode and times over dest in one rename.
+
+    Returns:
+        int: The size of the copied file.
+    """
+    temp_file = temp_path(dest)
+    try:
+        shutil.copy2(src, temp_file)
+        os.replace(temp_file, dest)
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+    return os.path.getsize(dest)
+
+def get_lock_file(commands_dir):
+    return os.path.join(commands_dir, ".mcmd", LOCK_FILE_NAME)
+
+@contextmanager
+def repository_lock(commands_dir, kind):
+    commands_dir = os.path.abspath(os.path.expanduser(commands_dir))
+    held = _held.get(commands_dir)
+    if fcntl is None or (held and (held[1] == "write" or kind == "read")):
+        # Not available, or already held strongly enough by this process
+        if held:
+            held[2] += 1
+        try:
+            yield
+        finally:
+            if held:
+                held[2] -= 1
+        return
+
+    operation = fcntl.LOCK_EX if kind == "write" else fcntl.LOCK_SH
+    if held:
+        # Upgrade the shared lock of this process, it is shared again afterwards
+        fd, upgraded = held[0], True
+    else:
+        lock_file = get_lock_file(commands_dir)
+        os.makedirs(os.path.dirname(lock_file), exist_ok=True)
+        fd, upgraded = os.open(lock_file, os.O_RDWR | os.O_CREAT | os.O_CLOEXEC, 0o644), False
+    try:
+        try:
+            fcntl.flock(fd, operation | fcntl.LOCK_NB)
+        except BlockingIOError:
+            log.info(f"Waiting for another mcmd process to finish writing to '{commands_dir}'...")
+            fcntl.flock(fd, operation)
+        _held[commands_dir] = [fd, kind, 1]
+        yield
+    finally:
+        if upgraded:
+            fcntl.flock(fd, fcntl.LOCK_SH)
+            _held[commands_dir] = held
+        else:
+            _held.pop(commands_dir, None)
+            os.close(fd)
+
+def write_lock(commands_dir):
+    """
+    Hold the repository's lock exclusively, for operations that change it.
+    """
+    return repository_lock(commands_dir, "write")
+
+def read_lock(commands_dir):
+    """
+    Hold the repository's lock shared, for operations that need a consistent
+    view of many files. Plain lookups do not need it.
+    """
+    return repository_lock(commands_dir, "read")
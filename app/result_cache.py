@@ -0,0 +1,304 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import threading
+import subprocess
+from app.limits import TIMEOUT_STATUS
+from app.log_util import Log
+from app.repository import temp_path
+from app.index import get_state_dir
+from app.settings_store import get_settings
+from app.telemetry import record_run
+
+# Result cache for commands that opt in through their metadata:
+#
+#     {"cache": {"ttl": 3600, "inputs": ["~/reports/data.csv"]}}
+#
+# The cache key combines the script content, the arguments, the working
+# directory and the mtime and size of the declared input files. Each entry is
+# a single file holding a JSON header line followed by the raw stdout and
+# stderr, so a hit replays the output without spawning the script. Output is
+# streamed to and from the entry file in chunks, never held in memory. Entries
+# expire after their TTL, and the least recently used ones are evicted when
+# the cache grows past RESULT_CACHE_MAX_MB. Hits and misses are counted by
+# appending a byte to `hits.count` and `misses.count`, so concurrent runs
+# never lose a count and reading a counter is a stat.
+
+log = Log()
+
+CACHE_DIR_NAME = "cache"
+ENTRY_SUFFIX = ".entry"
+COUNTER_SUFFIX = ".count"
+COUNTERS = ("hits", "misses")
+# Counters of versions that kept them in one JSON file, still added to the totals
+LEGACY_STATS_FILE_NAME = "stats.json"
+DEFAULT_TTL = 24 * 60 * 60
+CHUNK_SIZE = 65536
+# Room reserved for the header of an entry being written, stdout follows it
+HEADER_SIZE = 1024
+
+def get_cache_dir(commands_dir):
+    return os.path.join(get_state_dir(commands_dir), CACHE_DIR_NAME)
+
+def get_cache_options(metadata):
+    """
+    Return the cache options of a command, or None if it did not opt in.
+    """
+    options = metadata.get("cache")
+    if not options:
+        return None
+    if options is True:
+        options = {}
+    if not isinstance(options, dict):
+        raise ValueError("'cache' must be true or an object with 'ttl' and 'inputs'.")
+    return {"ttl": options.get("ttl", DEFAULT_TTL), "inputs": options.get("inputs", [])}
+
+def compute_key(command_file, args, inputs):
+    digest = hashlib.sha256()
+    with open(command_file, 'rb') as file:
+        digest.update(file.read())
+    digest.update(json.dumps([args, os.getcwd()]).encode())
+    for input_path in inputs:
+        path = os.path.abspath(os.path.expanduser(input_path))
+        try:
+            stat = os.stat(path)
+            digest.update(f"{path}:{stat.st_mtime_ns}:{stat.st_size}".encode())
+        except FileNotFoundError:
+            digest.update(f"{path}:missing".encode())
+    return digest.hexdigest()
+
+def open_entry(entry_file):
+    """
+    Open a cache entry and read its header; the file is left at stdout.
+
+    Returns:
+        tuple: (open binary file, header dict)
+    """
+    file = open(entry_file, 'rb')
+    try:
+        return file, json.loads(file.readline())
+    except BaseException:
+        file.close()
+        raise
+
+def copy_bytes(source, target, count):
+    while count > 0:
+        chunk = source.read(min(CHUNK_SIZE, count))
+        if not chunk:
+            break
+        target.write(chunk)
+        count -= len(chunk)
+    target.flush()
+
+def finish_entry(entry_file, header, stdout_file, stderr_file):
+    """
+    Move a streamed entry into place: stdout_file already holds the output
+    after HEADER_SIZE bytes of room, stderr_file is appended to it.
+
+    Returns:
+        bool: False if the header does not fit its room; nothing was cached.
+    """
+    with open(stdout_file, 'r+b') as file, open(stderr_file, 'rb') as stderr:
+        file.seek(0, os.SEEK_END)
+        stdout_size = file.tell() - HEADER_SIZE
+        stderr_size = os.fstat(stderr.fileno()).st_size
+        copy_bytes(stderr, file, stderr_size)
+        # Padded with spaces, which json.loads ignores
+        line = json.dumps(dict(header, stdout=stdout_size, stderr=stderr_size)).encode()
+        if len(line) >= HEADER_SIZE:
+            return False
+        file.seek(0)
+        file.write(line.ljust(HEADER_SIZE - 1) + b"\n")
+    os.replace(stdout_file, entry_file)
+    return True
+
+def get_counter_file(cache_dir, counter):
+    return os.path.join(cache_dir, counter + COUNTER_SUFFIX)
+
+def record_stat(cache_dir, counter):
+    # One O_APPEND write is atomic, unlike a read-modify-write of a total
+    fd = os.open(get_counter_file(cache_dir, counter), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, b".")
+    finally:
+        os.close(fd)
+
+def read_counters(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, LEGACY_STATS_FILE_NAME), 'r') as file:
+            counters = json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        counters = {}
+    for counter in COUNTERS:
+        try:
+            counters[counter] = counters.get(counter, 0) + os.path.getsize(get_counter_file(cache_dir, counter))
+        except FileNotFoundError:
+            pass
+    return counters
+
+def list_entries(cache_dir):
+    """
+    Return (path, size, last used) of every cache entry, least recently used first.
+    """
+    entries = []
+    try:
+        with os.scandir(cache_dir) as scan:
+            for entry in scan:
+                if entry.name.endswith(ENTRY_SUFFIX):
+                    stat = entry.stat()
+                    entries.append((entry.path, stat.st_size, stat.st_mtime))
+    except FileNotFoundError:
+        pass
+    entries.sort(key=lambda entry: entry[2])
+    return entries
+
+def evict(cache_dir, max_bytes):
+    entries = list_entries(cache_dir)
+    total = sum(size for _, size, _ in entries)
+    for path, size, _ in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+def tee_stream(source, target, sink):
+    # Forward the child's output as it arrives while writing a copy for the cache.
+    # Keeps draining the pipe when our own output is gone, so the child never blocks.
+    while True:
+        chunk = os.read(source.fileno(), CHUNK_SIZE)
+        if not chunk:
+            break
+        sink.write(chunk)
+        if target is not None:
+            try:
+                target.write(chunk)
+                target.flush()
+            except OSError:
+                target = None
+    source.close()
+
+def run_and_capture(command, stdout_file, stderr_file, limits=None):
+    """
+    Run a command in its own process group while teeing its output to ours
+    and to the given files.
+
+    Returns:
+        tuple: (return code, resource usage).
+    """
+    from app.limits import ProcessGroup
+
+    with open(stdout_file, 'r+b') as stdout, open(stderr_file, 'wb') as stderr:
+        stdout.seek(0, os.SEEK_END)
+        group = ProcessGroup(command, limits, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        process = group.process
+        threads = [
+            threading.Thread(target=tee_stream, args=(process.stdout, sys.stdout.buffer, stdout)),
+            threading.Thread(target=tee_stream, args=(process.stderr, sys.stderr.buffer, stderr)),
+        ]
+        for thread in threads:
+            thread.start()
+        returncode, usage = group.wait()
+        for thread in threads:
+            thread.join()
+    return returncode, usage
+
+def replay_entry(entry_file):
+    """
+    Write a fresh cache entry's output to ours.
+
+    Returns:
+        int: The cached return code, or None if there is no fresh entry.
+    """
+    try:
+        file, header = open_entry(entry_file)
+    except (FileNotFoundError, ValueError):
+        return None
+    with file:
+        try:
+            if time.time() - header["created"] > header["ttl"]:
+                os.remove(entry_file)
+                return None
+            stdout_size, stderr_size, returncode = header["stdout"], header["stderr"], header["returncode"]
+        except (KeyError, TypeError, FileNotFoundError):
+            return None
+        # Touch the entry so eviction sees it as recently used
+        os.utime(entry_file)
+        try:
+            copy_bytes(file, sys.stdout.buffer, stdout_size)
+            copy_bytes(file, sys.stderr.buffer, stderr_size)
+        except BrokenPipeError:
+            # The reader went away, like `| head`; keep the exit flush from failing too
+            devnull = os.open(os.devnull, os.O_WRONLY)
+            os.dup2(devnull, sys.stdout.fileno())
+            os.close(devnull)
+    return returncode
+
+def run_cached(commands_dir, command_name, command_file, args, options, limits=None):
+    """
+    Replay a cached result of the command, or run it and cache the result.
+
+    Returns:
+        int: The exit status of the command, cached or fresh.
+    """
+    cache_dir = get_cache_dir(commands_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+    key = compute_key(command_file, args, options["inputs"])
+    entry_file = os.path.join(cache_dir, key + ENTRY_SUFFIX)
+
+    returncode = replay_entry(entry_file)
+    if returncode is not None:
+        record_stat(cache_dir, "hits")
+        return returncode
+
+    record_stat(cache_dir, "misses")
+    stdout_file, stderr_file = temp_path(entry_file), temp_path(entry_file) + ".stderr"
+    try:
+        with open(stdout_file, 'wb') as file:
+            file.write(b" " * HEADER_SIZE)
+        start = time.time()
+        started = time.perf_counter()
+        returncode, usage = run_and_capture([command_file] + args, stdout_file, stderr_file, limits)
+        record_run(commands_dir, command_name, args, start, time.perf_counter() - started, usage, returncode)
+        # A cut short run is not a result
+        if not (returncode == TIMEOUT_STATUS and limits and limits.get("timeout")):
+            header = {"command": command_name, "created": time.time(), "ttl": options["ttl"], "returncode": returncode}
+            if finish_entry(entry_file, header, stdout_file, stderr_file):
+                evict(cache_dir, get_settings("RESULT_CACHE_MAX_MB") * 1024 * 1024)
+    finally:
+        for path in (stdout_file, stderr_file):
+            if os.path.exists(path):
+                os.remove(path)
+    return returncode
+
+def get_cache_stats(commands_dir):
+    cache_dir = get_cache_dir(commands_dir)
+    entries = list_entries(cache_dir)
+    counters = read_counters(cache_dir)
+    return {
+        "entries": len(entries),
+        "bytes": sum(size for _, size, _ in entries),
+        "max_bytes": get_settings("RESULT_CACHE_MAX_MB") * 1024 * 1024,
+        "hits": counters.get("hits", 0),
+        "misses": counters.get("misses", 0),
+    }
+
+def clear_cache(commands_dir):
+    """
+    Remove every cache entry and reset the counters.
+
+    Returns:
+        int: Number of entries removed.
+    """
+    cache_dir = get_cache_dir(commands_dir)
+    entries = list_entries(cache_dir)
+    for path, _, _ in entries:
+        os.remove(path)
+    for stats_file in [get_counter_file(cache_dir, counter) for counter in COUNTERS] + [os.path.join(cache_dir, LEGACY_STATS_FILE_NAME)]:
+        if os.path.exists(stats_file):
+            os.remove(stats_file)
+    return len(entries)
@@ -0,0 +1,210 @@
+import os
+import json
+import time
+from app.settings_store import get_settings
+
+# Layered command roots. Besides the command repository (MCMD_COMMANDS_DIR),
+# the MCMD_COMMAND_ROOTS setting can list further folders in the same
+# `<name>/<name>.sh` layout, separated by ':', e.g. a team and a company wide
+# command set. A command is looked up in the repository first and then in the
+# roots in order, so earlier ones shadow later ones and nothing is copied.
+#
+# The commands of the extra roots are kept in a name -> path table in the
+# repository's .mcmd folder, so resolving a command costs a stat per root
+# plus the folder and script of the entry found. The table is rebuilt when
+# the mtime of a root changes, i.e. when a command folder is added to or
+# removed from it. A script added to or removed from an existing folder is
+# noticed when that command is resolved, and by callers that list every
+# command (full_check), which compare the mtime of every folder. The root
+# commands are also listed in the completion file and the search index, see
+# index.write_index.
+#
+# This module is loaded on the `mcmd exec` fast path, keep its imports light.
+
+# mcmd's own files inside the command repository
+STATE_DIR_NAME = ".mcmd"
+ROOTS_FILE_NAME = "roots.json"
+ROOTS_VERSION = 2
+
+def is_valid_command_name(command_name):
+    # Simple validation: only allows alphanumeric characters and underscores
+    return command_name.isidentifier()
+
+def get_commands_dir():
+    return os.path.expanduser(get_settings("MCMD_COMMANDS_DIR"))
+
+def get_extra_roots(commands_dir):
+    """
+    Return the configured roots after the command repository, in lookup order.
+    """
+    roots = []
+    for root in get_settings("MCMD_COMMAND_ROOTS").split(os.pathsep):
+        root = os.path.abspath(os.path.expanduser(root.strip())) if root.strip() else None
+        if root and root != os.path.abspath(commands_dir) and root not in roots:
+            roots.append(root)
+    return roots
+
+def get_state_dir(commands_dir):
+    return os.path.join(commands_dir, STATE_DIR_NAME)
+
+def get_roots_file(commands_dir):
+    return os.path.join(get_state_dir(commands_dir), ROOTS_FILE_NAME)
+
+def root_mtime(root):
+    try:
+        return os.stat(root).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+def scan_root(root):
+    """
+    Collect the `<name>/<name>.sh` commands of one root.
+
+    Returns:
+        tuple: (command name -> dict with path, description excerpt, mtime and
+        size, folder path -> mtime for every folder of the root)
+    """
+    from app.index import read_description_excerpt
+
+    commands, folders = {}, {}
+    try:
+        entries = sorted(os.listdir(root))
+    except OSError:
+        return commands, folders
+    for name in entries:
+        command_file = os.path.join(root, name, f"{name}.sh")
+        if name.startswith('.'):
+            continue
+        folder_mtime = root_mtime(os.path.join(root, name))
+        if folder_mtime is None:
+            continue
+        folders[os.path.join(root, name)] = folder_mtime
+        try:
+            stat = os.stat(command_file)
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        commands[name] = {
+            "path": command_file,
+            "description": read_description_excerpt(os.path.join(root, name, f"{name}.desc")),
+            "mtime": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "folder_mtime": folder_mtime,
+        }
+    return commands, folders
+
+def build_root_table(roots):
+    # "built" tells the files derived from the table that it changed
+    table = {"version": ROOTS_VERSION, "built": time.time_ns(), "roots": [[root, root_mtime(root)] for root in roots],
+             "folders": {}, "commands": {}}
+    for root in roots:
+        commands, folders = scan_root(root)
+        table["folders"].update(folders)
+        for name, entry in commands.items():
+            # Earlier roots shadow later ones
+            table["commands"].setdefault(name, entry)
+    return table
+
+def is_stale(table, roots, full_check):
+    if table is None or table.get("version") != ROOTS_VERSION:
+        return True
+    if table["roots"] != [[root, root_mtime(root)] for root in roots]:
+        return True
+    if not full_check:
+        return False
+    # Files added to or removed from a folder do not change the mtime of the root,
+    # and scripts rewritten in place do not change the mtime of their folder
+    return (any(root_mtime(folder) != mtime for folder, mtime in table["folders"].items())
+            or any(root_mtime(entry["path"]) != entry["mtime"] for entry in table["commands"].values()))
+
+def load_root_table(commands_dir, full_check=False):
+    """
+    Return the name -> command table of the extra roots, rebuilding it if a
+    root changed.
+
+    Args:
+        commands_dir (str): The command repository, which holds the table.
+        full_check (bool): Also look for changes inside every folder of the
+            roots, for callers that list all commands. It costs a stat per
+            folder and script.
+
+    Returns:
+        dict: The table with its commands under "commands", or None if no
+        extra roots are configured.
+    """
+    roots = get_extra_roots(commands_dir)
+    if not roots:
+        return None
+    roots_file = get_roots_file(commands_dir)
+    try:
+        with open(roots_file, 'r') as file:
+            table = json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        table = None
+    if not is_stale(table, roots, full_check):
+        return table
+
+    table = build_root_table(roots)
+    try:
+        os.makedirs(os.path.dirname(roots_file), exist_ok=True)
+        temp_file = f"{roots_file}.{os.getpid()}.tmp"
+        with open(temp_file, 'w') as file:
+            json.dump(table, file)
+        os.replace(temp_file, roots_file)
+    except OSError:
+        # Only a cache, resolution still works from the table in memory
+        pass
+    return table
+
+def resolve_command(command_name, commands_dir=None):
+    """
+    Return the script path of a custom command, or None if it does not exist.
+
+    The command repository is looked at first, then the extra roots in order.
+    """
+    if commands_dir is None:
+        commands_dir = get_commands_dir()
+    if get_settings("STORAGE_BACKEND") == "sqlite":
+        from app.storage import resolve_packed_command
+        command_file = resolve_packed_command(commands_dir, command_name)
+    else:
+        command_file = os.path.join(commands_dir, command_name, f"{command_name}.sh")
+        if not os.path.exists(command_file):
+            command_file = None
+    if command_file:
+        return command_file
+
+    table = load_root_table(commands_dir)
+    if table is None:
+        return None
+    entry = table["commands"].get(command_name)
+    if entry and root_mtime(os.path.dirname(entry["path"])) == entry["folder_mtime"] and os.path.exists(entry["path"]):
+        return entry["path"]
+    if not entry and not any(os.path.exists(os.path.join(root, command_name, f"{command_name}.sh"))
+                             for root, _ in table["roots"]):
+        return None
+    # The folder of the entry changed, or a script was added to an existing folder
+    table = load_root_table(commands_dir, full_check=True)
+    entry = table["commands"].get(command_name)
+    if entry and os.path.exists(entry["path"]):
+        return entry["path"]
+    return None
+
+def get_roots_stamp(commands_dir):
+    """
+    Return when the root table was last rebuilt, rebuilding it first if a root
+    changed, or None if no extra roots are configured.
+    """
+    table = load_root_table(commands_dir)
+    return table and table["built"]
+
+def get_root_commands(commands_dir, shadowed=(), full_check=True):
+    """
+    Return the commands of the extra roots like index.get_commands, leaving out
+    the names in shadowed and with absolute paths.
+    """
+    table = load_root_table(commands_dir, full_check=full_check)
+    if table is None:
+        return []
+    return [{"name": name, "path": entry["path"], "description": entry["description"],
+             "mtime": entry["mtime"], "size": entry["size"]}
+            for name, entry in sorted(table["commands"].items()) if name not in shadowed]
@@ -0,0 +1,180 @@
+import os
+import sys
+import time
+import subprocess
+from app.log_util import Log
+from app.settings_store import get_settings
+from app.metadata import load_metadata
+from app.telemetry import record_run
+from app.flatten import get_runnable_file
+from app.roots import get_commands_dir, resolve_command
+from app.profiling import phase, report as report_profile
+
+# This module is loaded on the `mcmd exec` fast path, so it must not import
+# typer, rich, tkinter or pkg_resources (see benchmarks/startup_budget.py).
+
+log = Log()
+
+# Exit statuses used when the script cannot be run, following the shell
+COMMAND_NOT_EXECUTABLE = 126
+COMMAND_NOT_FOUND = 127
+
+def get_script_to_run(commands_dir, command_file):
+    """
+    Return the flattened copy of a command when flattening is enabled and it
+    is up to date, else the script itself.
+    """
+    if get_settings("ENABLE_FLATTEN"):
+        return get_runnable_file(commands_dir, command_file)
+    return command_file
+
+def exit_status(returncode):
+    """
+    Map a subprocess return code to an exit status, 128 + N for signal N like the shell.
+    """
+    return returncode if returncode >= 0 else 128 - returncode
+
+def returncode_from_status(status):
+    """
+    Map a wait status to a return code, -N for signal N like subprocess.
+    """
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+def wait_process(process, on_interrupt=None):
+    """
+    Wait for a child process and collect its resource usage.
+
+    Like a shell, mcmd keeps waiting when Ctrl-C is pressed: the child gets
+    the SIGINT too and decides whether to exit. on_interrupt is called on
+    Ctrl-C for children that do not share mcmd's process group.
+
+    Returns:
+        tuple: (return code, resource usage from os.wait4).
+    """
+    while True:
+        try:
+            _, status, usage = os.wait4(process.pid, 0)
+            break
+        except KeyboardInterrupt:
+            if on_interrupt:
+                on_interrupt()
+            continue
+    process.returncode = returncode_from_status(status)
+    return process.returncode, usage
+
+def spawn_command(commands_dir, command_name, command_file, args, limits=None):
+    """
+    Run the script as a child, record the run in the telemetry log and
+    return its return code.
+
+    With limits (see app.limits) the script runs in its own process group
+    under those limits, else it shares mcmd's process group.
+    """
+    start = time.time()
+    started = time.perf_counter()
+    if limits is None:
+        with phase("spawn"):
+            process = subprocess.Popen([command_file] + args)
+        with phase("script"):
+            returncode, usage = wait_process(process)
+    else:
+        from app.limits import ProcessGroup
+        with phase("spawn"):
+            group = ProcessGroup([command_file] + args, limits)
+        with phase("script"):
+            returncode, usage = group.wait()
+    with phase("telemetry"):
+        record_run(commands_dir, command_name, args, start, time.perf_counter() - started, usage, returncode)
+    return returncode
+
+def replace_process(command_file, args, limits=None):
+    """
+    Replace the mcmd process with the script. Only returns if the exec fails.
+
+    The script keeps mcmd's pid, TTY and signal dispositions, its exit status
+    becomes the exit status of `mcmd exec`, and no Python interpreter stays
+    resident while it runs.
+    """
+    if limits:
+        # rlimits and niceness survive the exec, a timeout cannot be enforced without a parent
+        from app.limits import apply_limits
+        apply_limits(limits)
+    # Nothing runs after a successful exec, so report the profile now
+    report_profile()
+    sys.stdout.flush()
+    sys.stderr.flush()
+    try:
+        os.execv(command_file, [command_file] + args)
+    except OSError as e:
+        log.error(f"Error executing command '{command_file}': {e}")
+        return COMMAND_NOT_EXECUTABLE
+
+def run_command(command_name, args, replace=None, use_cache=True, capture=None, limits=None):
+    """
+    Run a custom command.
+
+    Args:
+        command_name (str): The command to run.
+        args (list): Arguments passed to the script.
+        replace (bool): Replace the mcmd process with the script instead of
+            waiting for it. Defaults to the EXEC_MODE setting.
+        use_cache (bool): Use the result cache for commands that opt in to it.
+        capture (bool): Log the command's output, None to follow its metadata
+            and the CAPTURE_OUTPUT setting.
+        limits (dict): Limits from the command line (timeout, cpu, memory_mb,
+            nice, kill_grace), overriding the ones in the command's metadata.
+
+    Returns:
+        int: The exit status of the script, for mcmd to exit with.
+    """
+    if args is None:
+        args = []
+
+    try:
+        commands_dir = get_commands_dir()
+        with phase("lookup"):
+            command_file = resolve_command(command_name, commands_dir)
+            if command_file:
+                metadata = load_metadata(commands_dir, command_name, command_file)
+                command_file = get_script_to_run(commands_dir, command_file)
+        if not command_file:
+            log.error(f"Command 'mcmd {command_name}' not found.")
+            return COMMAND_NOT_FOUND
+        if limits or metadata.get("limits"):
+            from app.limits import get_limits
+            # None when nothing is set, the script then shares mcmd's process group
+            limits = get_limits(metadata, limits) or None
+
+        if use_cache and metadata.get("cache"):
+            # Cached commands always run as a child, their output has to be captured
+            from app.result_cache import get_cache_options, run_cached
+            return exit_status(run_cached(commands_dir, command_name, command_file, args, get_cache_options(metadata), limits))
+
+        if capture is not False and (capture or metadata.get("capture") or get_settings("CAPTURE_OUTPUT")):
+            # Captured commands run as a child too, their output goes through mcmd
+            from app.output_capture import get_capture_options, run_captured
+            returncode = run_captured(commands_dir, command_name, command_file, args, get_capture_options(metadata, capture), limits)
+            if returncode != 0:
+                raise subprocess.CalledProcessError(returncode, [command_file] + args)
+            return 0
+
+        if replace is None:
+            replace = get_settings("EXEC_MODE") == "replace"
+        if replace and limits and limits.get("timeout"):
+            log.warn("A timeout needs mcmd to wait for the command, running it as a child.")
+            replace = False
+        if replace:
+            return replace_process(command_file, args, limits)
+
+        returncode = spawn_command(commands_dir, command_name, command_file, args, limits)
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, [command_file] + args)
+        return 0
+    except subprocess.CalledProcessError as e:
+        log.error(f"Error executing command '{command_name}': {e}")
+        return exit_status(e.returncode)
+    except Exception as e:
+        log.error(f"An unexpected error occurred: {e}")
+        return 1
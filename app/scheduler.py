@@ -0,0 +1,130 @@
+import time
+import queue
+import threading
+from app.log_util import Log
+from app.metadata import get_dependencies, load_metadata
+from app.roots import is_valid_command_name
+from app.runner import resolve_command, get_script_to_run, spawn_command, COMMAND_NOT_EXECUTABLE
+
+# Runs several custom commands in one invocation. Dependencies declared in the
+# commands' metadata are pulled in and ordered, independent commands run
+# concurrently up to a limit, and a failed command stops everything that
+# depends on it. Limits in a command's metadata (see app.limits) apply to it
+# here as with `mcmd exec`.
+
+log = Log()
+
+def build_graph(commands_dir, command_names):
+    """
+    Collect the commands to run and their dependencies, transitively.
+
+    Returns:
+        dict: Command name -> list of command names it depends on.
+
+    Raises:
+        ValueError: If the dependencies contain a cycle, an invalid command
+            name or invalid metadata.
+    """
+    graph = {}
+    stack = list(command_names)
+    while stack:
+        name = stack.pop()
+        if name in graph:
+            continue
+        graph[name] = get_dependencies(commands_dir, name)
+        invalid = [dep for dep in graph[name] if not is_valid_command_name(dep)]
+        if invalid:
+            # Names like '../x' would otherwise reach the command lookup as paths
+            raise ValueError(f"'depends_on' of 'mcmd {name}' lists invalid command names: {', '.join(invalid)}")
+        stack.extend(graph[name])
+
+    # Depth first search for cycles
+    visiting, visited = [], set()
+
+    def visit(name):
+        if name in visited:
+            return
+        if name in visiting:
+            cycle = visiting[visiting.index(name):] + [name]
+            raise ValueError(f"Dependency cycle: {' -> '.join(cycle)}")
+        visiting.append(name)
+        for dep in graph[name]:
+            visit(dep)
+        visiting.pop()
+        visited.add(name)
+
+    for name in sorted(graph):
+        visit(name)
+    return graph
+
+def run_process(commands_dir, name, command_file, limits, done):
+    start = time.perf_counter()
+    try:
+        returncode = spawn_command(commands_dir, name, command_file, [], limits)
+    except OSError:
+        returncode = COMMAND_NOT_EXECUTABLE
+    done.put((name, returncode, time.perf_counter() - start))
+
+def run_graph(commands_dir, graph, jobs):
+    """
+    Run every command of the graph once its dependencies succeeded.
+
+    Args:
+        commands_dir (str): The command repository.
+        graph (dict): Command name -> dependencies, from build_graph.
+        jobs (int): Maximum number of commands running at the same time.
+
+    Returns:
+        list: One dict per command with 'name', 'status' ('ok', 'failed',
+        'not found' or 'skipped'), 'returncode' and 'seconds' of wall time,
+        in the order the commands finished.
+    """
+    results = {}
+    pending = set(graph)
+    done = queue.Queue()
+    running = 0
+    order = []
+
+    def finish(name, status, returncode=None, seconds=None):
+        results[name] = {"name": name, "status": status, "returncode": returncode, "seconds": seconds}
+        order.append(name)
+
+    while pending or running:
+        # Skip every command that depends, directly or not, on a command that did not succeed
+        changed = True
+        while changed:
+            changed = False
+            for name in sorted(pending):
+                if any(dep in results and results[dep]["status"] != "ok" for dep in graph[name]):
+                    pending.discard(name)
+                    finish(name, "skipped")
+                    changed = True
+
+        ready = [name for name in sorted(pending) if all(dep in results for dep in graph[name])]
+        for name in ready[:max(jobs - running, 0)]:
+            pending.discard(name)
+            command_file = resolve_command(name, commands_dir)
+            if command_file is None:
+                finish(name, "not found")
+                continue
+            metadata = load_metadata(commands_dir, name, command_file)
+            limits = None
+            if metadata.get("limits"):
+                from app.limits import get_limits
+                try:
+                    limits = get_limits(metadata)
+                except ValueError as e:
+                    log.error(f"Invalid limits of 'mcmd {name}': {e}")
+                    finish(name, "failed", 1)
+                    continue
+            command_file = get_script_to_run(commands_dir, command_file)
+            threading.Thread(target=run_process, args=(commands_dir, name, command_file, limits, done), daemon=True).start()
+            running += 1
+
+        if running == 0:
+            continue
+        name, returncode, seconds = done.get()
+        running -= 1
+        finish(name, "ok" if returncode == 0 else "failed", returncode, seconds)
+
+    return [results[name] for name in order]
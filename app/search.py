@@ -0,0 +1,278 @@
+import os
+import re
+import json
+import math
+import time
+import bisect
+from app.repository import atomic_write
+
+# Token index for `mcmd search`. Command names and the full .desc contents are
+# split into lowercase tokens, and an inverted index from token to document
+# ids is kept in the repository's .mcmd folder. It is updated together with
+# the command index, re-reading only the .desc files of the folders that
+# changed, so a query never has to read the descriptions.
+#
+# Query terms match index tokens exactly, by prefix, or, when neither finds
+# anything, fuzzily by trigram similarity. Matches are weighted by how rare
+# the token is and by whether it appears in the command name.
+#
+# search.json holds the whole index and is only read to update it. Queries
+# read two compact files written next to it instead:
+#
+#     search.vocab   a header line, then `token<TAB>doc ids<TAB>ids of the docs
+#                    with the token in their name`, sorted by token, so prefix
+#                    lookups bisect the lines without parsing them
+#     search.docs    a header line, then `name<TAB>JSON path and excerpt` per
+#                    doc id, the JSON parsed only for the results shown
+#
+# Both headers carry the same generation, so a reader never mixes the files
+# of two writes, and the stamp of the command index they were built from.
+
+SEARCH_FILE_NAME = "search.json"
+VOCAB_FILE_NAME = "search.vocab"
+DOCS_FILE_NAME = "search.docs"
+SEARCH_FILE_NAMES = (SEARCH_FILE_NAME, VOCAB_FILE_NAME, DOCS_FILE_NAME)
+SEARCH_VERSION = 2
+READ_ATTEMPTS = 3
+EXCERPT_LENGTH = 120
+
+EXACT_WEIGHT = 3.0
+PREFIX_WEIGHT = 2.0
+FUZZY_WEIGHT = 1.0
+NAME_BONUS = 2.0
+FUZZY_THRESHOLD = 0.5
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+def trigrams(token):
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def get_search_file(state_dir):
+    return os.path.join(state_dir, SEARCH_FILE_NAME)
+
+def empty_search_index():
+    # "free" lists the slots of removed commands, reused before "docs" grows
+    return {"version": SEARCH_VERSION, "docs": [], "free": [], "postings": {}}
+
+def read_search_index(state_dir):
+    try:
+        with open(get_search_file(state_dir), 'r') as file:
+            search_index = json.load(file)
+        if search_index.get("version") == SEARCH_VERSION:
+            # Written before free slots were tracked
+            search_index.setdefault("free", [doc_id for doc_id, doc in enumerate(search_index["docs"]) if doc is None])
+            return search_index
+    except (FileNotFoundError, json.JSONDecodeError):
+        pass
+    return None
+
+def make_document(commands_dir, item):
+    if "text" in item:
+        # Full description handed over by a storage backend without .desc files
+        description = item["text"]
+    else:
+        desc_file = os.path.join(commands_dir, os.path.dirname(item["path"]), f"{item['name']}.desc")
+        try:
+            with open(desc_file, 'r') as file:
+                description = file.read()
+        except (FileNotFoundError, UnicodeDecodeError):
+            description = ""
+    name_tokens = sorted(set(tokenize(item["name"])) | {item["name"].lower()})
+    tokens = sorted(set(tokenize(description)) | set(name_tokens))
+    excerpt = " ".join(description.split())
+    if len(excerpt) > EXCERPT_LENGTH:
+        excerpt = excerpt[:EXCERPT_LENGTH] + "..."
+    return {"name": item["name"], "path": item["path"], "name_tokens": name_tokens, "tokens": tokens, "excerpt": excerpt}
+
+def remove_document(search_index, doc_id):
+    for token in search_index["docs"][doc_id]["tokens"]:
+        postings = search_index["postings"].get(token)
+        if postings is not None:
+            postings.remove(doc_id)
+            if not postings:
+                del search_index["postings"][token]
+    search_index["docs"][doc_id] = None
+    search_index["free"].append(doc_id)
+
+def add_document(search_index, document):
+    docs, free = search_index["docs"], search_index["free"]
+    # Reuse the slot of a removed command before growing the list
+    if free:
+        doc_id = free.pop()
+        docs[doc_id] = document
+    else:
+        doc_id = len(docs)
+        docs.append(document)
+    for token in document["tokens"]:
+        search_index["postings"].setdefault(token, []).append(doc_id)
+
+def update_search_index(commands_dir, state_dir, commands, changed_folders=None, stamp=None):
+    """
+    Bring the search index in line with the command index.
+
+    Args:
+        commands_dir (str): The command repository.
+        state_dir (str): Folder holding the search index.
+        commands (list): All indexed commands.
+        changed_folders (iterable): Top-level folders whose commands must be
+            re-read. None, or a missing search index, re-reads everything.
+        stamp (str): Stamp of the command index the commands come from, see
+            index.get_current_stamp, None if it has none.
+    """
+    search_index = read_search_index(state_dir)
+    if search_index is None or changed_folders is None:
+        search_index = empty_search_index()
+        changed_folders = None
+    else:
+        changed_folders = set(changed_folders)
+
+    current = {item["path"]: item for item in commands}
+    known = {doc["path"]: doc_id for doc_id, doc in enumerate(search_index["docs"]) if doc}
+
+    for path, doc_id in known.items():
+        if path not in current or path.split(os.sep)[0] in changed_folders:
+            remove_document(search_index, doc_id)
+    for path, item in current.items():
+        if changed_folders is None or path not in known or path.split(os.sep)[0] in changed_folders:
+            add_document(search_index, make_document(commands_dir, item))
+
+    write_query_files(state_dir, search_index, stamp)
+    atomic_write(get_search_file(state_dir), json.dumps(search_index))
+
+def write_query_files(state_dir, search_index, stamp):
+    docs = search_index["docs"]
+    header = json.dumps({
+        "version": SEARCH_VERSION,
+        "generation": f"{os.getpid()}-{time.time_ns()}",
+        "stamp": stamp,
+        "total": sum(1 for doc in docs if doc),
+    })
+    lines = [header]
+    for doc in docs:
+        # Removed commands leave an empty line, no posting refers to it
+        lines.append(f"{doc['name']}\t{json.dumps({'path': doc['path'], 'excerpt': doc['excerpt']})}" if doc else "")
+    atomic_write(os.path.join(state_dir, DOCS_FILE_NAME), "\n".join(lines))
+    lines = [header]
+    for token in sorted(search_index["postings"]):
+        doc_ids = search_index["postings"][token]
+        name_ids = [doc_id for doc_id in doc_ids if token in docs[doc_id]["name_tokens"]]
+        lines.append(f"{token}\t{','.join(map(str, doc_ids))}\t{','.join(map(str, name_ids))}")
+    atomic_write(os.path.join(state_dir, VOCAB_FILE_NAME), "\n".join(lines))
+
+def read_header(path):
+    try:
+        with open(path, 'r') as file:
+            header = json.loads(file.readline())
+    except (FileNotFoundError, ValueError):
+        return None
+    return header if header.get("version") == SEARCH_VERSION else None
+
+def get_search_stamp(state_dir):
+    """
+    Return the stamp of the command index the search index was built from, or None.
+    """
+    header = read_header(os.path.join(state_dir, VOCAB_FILE_NAME))
+    return header and header["stamp"]
+
+def read_query_files(state_dir):
+    """
+    Returns:
+        tuple: (header, vocabulary lines, document lines), where line 0 of
+        both lists is the header, or None if there is no search index yet.
+    """
+    for _ in range(READ_ATTEMPTS):
+        try:
+            with open(os.path.join(state_dir, VOCAB_FILE_NAME), 'r') as file:
+                vocabulary = file.read().split("\n")
+            with open(os.path.join(state_dir, DOCS_FILE_NAME), 'r') as file:
+                docs = file.read().split("\n")
+            header = json.loads(vocabulary[0])
+            if header.get("version") != SEARCH_VERSION:
+                return None
+            if json.loads(docs[0])["generation"] == header["generation"]:
+                return header, vocabulary, docs
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+        # Caught between the two renames of a writer, read again
+        time.sleep(0.01)
+    return None
+
+def match_tokens(term, vocabulary):
+    """
+    Return {index token: (weight, line)} for the tokens a query term matches.
+
+    Args:
+        vocabulary (list): Sorted search.vocab lines, after the header at 0.
+    """
+    matches = {}
+    position = bisect.bisect_left(vocabulary, term, 1)
+    # The tab sorts before any token character, so "ab<TAB>" comes before "abc<TAB>"
+    while position < len(vocabulary) and vocabulary[position].startswith(term):
+        line = vocabulary[position]
+        token = line[:line.index("\t")]
+        matches[token] = (EXACT_WEIGHT if token == term else PREFIX_WEIGHT, line)
+        position += 1
+    if matches or len(term) < 3:
+        return matches
+
+    term_trigrams = trigrams(term)
+    for line in vocabulary[1:]:
+        token = line[:line.index("\t")]
+        if abs(len(token) - len(term)) > 2:
+            continue
+        token_trigrams = trigrams(token)
+        similarity = len(term_trigrams & token_trigrams) / len(term_trigrams | token_trigrams)
+        if similarity >= FUZZY_THRESHOLD:
+            matches[token] = (FUZZY_WEIGHT * similarity, line)
+    return matches
+
+def search(state_dir, query, limit=20):
+    """
+    Rank the commands matching a query.
+
+    Returns:
+        list: Dicts with name, path, excerpt and score, best match first.
+        None if there is no search index yet.
+    """
+    query_files = read_query_files(state_dir)
+    if query_files is None:
+        return None
+    header, vocabulary, doc_lines = query_files
+    total = max(header["total"], 1)
+
+    def parse_ids(ids):
+        return [int(doc_id) for doc_id in ids.split(",")] if ids else []
+
+    scores = {}
+    terms = tokenize(query)
+    for term in terms:
+        term_scores = {}
+        for token, (weight, line) in match_tokens(term, vocabulary).items():
+            _, doc_ids, name_ids = line.split("\t")
+            doc_ids, name_ids = parse_ids(doc_ids), set(parse_ids(name_ids))
+            idf = math.log(1 + total / len(doc_ids))
+            for doc_id in doc_ids:
+                score = weight * idf
+                if doc_id in name_ids:
+                    score *= NAME_BONUS
+                term_scores[doc_id] = max(term_scores.get(doc_id, 0.0), score)
+        for doc_id, score in term_scores.items():
+            scores[doc_id] = scores.get(doc_id, 0.0) + score
+
+    query_name = "_".join(terms)
+    ranked = []
+    for doc_id, score in scores.items():
+        # Line 0 is the header
+        name, doc = doc_lines[doc_id + 1].split("\t", 1)
+        if name.lower() == query_name:
+            score *= 2
+        ranked.append((-round(score, 3), name, doc))
+    results = []
+    for score, name, doc in sorted(ranked)[:limit]:
+        doc = json.loads(doc)
+        results.append({"name": name, "path": doc["path"], "excerpt": doc["excerpt"], "score": -score})
+    return results
@@ -1,6 +1,8 @@
 import os
 import json
 from app.log_util import Log
+from app.repository import write_lock
+from app.settings_store import MCMD_COMMANDS_DIR, get_settings, get_all_settings, save_settings, coerce_setting, read_settings_file, write_settings_file, SETTINGS_SCHEMA
 import typer
 from rich.table import Table
 from rich.console import Console
@@ -9,42 +11,6 @@ app = typer.Typer()
 log = Log()
 console = Console()
 
-MCMD_COMMANDS_DIR = os.path.expanduser("~/.mcmd_commands")
-
-def get_settings(setting, path=MCMD_COMMANDS_DIR):
-    settings = get_all_settings(path)
-    keys = setting.split('.')
-    value = settings
-    
-    for key in keys:
-        value = value.get(key)
-        if value is None:
-            raise KeyError(f"Setting '{setting}' not found.")
-    
-    # Extract and return only the 'value' field from the settings dictionary
-    if isinstance(value, dict) and 'value' in value:
-        return value['value']
-    else:
-        raise ValueError(f"Setting '{setting}' does not have a 'value' field.")
-
-def get_all_settings(path=MCMD_COMMANDS_DIR):
-    setting_file = os.path.expanduser(path + '/settings.json')
-    try:
-        with open(setting_file, 'r') as file:
-            settings = json.load(file)
-            return settings
-    except FileNotFoundError:
-        log.error(f"{setting_file} not found.")
-        raise Exception("settings.json not found.")
-    except json.JSONDecodeError:
-        log.error("Error decoding JSON in settings file.")
-        raise Exception("Error decoding JSON in settings file.")
-
-def save_settings(settings):
-    setting_file =  MCMD_COMMANDS_DIR+'/settings.json'
-    with open(setting_file, 'w') as file:
-        json.dump(settings, file, indent=4)
-
 @app.command()
 def list():
     """List all settings"""
@@ -65,27 +31,38 @@ def list():
 @app.command()
 def edit(key: str, value: str):
     """Edit an existing setting"""
-    settings = get_all_settings()
-    keys = key.split('.')
-    
-    # Navigate to the right place in the dictionary
-    d = settings
-    for k in keys[:-1]:
-        if k not in d:
-            log.info(f"Setting '{key}' does not exist.")
-            return
-        d = d[k]
-    
-    # Update only the 'value' field if the setting exists and is a dictionary
-    if keys[-1] in d:
-        if isinstance(d[keys[-1]], dict):
-            d[keys[-1]]['value'] = value
-            save_settings(settings)
-            log.info(f"Setting '{key}' updated to '{value}'")
+    # Read and written under the repository lock, so concurrent edits are not lost
+    with write_lock(os.path.expanduser(MCMD_COMMANDS_DIR)):
+        settings = get_all_settings()
+        keys = key.split('.')
+
+        # Settings added after settings.json was installed can still be set
+        if key in SETTINGS_SCHEMA and key not in settings:
+            settings[key] = {"value": SETTINGS_SCHEMA[key]["default"], "description": SETTINGS_SCHEMA[key]["description"]}
+
+        # Navigate to the right place in the dictionary
+        d = settings
+        for k in keys[:-1]:
+            if k not in d:
+                log.info(f"Setting '{key}' does not exist.")
+                return
+            d = d[k]
+
+        # Update only the 'value' field if the setting exists and is a dictionary
+        if keys[-1] in d:
+            if isinstance(d[keys[-1]], dict):
+                try:
+                    value = coerce_setting(key, value)
+                except ValueError as e:
+                    log.error(str(e))
+                    return
+                d[keys[-1]]['value'] = value
+                save_settings(settings)
+                log.info(f"Setting '{key}' updated to '{value}'")
+            else:
+                log.info(f"Setting '{key}' is not a dictionary and cannot be updated.")
         else:
-            log.info(f"Setting '{key}' is not a dictionary and cannot be updated.")
-    else:
-        log.info(f"Setting '{key}' does not exist.")
+            log.info(f"Setting '{key}' does not exist.")
 
 def compare_and_update_settings(old_path: str, new_path: str):
     """
@@ -103,8 +80,7 @@ def compare_and_update_settings(old_path: str, new_path: str):
     # Load old settings
     old_settings = {}
     try:
-        with open(old_path, 'r') as file:
-            old_settings = json.load(file)
+        old_settings = read_settings_file(old_path)
     except FileNotFoundError:
         log.error(f"Old settings file '{old_path}' not found.")
     except json.JSONDecodeError:
@@ -113,8 +89,7 @@ def compare_and_update_settings(old_path: str, new_path: str):
 
     # Load new settings
     try:
-        with open(new_path, 'r') as file:
-            new_settings = json.load(file)
+        new_settings = read_settings_file(new_path)
     except FileNotFoundError:
         log.error(f"New settings file '{new_path}' not found.")
         raise Exception(f"New settings file '{new_path}' not found.")
@@ -130,12 +105,11 @@ def compare_and_update_settings(old_path: str, new_path: str):
         return
     
     # Update old settings with new settings
-    old_settings.update(settings_to_add)
+    old_settings = dict(old_settings, **settings_to_add)
     
     # Save the updated old settings
     try:
-        with open(old_path, 'w') as file:
-            json.dump(old_settings, file, indent=4)
+        write_settings_file(old_path, old_settings)
         log.info(f"Old settings file '{old_path}' updated with new settings.")
     except IOError:
         log.error(f"Error writing to old settings file '{old_path}'.")
@@ -0,0 +1,226 @@
+import os
+import json
+from app.log_util import Log
+from app.profiling import phase
+
+log = Log()
+
+MCMD_COMMANDS_DIR = os.path.expanduser("~/.mcmd_commands")
+
+# Type and default of every known setting. Values are validated and converted
+# when settings.json is loaded, so callers get real bools and ints back, and
+# settings missing from an older settings.json fall back to the default.
+SETTINGS_SCHEMA = {
+    "MCMD_COMMANDS_DIR": {
+        "type": str, "default": "~/.mcmd_commands",
+        "description": "Command repository folder",
+    },
+    "MCMD_EXPORT_DIR": {
+        "type": str, "default": "",
+        "description": "Commands will be exported by default to this folder",
+    },
+    "ENABLE_AUTO_EXPORT": {
+        "type": bool, "default": False,
+        "description": "Commands will be exported automatically on create",
+    },
+    "EXPORT_PRUNE": {
+        "type": bool, "default": False,
+        "description": "Export removes previously exported commands that no longer exist",
+    },
+    "COPY_WORKERS": {
+        "type": int, "default": 8,
+        "description": "Number of threads used to copy files on export and import",
+    },
+    "RESULT_CACHE_MAX_MB": {
+        "type": int, "default": 256,
+        "description": "Maximum size of the result cache of commands that opt in to caching",
+    },
+    "ENABLE_TELEMETRY": {
+        "type": bool, "default": True,
+        "description": "Record the duration, resource usage and exit code of every run for 'mcmd stats'",
+    },
+    "TELEMETRY_MAX_MB": {
+        "type": int, "default": 10,
+        "description": "Size at which the telemetry log is rotated",
+    },
+    "DAEMON_IDLE_TIMEOUT": {
+        "type": int, "default": 1800,
+        "description": "Seconds without requests after which 'mcmd daemon' shuts itself down",
+    },
+    "EXEC_MODE": {
+        "type": str, "default": "subprocess", "choices": ("subprocess", "replace"),
+        "description": "How exec runs commands: 'subprocess' waits for the script, 'replace' replaces mcmd with the script",
+    },
+    "MCMD_COMMAND_ROOTS": {
+        "type": str, "default": "",
+        "description": "More command folders, separated by ':', looked up after MCMD_COMMANDS_DIR; earlier ones shadow later ones",
+    },
+    "CAPTURE_OUTPUT": {
+        "type": bool, "default": False,
+        "description": "Log the output of every executed command under .mcmd/logs",
+    },
+    "CAPTURE_LOG_MAX_MB": {
+        "type": int, "default": 10,
+        "description": "Size at which a command's output log is rotated into a gzip file",
+    },
+    "CAPTURE_LOG_KEEP": {
+        "type": int, "default": 5,
+        "description": "Number of rotated output logs kept per command",
+    },
+    "STORAGE_BACKEND": {
+        "type": str, "default": "files", "choices": ("files", "sqlite"),
+        "description": "Where commands are kept: 'files' for one folder per command, 'sqlite' for a single database file",
+    },
+    "ENABLE_FLATTEN": {
+        "type": bool, "default": True,
+        "description": "Inline repository helpers sourced by a command into a self-contained <name>.flat.sh and run that",
+    },
+}
+
+TRUE_VALUES = ("true", "yes", "y", "1", "on")
+FALSE_VALUES = ("false", "no", "n", "0", "off", "")
+
+# settings.json loaded in this process: path -> (mtime_ns, size, settings)
+_settings_cache = {}
+
+def coerce_setting(setting, value):
+    """
+    Convert a setting value to the type declared in SETTINGS_SCHEMA.
+
+    Args:
+        setting (str): The setting key.
+        value: The raw value, e.g. a string given to `mcmd setting edit`.
+
+    Returns:
+        The converted value. Settings without a schema are returned unchanged.
+
+    Raises:
+        ValueError: If the value cannot be converted to the declared type.
+    """
+    schema = SETTINGS_SCHEMA.get(setting)
+    if schema is None or value is None:
+        return value
+    expected = schema["type"]
+
+    if expected is bool:
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, str) and value.strip().lower() in TRUE_VALUES:
+            return True
+        if isinstance(value, str) and value.strip().lower() in FALSE_VALUES:
+            return False
+    elif expected is int:
+        if isinstance(value, int) and not isinstance(value, bool):
+            return value
+        if isinstance(value, str):
+            try:
+                return int(value.strip())
+            except ValueError:
+                pass
+    elif isinstance(value, expected):
+        choices = schema.get("choices")
+        if not choices or value in choices:
+            return value
+        raise ValueError(f"Setting '{setting}' expects one of {', '.join(choices)}, got '{value}'.")
+
+    raise ValueError(f"Setting '{setting}' expects a value of type {expected.__name__}, got '{value}'.")
+
+def validate_settings(settings):
+    for key, schema in SETTINGS_SCHEMA.items():
+        entry = settings.get(key)
+        if isinstance(entry, dict) and 'value' in entry:
+            entry['value'] = coerce_setting(key, entry['value'])
+    return settings
+
+def read_settings_file(setting_file):
+    """
+    Load and validate a settings file, reusing the copy cached in this process
+    as long as the file's mtime and size are unchanged.
+
+    Raises:
+        FileNotFoundError: If the file does not exist.
+        json.JSONDecodeError: If the file is not valid JSON.
+        ValueError: If a value does not match SETTINGS_SCHEMA.
+    """
+    stat = os.stat(setting_file)
+    cached = _settings_cache.get(setting_file)
+    if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+        return cached[2]
+
+    with open(setting_file, 'r') as file:
+        settings = validate_settings(json.load(file))
+    _settings_cache[setting_file] = (stat.st_mtime_ns, stat.st_size, settings)
+    return settings
+
+def write_settings_file(setting_file, settings):
+    """
+    Validate and save a settings file, replacing it atomically and updating the cache.
+    """
+    from app.repository import atomic_write
+
+    settings = validate_settings(settings)
+    atomic_write(setting_file, json.dumps(settings, indent=4))
+
+    stat = os.stat(setting_file)
+    _settings_cache[setting_file] = (stat.st_mtime_ns, stat.st_size, json.loads(json.dumps(settings)))
+
+def get_settings(setting, path=MCMD_COMMANDS_DIR):
+    settings = load_settings(path)
+    keys = setting.split('.')
+    value = settings
+    
+    for key in keys:
+        value = value.get(key)
+        if value is None:
+            if setting in SETTINGS_SCHEMA:
+                return SETTINGS_SCHEMA[setting]["default"]
+            raise KeyError(f"Setting '{setting}' not found.")
+    
+    # Extract and return only the 'value' field from the settings dictionary
+    if isinstance(value, dict) and 'value' in value:
+        return value['value']
+    else:
+        raise ValueError(f"Setting '{setting}' does not have a 'value' field.")
+
+def load_settings(path=MCMD_COMMANDS_DIR):
+    setting_file = os.path.expanduser(path + '/settings.json')
+    try:
+        with phase("settings"):
+            return read_settings_file(setting_file)
+    except FileNotFoundError:
+        log.error(f"{setting_file} not found.")
+        raise Exception("settings.json not found.")
+    except json.JSONDecodeError:
+        log.error("Error decoding JSON in settings file.")
+        raise Exception("Error decoding JSON in settings file.")
+    except ValueError as e:
+        log.error(f"Invalid value in {setting_file}: {e}")
+        raise Exception(f"Invalid value in settings file: {e}")
+
+def get_all_settings(path=MCMD_COMMANDS_DIR):
+    # Return a copy, the cached settings must only change through save_settings
+    return json.loads(json.dumps(load_settings(path)))
+
+def save_settings(settings, path=MCMD_COMMANDS_DIR):
+    from app.repository import write_lock
+
+    setting_file = os.path.expanduser(path + '/settings.json')
+    with write_lock(os.path.expanduser(path)):
+        write_settings_file(setting_file, settings)
+
+def set_setting(setting, value, path=MCMD_COMMANDS_DIR):
+    """
+    Change the value of a top-level setting, adding it from SETTINGS_SCHEMA if missing.
+
+    Raises:
+        ValueError: If the value does not match SETTINGS_SCHEMA.
+    """
+    from app.repository import write_lock
+
+    # Read and written under the lock, so concurrent changes are not lost
+    with write_lock(os.path.expanduser(path)):
+        settings = get_all_settings(path)
+        if setting not in settings:
+            settings[setting] = {"value": None, "description": SETTINGS_SCHEMA[setting]["description"]}
+        settings[setting]["value"] = coerce_setting(setting, value)
+        save_settings(settings, path)
@@ -0,0 +1,418 @@
+import os
+import json
+import time
+import shutil
+from app.settings_store import get_settings
+from app.index import get_state_dir, get_commands, iter_commands, update_index, load_index, rebuild_index, make_stamp, DESCRIPTION_EXCERPT_LENGTH
+from app.roots import get_roots_stamp, get_root_commands
+from app.metadata import get_metadata_file
+from app.flatten import get_flat_file
+from app.repository import atomic_write
+
+# Where commands are kept, selected by the STORAGE_BACKEND setting.
+#
+# "files" is the original layout, one `<name>/` folder per command holding
+# `<name>.sh`, `<name>.desc` and an optional `<name>.meta`. "sqlite" packs the
+# scripts, descriptions and metadata of all commands into a single
+# `.mcmd/commands.db` file, which saves the per-file round trips of network
+# home directories and containers. Helpers and other files stay in folders
+# with either backend.
+#
+# The database uses the default rollback journal, so every committed change
+# updates its mtime. `mcmd exec` relies on that: a command is run from a
+# materialized copy under `.mcmd/packed/`, stamped with the mtime of the
+# database, and only read again from SQLite when the database changed.
+#
+# sqlite3 is imported lazily, this module is reachable from the exec fast path.
+
+DATABASE_NAME = "commands.db"
+PACKED_DIR_NAME = "packed"
+STORAGE_BACKENDS = ("files", "sqlite")
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS commands (
+    name TEXT PRIMARY KEY,
+    script TEXT NOT NULL,
+    description TEXT,
+    meta TEXT,
+    mtime INTEGER NOT NULL
+)
+"""
+
+def get_database_file(commands_dir):
+    return os.path.join(get_state_dir(commands_dir), DATABASE_NAME)
+
+def get_packed_dir(commands_dir):
+    return os.path.join(get_state_dir(commands_dir), PACKED_DIR_NAME)
+
+def write_file(path, content, mode=None):
+    """
+    Atomically replace a file, leaving it untouched if the content is the same.
+
+    Returns:
+        bool: True if the file was written.
+    """
+    try:
+        with open(path, 'r') as file:
+            if file.read() == content:
+                if mode is not None and os.stat(path).st_mode & 0o777 != mode:
+                    os.chmod(path, mode)
+                return False
+    except (FileNotFoundError, UnicodeDecodeError):
+        pass
+    atomic_write(path, content, mode)
+    return True
+
+def remove_empty_parents(path, commands_dir):
+    while path != commands_dir and os.path.isdir(path) and not os.listdir(path):
+        os.rmdir(path)
+        path = os.path.dirname(path)
+
+class FileStorage:
+    """
+    Commands kept as `<name>/<name>.sh`, `.desc` and `.meta` files.
+    """
+    backend = "files"
+
+    def __init__(self, commands_dir):
+        self.commands_dir = commands_dir
+
+    def command_dir(self, name):
+        return os.path.join(self.commands_dir, name)
+
+    def command_file(self, name):
+        return os.path.join(self.commands_dir, name, f"{name}.sh")
+
+    def names(self):
+        """
+        Return the commands stored in the `<name>/<name>.sh` layout.
+        """
+        if not os.path.exists(self.commands_dir):
+            return []
+        with os.scandir(self.commands_dir) as entries:
+            return sorted(entry.name for entry in entries
+                          if not entry.name.startswith('.') and os.path.isfile(self.command_file(entry.name)))
+
+    def iter_commands(self):
+        return iter_commands(self.commands_dir)
+
+    def get_commands(self):
+        return get_commands(self.commands_dir)
+
+    def read(self, name):
+        """
+        Returns:
+            dict: name, script, description and meta (dict), or None if the command does not exist.
+        """
+        try:
+            with open(self.command_file(name), 'r') as file:
+                script = file.read()
+        except FileNotFoundError:
+            return None
+        try:
+            with open(os.path.join(self.command_dir(name), f"{name}.desc"), 'r') as file:
+                description = file.read().strip()
+        except FileNotFoundError:
+            description = None
+        meta_file = get_metadata_file(self.commands_dir, name)
+        meta = None
+        if os.path.exists(meta_file):
+            with open(meta_file, 'r') as file:
+                meta = json.load(file)
+        return {"name": name, "script": script, "description": description, "meta": meta}
+
+    def write(self, name, script=None, description=None, meta=None):
+        """
+        Create or update a command. Parts given as None are left as they are.
+
+        Returns:
+            bool: True if anything changed.
+        """
+        os.makedirs(self.command_dir(name), exist_ok=True)
+        changed = False
+        if script is not None:
+            changed |= write_file(self.command_file(name), script, 0o755)
+        if description is not None:
+            changed |= write_file(os.path.join(self.command_dir(name), f"{name}.desc"), description.strip() + "\n")
+        if meta is not None:
+            changed |= write_file(get_metadata_file(self.commands_dir, name), json.dumps(meta, indent=4) + "\n")
+        return changed
+
+    def write_many(self, commands):
+        """
+        Create or update several commands, given as dicts with the arguments of write.
+
+        Returns:
+            list: The names of the commands that changed.
+        """
+        return [command["name"] for command in commands
+                if self.write(command["name"], command.get("script"), command.get("description"), command.get("meta"))]
+
+    def delete(self, name, path=None):
+        """
+        Remove a command, by default the `<name>/<name>.sh` one, or the script
+        at path (relative to the repository) for commands in nested folders.
+        """
+        command_file = os.path.join(self.commands_dir, path) if path else self.command_file(name)
+        if not os.path.exists(command_file):
+            return False
+        command_dir = os.path.dirname(command_file)
+        for file in (command_file, get_flat_file(command_file),
+                     os.path.join(command_dir, f"{name}.desc"), os.path.join(command_dir, f"{name}.meta")):
+            if os.path.exists(file):
+                os.remove(file)
+        remove_empty_parents(command_dir, self.commands_dir)
+        return True
+
+    def refresh_index(self, names=None):
+        """
+        Bring the index and the files derived from it up to date, after the
+        given commands changed or, with no names, after anything changed.
+        """
+        if names is None:
+            load_index(self.commands_dir)
+        else:
+            update_index(self.commands_dir, names)
+
+    def rebuild_index(self):
+        rebuild_index(self.commands_dir)
+
+class SqliteStorage:
+    """
+    Commands packed into one SQLite database.
+    """
+    backend = "sqlite"
+
+    def __init__(self, commands_dir, database_file=None):
+        self.commands_dir = commands_dir
+        self.database_file = database_file or get_database_file(commands_dir)
+
+    def connect(self):
+        import sqlite3
+        os.makedirs(os.path.dirname(self.database_file), exist_ok=True)
+        connection = sqlite3.connect(self.database_file)
+        if connection.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            with connection:
+                connection.execute(SCHEMA)
+                connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        return connection
+
+    def names(self):
+        if not os.path.exists(self.database_file):
+            return []
+        connection = self.connect()
+        try:
+            return [row[0] for row in connection.execute("SELECT name FROM commands ORDER BY name")]
+        finally:
+            connection.close()
+
+    def iter_commands(self):
+        """
+        Yield the commands like index.iter_commands, reading only the start of
+        each description.
+        """
+        if not os.path.exists(self.database_file):
+            return
+        connection = self.connect()
+        try:
+            rows = connection.execute(
+                "SELECT name, substr(description, 1, ?), length(description), mtime, length(CAST(script AS BLOB)) "
+                "FROM commands ORDER BY name", (DESCRIPTION_EXCERPT_LENGTH + 1,))
+            for name, description, length, mtime, size in rows:
+                if description is not None and length > DESCRIPTION_EXCERPT_LENGTH:
+                    description = description[:DESCRIPTION_EXCERPT_LENGTH] + "..."
+                yield {"name": name, "path": f"{name}/{name}.sh", "description": description, "mtime": mtime, "size": size}
+        finally:
+            connection.close()
+
+    def get_commands(self):
+        return list(self.iter_commands())
+
+    def read(self, name):
+        if not os.path.exists(self.database_file):
+            return None
+        connection = self.connect()
+        try:
+            row = connection.execute("SELECT script, description, meta FROM commands WHERE name = ?", (name,)).fetchone()
+        finally:
+            connection.close()
+        if row is None:
+            return None
+        return {"name": name, "script": row[0], "description": row[1], "meta": json.loads(row[2]) if row[2] else None}
+
+    def write(self, name, script=None, description=None, meta=None):
+        return bool(self.write_many([{"name": name, "script": script, "description": description, "meta": meta}]))
+
+    def write_many(self, commands):
+        """
+        Create or update several commands in one transaction.
+
+        Returns:
+            list: The names of the commands that changed.
+        """
+        connection = self.connect()
+        changed = []
+        try:
+            with connection:
+                for command in commands:
+                    row = connection.execute("SELECT script, description, meta FROM commands WHERE name = ?",
+                                             (command["name"],)).fetchone()
+                    script, description, meta = row or (None, None, None)
+                    if command.get("script") is not None:
+                        script = command["script"]
+                    if command.get("description") is not None:
+                        description = command["description"].strip()
+                    if command.get("meta") is not None:
+                        meta = json.dumps(command["meta"])
+                    if script is None:
+                        raise ValueError(f"Command '{command['name']}' has no script.")
+                    if row is not None and (script, description, meta) == tuple(row):
+                        continue
+                    connection.execute("INSERT OR REPLACE INTO commands (name, script, description, meta, mtime) VALUES (?, ?, ?, ?, ?)",
+                                       (command["name"], script, description, meta, time.time_ns()))
+                    changed.append(command["name"])
+        finally:
+            connection.close()
+        return changed
+
+    def delete(self, name, path=None):
+        if not os.path.exists(self.database_file):
+            return False
+        connection = self.connect()
+        try:
+            with connection:
+                deleted = connection.execute("DELETE FROM commands WHERE name = ?", (name,)).rowcount
+        finally:
+            connection.close()
+        shutil.rmtree(os.path.join(get_packed_dir(self.commands_dir), name), ignore_errors=True)
+        return deleted > 0
+
+    def snapshot(self, destination_file):
+        """
+        Write a consistent copy of the database, e.g. for export.
+        """
+        import sqlite3
+        connection = self.connect()
+        target = sqlite3.connect(f"{destination_file}.{os.getpid()}.tmp")
+        try:
+            connection.backup(target)
+        finally:
+            target.close()
+            connection.close()
+        os.replace(f"{destination_file}.{os.getpid()}.tmp", destination_file)
+
+    def refresh_index(self, names=None):
+        """
+        Regenerate the completion list and search index when the database or
+        the extra roots changed since they were written.
+        """
+        from app.completion import COMPLETION_FILE_NAME, write_completion_cache
+        from app.search import get_search_stamp, update_search_index
+        state_dir = get_state_dir(self.commands_dir)
+        completion_file = os.path.join(state_dir, COMPLETION_FILE_NAME)
+        # The database has no root mtime to go by, only the roots are stamped
+        stamp = make_stamp(None, get_roots_stamp(self.commands_dir))
+        try:
+            if (os.stat(completion_file).st_mtime_ns >= os.stat(self.database_file).st_mtime_ns
+                    and get_search_stamp(state_dir) == stamp):
+                return
+        except FileNotFoundError:
+            pass
+        commands = self.get_commands()
+        descriptions = self.read_descriptions()
+        for item in commands:
+            item["text"] = descriptions.get(item["name"]) or ""
+        commands += get_root_commands(self.commands_dir, {item["name"] for item in commands}, full_check=False)
+        write_completion_cache(state_dir, commands)
+        update_search_index(self.commands_dir, state_dir, commands, stamp=stamp)
+
+    def rebuild_index(self):
+        self.refresh_index()
+
+    def read_descriptions(self):
+        if not os.path.exists(self.database_file):
+            return {}
+        connection = self.connect()
+        try:
+            return dict(connection.execute("SELECT name, description FROM commands"))
+        finally:
+            connection.close()
+
+def get_storage(commands_dir, backend=None):
+    """
+    Return the storage of the command repository, by default the one chosen
+    by the STORAGE_BACKEND setting.
+    """
+    if backend is None:
+        backend = get_settings("STORAGE_BACKEND")
+    if backend == "sqlite":
+        return SqliteStorage(commands_dir)
+    return FileStorage(commands_dir)
+
+def resolve_packed_command(commands_dir, command_name):
+    """
+    Return a runnable copy of a command stored in the database, refreshing it
+    only when the database changed, or None if the command does not exist.
+    """
+    database_file = get_database_file(commands_dir)
+    try:
+        database_mtime = os.stat(database_file).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    packed_dir = os.path.join(get_packed_dir(commands_dir), command_name)
+    packed_file = os.path.join(packed_dir, f"{command_name}.sh")
+    try:
+        if os.stat(packed_file).st_mtime_ns == database_mtime:
+            return packed_file
+    except FileNotFoundError:
+        pass
+
+    command = SqliteStorage(commands_dir).read(command_name)
+    if command is None:
+        shutil.rmtree(packed_dir, ignore_errors=True)
+        return None
+    os.makedirs(packed_dir, exist_ok=True)
+    meta_file = os.path.join(packed_dir, f"{command_name}.meta")
+    if command["meta"] is not None:
+        write_file(meta_file, json.dumps(command["meta"]))
+    elif os.path.exists(meta_file):
+        os.remove(meta_file)
+    write_file(packed_file, command["script"], 0o755)
+    # Stamped with the mtime read before the query, a change made meanwhile is picked up next time
+    os.utime(packed_file, ns=(database_mtime, database_mtime))
+    return packed_file
+
+def migrate(commands_dir, target):
+    """
+    Move every command to the target backend. Commands are copied and read
+    back before they are removed from the source.
+
+    Returns:
+        list: The names of the migrated commands.
+    """
+    source = get_storage(commands_dir, "files" if target == "sqlite" else "sqlite")
+    destination = get_storage(commands_dir, target)
+    commands = [source.read(name) for name in source.names()]
+    commands = [command for command in commands if command is not None]
+
+    if target == "sqlite":
+        destination.write_many(commands)
+    else:
+        for command in commands:
+            destination.write(command["name"], command["script"], command["description"], command["meta"])
+
+    for command in commands:
+        copied = destination.read(command["name"])
+        if copied is None or copied["script"] != command["script"]:
+            raise RuntimeError(f"Command '{command['name']}' was not copied correctly, nothing was removed.")
+
+    for command in commands:
+        source.delete(command["name"])
+    if target == "files":
+        for path in (get_database_file(commands_dir), get_packed_dir(commands_dir)):
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            elif os.path.exists(path):
+                os.remove(path)
+    return [command["name"] for command in commands]
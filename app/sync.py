@@ -0,0 +1,171 @@
+import os
+import json
+import shutil
+import hashlib
+from app.log_util import Log
+from app.index import get_state_dir
+from app.copy_engine import copy_files
+
+# Incremental copy of command folders between the command repository and an
+# export folder. The signature (mtime, size and mode of every file) of each
+# exported command is kept in a manifest under the repository's .mcmd folder,
+# one manifest per destination, so unchanged commands are skipped without
+# reading or copying any file.
+
+log = Log()
+
+MANIFEST_DIR_NAME = "exports"
+
+def folder_signature(folder):
+    """
+    Return {relative file path: [mtime_ns, size, mode]} for every file in a folder.
+    """
+    signature = {}
+    for root, dirs, files in os.walk(folder):
+        for file in files:
+            path = os.path.join(root, file)
+            stat = os.stat(path)
+            signature[os.path.relpath(path, folder)] = [stat.st_mtime_ns, stat.st_size, stat.st_mode & 0o7777]
+    return signature
+
+def get_manifest_file(commands_dir, destination):
+    key = hashlib.sha1(os.path.abspath(destination).encode()).hexdigest()
+    return os.path.join(get_state_dir(commands_dir), MANIFEST_DIR_NAME, f"{key}.json")
+
+def read_manifest(commands_dir, destination):
+    try:
+        with open(get_manifest_file(commands_dir, destination), 'r') as file:
+            return json.load(file)["commands"]
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        return {}
+
+def write_manifest(commands_dir, destination, commands):
+    manifest_file = get_manifest_file(commands_dir, destination)
+    os.makedirs(os.path.dirname(manifest_file), exist_ok=True)
+    temp_file = f"{manifest_file}.{os.getpid()}.tmp"
+    with open(temp_file, 'w') as file:
+        json.dump({"destination": os.path.abspath(destination), "commands": commands}, file)
+    os.replace(temp_file, manifest_file)
+
+def sync_folder(src_dir, dest_dir, old_signature, new_signature):
+    """
+    Remove the files of dest_dir that are gone from src_dir, and return the
+    (src, dest) pairs of the files whose signature changed.
+    """
+    pairs = []
+    for rel_path, signature in new_signature.items():
+        dest_file = os.path.join(dest_dir, rel_path)
+        if old_signature.get(rel_path) != signature or not os.path.exists(dest_file):
+            pairs.append((os.path.join(src_dir, rel_path), dest_file))
+
+    for rel_path in old_signature:
+        if rel_path not in new_signature:
+            dest_file = os.path.join(dest_dir, rel_path)
+            if os.path.exists(dest_file):
+                os.remove(dest_file)
+    return pairs
+
+def sync_commands(commands_dir, commands, destination, prune=False):
+    """
+    Export command folders to destination, copying only the changed ones.
+
+    Args:
+        commands_dir (str): The command repository.
+        commands (list): Top-level command folders to export.
+        destination (str): Folder the commands are copied into.
+        prune (bool): Remove commands that were exported before but no longer
+            exist in the repository.
+
+    Returns:
+        dict: Lists of command names that were 'copied', 'skipped' and 'removed',
+        and the copy throughput 'stats' from copy_files.
+    """
+    manifest = read_manifest(commands_dir, destination)
+    updated = {}
+    pairs = []
+    result = {"copied": [], "skipped": [], "removed": []}
+
+    for cmd in commands:
+        signature = folder_signature(os.path.join(commands_dir, cmd))
+        dest_dir = os.path.join(destination, cmd)
+        old_signature = manifest.get(cmd, {})
+        if old_signature == signature and os.path.isdir(dest_dir):
+            result["skipped"].append(cmd)
+        else:
+            pairs.extend(sync_folder(os.path.join(commands_dir, cmd), dest_dir, old_signature, signature))
+            result["copied"].append(cmd)
+        updated[cmd] = signature
+
+    for cmd, signature in manifest.items():
+        if cmd in updated:
+            continue
+        if prune:
+            # Only folders recorded in the manifest are removed, never anything mcmd did not export
+            shutil.rmtree(os.path.join(destination, cmd), ignore_errors=True)
+            result["removed"].append(cmd)
+        else:
+            updated[cmd] = signature
+
+    result["stats"] = copy_files(pairs)
+    write_manifest(commands_dir, destination, updated)
+    return result
+
+IMPORT_STATE_FILE_NAME = "imports.json"
+
+def get_import_state_file(commands_dir):
+    return os.path.join(get_state_dir(commands_dir), IMPORT_STATE_FILE_NAME)
+
+def read_import_state(commands_dir):
+    try:
+        with open(get_import_state_file(commands_dir), 'r') as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def get_last_import(commands_dir, import_dir):
+    """
+    Return the commit of the last successful import from import_dir, or None.
+    """
+    return read_import_state(commands_dir).get(os.path.abspath(import_dir), {}).get("commit")
+
+def record_import(commands_dir, import_dir, commit):
+    state = read_import_state(commands_dir)
+    state[os.path.abspath(import_dir)] = {"commit": commit}
+    state_file = get_import_state_file(commands_dir)
+    os.makedirs(os.path.dirname(state_file), exist_ok=True)
+    temp_file = f"{state_file}.{os.getpid()}.tmp"
+    with open(temp_file, 'w') as file:
+        json.dump(state, file, indent=4)
+    os.replace(temp_file, state_file)
+
+def remove_empty_dirs(path, stop):
+    while path != stop and os.path.isdir(path) and not os.listdir(path):
+        os.rmdir(path)
+        path = os.path.dirname(path)
+
+def apply_changes(import_path, commands_dir, changes):
+    """
+    Apply file level changes from an import folder to the command repository.
+
+    Args:
+        import_path (str): The folder commands are imported from.
+        commands_dir (str): The command repository.
+        changes (list): (status, path relative to import_path) tuples, where a
+            status of 'D' removes the file and anything else copies it.
+
+    Returns:
+        tuple: The top-level command folders that were touched, and the copy
+        throughput stats from copy_files.
+    """
+    folders = set()
+    pairs = []
+    for status, rel_path in changes:
+        dest_file = os.path.join(commands_dir, rel_path)
+        if status == 'D':
+            if os.path.exists(dest_file):
+                os.remove(dest_file)
+                remove_empty_dirs(os.path.dirname(dest_file), commands_dir)
+        else:
+            pairs.append((os.path.join(import_path, rel_path), dest_file))
+        folders.add(rel_path.split('/')[0])
+    return sorted(folders), copy_files(pairs)
@@ -0,0 +1,154 @@
+import os
+import json
+import zlib
+from app.roots import get_state_dir
+from app.settings_store import get_settings
+
+# Append-only log of command runs, one JSON line per run, under the
+# repository's .mcmd folder. The log is rotated by size and `mcmd stats`
+# streams over it with a fixed amount of memory per command.
+
+TELEMETRY_FILE_NAME = "telemetry.log"
+ROTATED_FILES = 3
+SAMPLE_SIZE = 1024
+
+def get_telemetry_file(commands_dir):
+    return os.path.join(get_state_dir(commands_dir), TELEMETRY_FILE_NAME)
+
+def hash_args(args):
+    return f"{zlib.crc32(json.dumps(args).encode()):08x}"
+
+def rotate(telemetry_file):
+    for number in range(ROTATED_FILES - 1, 0, -1):
+        older = f"{telemetry_file}.{number}"
+        if os.path.exists(older):
+            os.replace(older, f"{telemetry_file}.{number + 1}")
+    os.replace(telemetry_file, f"{telemetry_file}.1")
+
+def child_peak_rss(usage):
+    """
+    Return the peak RSS of the child from its os.wait4 usage, or None when it
+    cannot be told apart from mcmd's own.
+
+    The kernel keeps the high-water mark across exec, so ru_maxrss is the larger
+    of the child's peak and the footprint it was forked with, which is at most
+    mcmd's own peak. Only a value above that is the child's. It is in kilobytes
+    on Linux and bytes on macOS, like mcmd's own.
+    """
+    if not usage:
+        return None
+    import resource
+
+    own_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage.ru_maxrss if usage.ru_maxrss > own_peak else None
+
+def record_run(commands_dir, command_name, args, start, wall, usage, returncode):
+    """
+    Append one run to the telemetry log, rotating it when it is too large.
+
+    Args:
+        commands_dir (str): The command repository.
+        command_name (str): The command that ran.
+        args (list): Its arguments, only a hash of them is stored.
+        start (float): Start time, seconds since the epoch.
+        wall (float): Wall time in seconds.
+        usage: The child's resource usage from os.wait4, or None.
+        returncode (int): The exit status of the child.
+    """
+    if not get_settings("ENABLE_TELEMETRY"):
+        return
+    record = {
+        "command": command_name,
+        "args": hash_args(args),
+        "start": round(start, 3),
+        "wall": round(wall, 4),
+        "cpu": round(usage.ru_utime + usage.ru_stime, 4) if usage else None,
+        "peak_rss": child_peak_rss(usage),
+        "exit": returncode,
+    }
+    telemetry_file = get_telemetry_file(commands_dir)
+    try:
+        os.makedirs(os.path.dirname(telemetry_file), exist_ok=True)
+        if os.path.exists(telemetry_file) and os.path.getsize(telemetry_file) > get_settings("TELEMETRY_MAX_MB") * 1024 * 1024:
+            rotate(telemetry_file)
+        # A single O_APPEND write per record keeps concurrent runs from interleaving lines
+        fd = os.open(telemetry_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, (json.dumps(record) + "\n").encode())
+        finally:
+            os.close(fd)
+    except OSError:
+        # Telemetry must never make a command fail
+        pass
+
+def iter_records(commands_dir):
+    """
+    Yield the telemetry records, oldest first, without loading the log in memory.
+    """
+    telemetry_file = get_telemetry_file(commands_dir)
+    files = [f"{telemetry_file}.{number}" for number in range(ROTATED_FILES, 0, -1)] + [telemetry_file]
+    for path in files:
+        try:
+            with open(path, 'r') as file:
+                for line in file:
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+        except FileNotFoundError:
+            continue
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    position = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[position]
+
+def summarize(records, sample_size=SAMPLE_SIZE):
+    """
+    Aggregate telemetry records per command in bounded memory.
+
+    Latency percentiles are computed over a reservoir sample of at most
+    sample_size runs per command, so memory does not grow with the log.
+
+    Returns:
+        list: One dict per command with calls, failures, failure_rate, p50,
+        p95, p99, cpu (mean) and peak_rss (max, None if no run used more
+        memory than mcmd itself), sorted by call count.
+    """
+    import random
+
+    rng = random.Random(0)
+    commands = {}
+    for record in records:
+        stats = commands.setdefault(record["command"], {"calls": 0, "failures": 0, "cpu": 0.0, "peak_rss": None, "sample": []})
+        stats["calls"] += 1
+        if record.get("exit"):
+            stats["failures"] += 1
+        stats["cpu"] += record.get("cpu") or 0.0
+        # Records of older versions have an "rss" that includes mcmd's own memory, it is ignored
+        if record.get("peak_rss") is not None:
+            stats["peak_rss"] = max(stats["peak_rss"] or 0, record["peak_rss"])
+        if len(stats["sample"]) < sample_size:
+            stats["sample"].append(record["wall"])
+        else:
+            slot = rng.randrange(stats["calls"])
+            if slot < sample_size:
+                stats["sample"][slot] = record["wall"]
+
+    summary = []
+    for name, stats in commands.items():
+        sample = sorted(stats["sample"])
+        summary.append({
+            "command": name,
+            "calls": stats["calls"],
+            "failures": stats["failures"],
+            "failure_rate": stats["failures"] / stats["calls"],
+            "p50": percentile(sample, 0.50),
+            "p95": percentile(sample, 0.95),
+            "p99": percentile(sample, 0.99),
+            "cpu": stats["cpu"] / stats["calls"],
+            "peak_rss": stats["peak_rss"],
+        })
+    summary.sort(key=lambda item: (-item["calls"], item["command"]))
+    return summary
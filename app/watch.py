@@ -0,0 +1,384 @@
+import os
+import sys
+import time
+import errno
+import select
+import signal
+import struct
+from app.log_util import Log
+from app.metadata import load_metadata
+from app.telemetry import record_run
+from app.roots import get_commands_dir, resolve_command
+
+# Watch mode for `mcmd exec --watch PATH`: run a command, then run it again
+# whenever files under the watched paths change. The interpreter, settings,
+# command lookup and metadata are loaded once and reused for every run.
+#
+# On Linux changes come from inotify, called through ctypes. Elsewhere, or when
+# inotify is unavailable or out of watches, the paths are polled: directories
+# are stat'ed on every poll and only the ones whose mtime changed are listed
+# again, which catches files being created, deleted, renamed or saved by
+# editors that write a new file. Files edited in place do not change their
+# directory's mtime, so every file is stat'ed on a slower full sweep.
+#
+# A burst of changes (a save touching several files, a checkout) triggers one
+# run once the paths have been quiet for the debounce period. A run that is
+# still going when a change comes in is stopped with its process group, or,
+# with --queue, allowed to finish before the next one starts.
+
+log = Log()
+
+IGNORED_NAMES = {".git", ".hg", ".svn", ".mcmd", "__pycache__", "node_modules"}
+POLL_INTERVAL = 0.1
+SCAN_INTERVAL = 0.5
+FULL_SCAN_EVERY = 10
+DEFAULT_DEBOUNCE = 0.2
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+              | IN_CREATE | IN_DELETE | IN_DELETE_SELF)
+EVENT_HEADER = struct.Struct("iIII")
+
+def walk_dirs(root):
+    """
+    Yield a directory and its subdirectories, skipping IGNORED_NAMES.
+    """
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        yield directory
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.name not in IGNORED_NAMES and entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+        except OSError:
+            pass
+
+def split_targets(paths):
+    """
+    Return the watched directories and, for paths that are files, their parent
+    directory with the file names to look at.
+
+    Returns:
+        tuple: (list of directories watched recursively, dict of directory -> set of file names).
+    """
+    directories, files = [], {}
+    for path in paths:
+        path = os.path.abspath(os.path.expanduser(path))
+        if os.path.isdir(path):
+            directories.append(path)
+        elif os.path.exists(path):
+            files.setdefault(os.path.dirname(path), set()).add(os.path.basename(path))
+        else:
+            raise ValueError(f"Cannot watch '{path}': no such file or directory.")
+    return directories, files
+
+class InotifyWatcher:
+    """
+    Change notifications from the kernel for the watched paths.
+    """
+    name = "inotify"
+
+    def __init__(self, paths):
+        import ctypes
+        import ctypes.util
+
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.ctypes = ctypes
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        # watch descriptor -> (directory, file names to report or None for all, recursive)
+        self.watches = {}
+        try:
+            directories, files = split_targets(paths)
+            for root in directories:
+                for directory in walk_dirs(root):
+                    self.add_watch(directory, None, True)
+            for directory, names in files.items():
+                self.add_watch(directory, names, False)
+        except OSError:
+            self.close()
+            raise
+
+    def add_watch(self, directory, names, recursive):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            error = self.ctypes.get_errno()
+            if error in (errno.ENOENT, errno.ENOTDIR):
+                return
+            # ENOSPC: out of watches (fs.inotify.max_user_watches)
+            raise OSError(error, f"Cannot watch '{directory}': {os.strerror(error)}")
+        if wd in self.watches:
+            # Watched both for some files and as a whole: report everything
+            _, old_names, old_recursive = self.watches[wd]
+            names = None if old_names is None or names is None else old_names | names
+            recursive = recursive or old_recursive
+        self.watches[wd] = (directory, names, recursive)
+
+    def wait(self, timeout):
+        """
+        Wait up to timeout seconds for changes.
+
+        Returns:
+            set: The changed paths, empty if nothing changed.
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        changes = set()
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+            changes |= self.parse(data)
+        return changes
+
+    def parse(self, data):
+        changes = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                changes.add("(event queue overflow)")
+                continue
+            watch = self.watches.get(wd)
+            if watch is None:
+                continue
+            directory, names, recursive = watch
+            if mask & IN_IGNORED:
+                del self.watches[wd]
+                continue
+            if name in IGNORED_NAMES or (names is not None and name not in names):
+                continue
+            path = os.path.join(directory, name) if name else directory
+            if recursive and mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                # New directories, and whatever was already put in them, are watched too
+                for subdirectory in walk_dirs(path):
+                    self.add_watch(subdirectory, None, True)
+            changes.add(path)
+        return changes
+
+    def close(self):
+        os.close(self.fd)
+
+class ScanWatcher:
+    """
+    Changes found by polling the watched paths.
+    """
+    name = "polling"
+
+    def __init__(self, paths, interval=SCAN_INTERVAL):
+        self.interval = interval
+        directories, files = split_targets(paths)
+        self.dir_mtimes = {}
+        self.entries = {}
+        self.polls = 0
+        self.next_poll = time.monotonic() + interval
+        for root in directories:
+            for directory in walk_dirs(root):
+                self.scan_dir(directory)
+        # Directories only watched for some of their files
+        self.filters = {directory: names for directory, names in files.items() if directory not in self.dir_mtimes}
+        for directory, names in self.filters.items():
+            self.scan_dir(directory, names)
+
+    def file_stats(self, directory, names=None):
+        stats, subdirectories = {}, []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.name in IGNORED_NAMES or (names is not None and entry.name not in names):
+                        continue
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirectories.append(entry.path)
+                        else:
+                            stat = entry.stat()
+                            stats[entry.path] = (stat.st_mtime_ns, stat.st_size)
+                    except OSError:
+                        pass
+        except OSError:
+            pass
+        return stats, subdirectories
+
+    def dir_mtime(self, directory):
+        try:
+            return os.stat(directory).st_mtime_ns
+        except OSError:
+            return None
+
+    def scan_dir(self, directory, names=None):
+        """
+        List a directory again and return the paths that changed in it.
+        """
+        changes = set()
+        self.dir_mtimes[directory] = self.dir_mtime(directory)
+        stats, subdirectories = self.file_stats(directory, names)
+        old_stats = self.entries.get(directory, {})
+        for path in set(stats) | set(old_stats):
+            if stats.get(path) != old_stats.get(path):
+                changes.add(path)
+        self.entries[directory] = stats
+        if names is None:
+            for subdirectory in subdirectories:
+                if subdirectory not in self.dir_mtimes:
+                    changes.add(subdirectory)
+                    for nested in walk_dirs(subdirectory):
+                        if nested not in self.dir_mtimes:
+                            changes |= self.scan_dir(nested)
+        return changes
+
+    def poll(self):
+        changes = set()
+        self.polls += 1
+        full_sweep = self.polls % FULL_SCAN_EVERY == 0
+        for directory in list(self.dir_mtimes):
+            if directory not in self.dir_mtimes:
+                continue
+            mtime = self.dir_mtime(directory)
+            if mtime is None:
+                # Removed, along with everything below it
+                for gone in [d for d in self.dir_mtimes if d == directory or d.startswith(directory + os.sep)]:
+                    changes |= set(self.entries.pop(gone, {}))
+                    del self.dir_mtimes[gone]
+                changes.add(directory)
+            elif mtime != self.dir_mtimes[directory] or full_sweep:
+                changes |= self.scan_dir(directory, self.filters.get(directory))
+        return changes
+
+    def wait(self, timeout):
+        """
+        Wait up to timeout seconds for changes.
+
+        Returns:
+            set: The changed paths, empty if nothing changed.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            now = time.monotonic()
+            if now >= self.next_poll:
+                self.next_poll = now + self.interval
+                changes = self.poll()
+                if changes:
+                    return changes
+            if now >= deadline:
+                return set()
+            time.sleep(max(0, min(deadline, self.next_poll) - now))
+
+    def close(self):
+        pass
+
+def make_watcher(paths):
+    """
+    Return an inotify watcher for the paths where possible, else a polling one.
+    """
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(paths)
+        except (OSError, AttributeError) as e:
+            log.warn(f"inotify is not available ({e}), polling for changes instead.")
+    return ScanWatcher(paths)
+
+def collect_burst(watcher, changes, debounce):
+    # Keep collecting until the paths have been quiet for the debounce period
+    while True:
+        more = watcher.wait(debounce)
+        if not more:
+            return changes
+        changes |= more
+
+def describe_changes(changes):
+    first = sorted(changes)[0]
+    return first if len(changes) == 1 else f"{first} and {len(changes) - 1} more"
+
+def watch_and_run(command_name, args, paths, debounce=DEFAULT_DEBOUNCE, queue=False, limits=None):
+    """
+    Run a custom command and run it again whenever the watched paths change,
+    until Ctrl-C.
+
+    Args:
+        command_name (str): The command to run.
+        args (list): Arguments passed to the script.
+        paths (list): Files and directories to watch, directories recursively.
+        debounce (float): Seconds without changes before a burst triggers a run.
+        queue (bool): Let a running execution finish before the next run,
+            instead of stopping it.
+        limits (dict): Limits from the command line, see app.limits.
+
+    Returns:
+        int: The exit status for mcmd, 130 when stopped with Ctrl-C.
+    """
+    from app.limits import ProcessGroup, get_limits
+    from app.runner import get_script_to_run, exit_status, COMMAND_NOT_FOUND
+
+    commands_dir = get_commands_dir()
+    command_file = resolve_command(command_name, commands_dir)
+    if not command_file:
+        log.error(f"Command 'mcmd {command_name}' not found.")
+        return COMMAND_NOT_FOUND
+    try:
+        limits = get_limits(load_metadata(commands_dir, command_name, command_file), limits)
+        watcher = make_watcher(paths)
+    except ValueError as e:
+        log.error(str(e))
+        return 1
+
+    def start():
+        # The flat file is checked on every run, the command itself may be what changed
+        log.info(f"==> mcmd {' '.join([command_name] + args)}")
+        return ProcessGroup([get_script_to_run(commands_dir, command_file)] + args, limits), time.time(), time.perf_counter()
+
+    def finish(run, result):
+        group, start_time, started = run
+        returncode, usage = result
+        if group.reason != "restart":
+            record_run(commands_dir, command_name, args, start_time, time.perf_counter() - started, usage, returncode)
+            status = exit_status(returncode)
+            (log.info if status == 0 else log.error)(f"==> exit {status}, waiting for changes")
+        return group.reason == "interrupt"
+
+    log.info(f"Watching {', '.join(paths)} for changes ({watcher.name}), press Ctrl-C to stop.")
+    run, pending = None, True
+    try:
+        while True:
+            if run is None and pending:
+                run, pending = start(), False
+            changes = watcher.wait(POLL_INTERVAL)
+            if run is not None:
+                result = run[0].poll()
+                if result is not None:
+                    if finish(run, result):
+                        return 130
+                    run = None
+            if not changes:
+                continue
+            changes = collect_burst(watcher, changes, debounce)
+            log.info(f"==> changed: {describe_changes(changes)}")
+            pending = True
+            if run is not None and not queue:
+                run[0].stop("restart", signal.SIGTERM)
+                finish(run, run[0].wait())
+                run = None
+    except KeyboardInterrupt:
+        if run is not None:
+            run[0].stop("interrupt", signal.SIGINT)
+            run[0].wait()
+        return 130
+    finally:
+        watcher.close()
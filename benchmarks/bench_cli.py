@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Startup and scaling benchmarks for the mcmd CLI.
+
+Generates synthetic command repositories in the `<name>/<name>.sh` +
+`<name>.desc` layout used by create_or_update_command, then times cold and
+warm runs of the CLI against each of them. Every repository lives in its own
+temporary HOME, so the real ~/.mcmd_commands is never touched.
+
+A cold run is the first invocation against a freshly generated repository
+(no index or other derived state yet); warm runs are the ones that follow.
+Results are printed, or written with --output, as JSON.
+
+Usage:
+    python benchmarks/bench_cli.py [--sizes 10,1000,10000] [--runs 5] [--output results.json]
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_SIZES = [10, 1000, 10000]
+NOOP_COMMAND = "bench_noop"
+
+# Benchmarked invocations: name -> (arguments, stdin fed to the prompts)
+SCENARIOS = {
+    "help": (["--help"], ""),
+    "list": (["list"], ""),
+    "exec": (["exec", NOOP_COMMAND], ""),
+    "export": (["export"], "y\n"),
+    "imports": (["imports"], "y\n"),
+}
+
+def write_command(commands_dir, name, description, body):
+    command_dir = os.path.join(commands_dir, name)
+    os.makedirs(command_dir, exist_ok=True)
+    command_file = os.path.join(command_dir, f"{name}.sh")
+    with open(command_file, 'w') as file:
+        file.write("#!/bin/bash\n" + body)
+    os.chmod(command_file, 0o755)
+    with open(os.path.join(command_dir, f"{name}.desc"), 'w') as file:
+        file.write(description + "\n")
+
+def generate_repository(home, size):
+    """
+    Create a HOME with settings.json and a repository of `size` commands.
+
+    Returns:
+        str: The export folder configured in the settings.
+    """
+    commands_dir = os.path.join(home, ".mcmd_commands")
+    export_dir = os.path.join(home, "export")
+    os.makedirs(commands_dir)
+    os.makedirs(export_dir)
+
+    with open(os.path.join(REPO_ROOT, "settings", "settings.json"), 'r') as file:
+        settings = json.load(file)
+    settings["MCMD_EXPORT_DIR"]["value"] = export_dir
+    with open(os.path.join(commands_dir, "settings.json"), 'w') as file:
+        json.dump(settings, file, indent=4)
+
+    write_command(commands_dir, NOOP_COMMAND, "Does nothing, used to time mcmd's own overhead.", "exit 0\n")
+    for number in range(size - 1):
+        name = f"bench_command_{number:05d}"
+        write_command(commands_dir, name, f"Synthetic benchmark command number {number}.", f"echo {name} \"$@\"\n")
+    return export_dir
+
+def run_once(home, arguments, stdin):
+    env = dict(os.environ, HOME=home)
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-m", "app.main"] + arguments,
+        cwd=REPO_ROOT,
+        env=env,
+        input=stdin,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        text=True,
+    )
+    return (time.perf_counter() - start) * 1000, result.returncode
+
+def summarize(samples):
+    return {
+        "min": round(min(samples), 2),
+        "median": round(statistics.median(samples), 2),
+        "max": round(max(samples), 2),
+    }
+
+def benchmark_size(size, scenarios, runs):
+    results = []
+    home = tempfile.mkdtemp(prefix=f"mcmd-bench-{size}-")
+    try:
+        generate_repository(home, size)
+        for scenario in scenarios:
+            arguments, stdin = SCENARIOS[scenario]
+            cold_ms, cold_status = run_once(home, arguments, stdin)
+            warm = [run_once(home, arguments, stdin) for _ in range(runs)]
+            results.append({
+                "size": size,
+                "scenario": scenario,
+                "command": "mcmd " + " ".join(arguments),
+                "cold_ms": round(cold_ms, 2),
+                "warm_ms": summarize([elapsed for elapsed, _ in warm]),
+                "runs": runs,
+                "exit_statuses": sorted({cold_status} | {status for _, status in warm}),
+            })
+            print(f"{size:>6} {scenario:<8} cold {cold_ms:9.1f} ms  warm median {results[-1]['warm_ms']['median']:9.1f} ms", file=sys.stderr)
+    finally:
+        shutil.rmtree(home, ignore_errors=True)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default=",".join(str(size) for size in DEFAULT_SIZES),
+                        help="Comma separated repository sizes")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help="Comma separated subset of: " + ", ".join(SCENARIOS))
+    parser.add_argument("--runs", type=int, default=5, help="Warm runs per scenario")
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    options = parser.parse_args()
+
+    scenarios = [scenario.strip() for scenario in options.scenarios.split(",") if scenario.strip()]
+    unknown = [scenario for scenario in scenarios if scenario not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": [],
+    }
+    for size in options.sizes.split(","):
+        report["results"].extend(benchmark_size(int(size), scenarios, options.runs))
+
+    output = json.dumps(report, indent=2)
+    if options.output:
+        with open(options.output, 'w') as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Check the import cost of the `mcmd exec` fast path against its startup budget.
+
+Runs `python -X importtime` over the modules loaded by app.main's fast path and
+fails when the cumulative import time exceeds the budget or when any module
+that only the full CLI needs gets pulled in.
+
+Usage:
+    python benchmarks/startup_budget.py [--budget-ms 50] [--runs 5]
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules imported by `mcmd exec <name>` before the script is launched.
+FAST_PATH_MODULES = ["app.main", "app.daemon_client", "app.runner"]
+
+# Modules the fast path must never import.
+FORBIDDEN_MODULES = ["typer", "click", "rich", "tkinter", "pkg_resources", "app.cli", "app.operations", "app.index"]
+
+# Budget for the cumulative import time of FAST_PATH_MODULES, in milliseconds.
+DEFAULT_BUDGET_MS = 50
+
+def measure_imports():
+    """
+    Import the fast path modules in a fresh interpreter with -X importtime.
+
+    Returns:
+        tuple: (dict of module name to cumulative microseconds, set of imported modules)
+    """
+    code = "import " + ", ".join(FAST_PATH_MODULES)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=REPO_ROOT,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        check=True,
+    )
+    cumulative = {}
+    imported = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        module = name.strip()
+        imported.add(module)
+        # Top level entries are not indented relative to the module column
+        if not name[1:].startswith(" "):
+            cumulative[module] = int(cumulative_us)
+    return cumulative, imported
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=5, help="Take the best of this many runs")
+    options = parser.parse_args()
+
+    best_ms = None
+    imported = set()
+    for _ in range(options.runs):
+        cumulative, imported = measure_imports()
+        total_ms = sum(cumulative.get(module, 0) for module in FAST_PATH_MODULES) / 1000
+        best_ms = total_ms if best_ms is None else min(best_ms, total_ms)
+
+    failures = []
+    leaked = sorted(m for m in imported if m.split(".")[0] in FORBIDDEN_MODULES or m in FORBIDDEN_MODULES)
+    if leaked:
+        failures.append(f"forbidden modules imported: {', '.join(leaked)}")
+    if best_ms > options.budget_ms:
+        failures.append(f"import time {best_ms:.1f} ms exceeds budget of {options.budget_ms:.1f} ms")
+
+    print(f"fast path import time: {best_ms:.1f} ms (budget {options.budget_ms:.1f} ms)")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,6 +4,8 @@ import subprocess
 from setuptools.command.install import install
 from app.log_util import Log
 from app.settings import get_settings,compare_and_update_settings
+from app.flatten import flatten_all
+from app.repository import atomic_copy, write_lock
 
 log = Log()
 
@@ -23,14 +25,17 @@ class CustomInstallCommand(install):
 
         compare_and_update_settings(get_settings("MCMD_COMMANDS_DIR","settings"),"settings")
         
-        # Copy all contents from source to destination
-        for item in os.listdir(src_dir):
-            s = os.path.join(src_dir, item)
-            d = os.path.join(dest_dir, item)
-            if os.path.isdir(s):
-                shutil.copytree(s, d, dirs_exist_ok=True)
-            else:
-                shutil.copy2(s, d)
-        
-        subprocess.run(['chmod', '-R', '+x', dest_dir])
+        # Copy all contents from source to destination, replacing each file in one rename
+        with write_lock(dest_dir):
+            for item in os.listdir(src_dir):
+                s = os.path.join(src_dir, item)
+                d = os.path.join(dest_dir, item)
+                if os.path.isdir(s):
+                    shutil.copytree(s, d, dirs_exist_ok=True, copy_function=atomic_copy)
+                else:
+                    atomic_copy(s, d)
+
+            subprocess.run(['chmod', '-R', '+x', dest_dir])
+            if get_settings("ENABLE_FLATTEN", dest_dir):
+                flatten_all(dest_dir)
         log.warn("************Sample commands moved**************")
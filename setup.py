@@ -10,7 +10,7 @@ setup(
     ],
     entry_points={
         "console_scripts": [
-            "mcmd=app.cli:app",
+            "mcmd=app.main:main",
         ],
     },
     classifiers=[
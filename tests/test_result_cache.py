@@ -0,0 +1,57 @@
+import os
+import json
+import subprocess
+import sys
+
+import pytest
+
+# Regression tests for the result cache, run against the real CLI in a
+# temporary HOME so the user's ~/.mcmd_commands is never touched.
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LINES = 2000000
+
+@pytest.fixture
+def home(tmp_path):
+    commands_dir = tmp_path / ".mcmd_commands"
+    command_dir = commands_dir / "count"
+    command_dir.mkdir(parents=True)
+    with open(os.path.join(REPO_ROOT, "settings", "settings.json"), 'r') as file:
+        settings = json.load(file)
+    (commands_dir / "settings.json").write_text(json.dumps(settings, indent=4))
+    script = command_dir / "count.sh"
+    script.write_text(f"#!/bin/bash\nseq 1 {LINES}\n")
+    script.chmod(0o755)
+    (command_dir / "count.meta").write_text(json.dumps({"cache": {"ttl": 600}}))
+    return str(tmp_path)
+
+def run_closed_early(home):
+    # Like `mcmd exec count | head -1`
+    process = subprocess.Popen([sys.executable, "-m", "app.main", "exec", "count"], cwd=REPO_ROOT,
+                               env=dict(os.environ, HOME=home), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    assert process.stdout.readline() == b"1\n"
+    process.stdout.close()
+    try:
+        _, stderr = process.communicate(timeout=60)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        pytest.fail("mcmd hung after its reader closed the pipe")
+    return process.returncode, stderr
+
+def test_reader_closing_early_does_not_hang(home):
+    # A miss: the child's output is still drained into the cache entry
+    returncode, stderr = run_closed_early(home)
+    assert returncode == 0, stderr
+    assert b"Traceback" not in stderr
+
+    # A hit: replaying into a closed pipe does not fail either
+    returncode, stderr = run_closed_early(home)
+    assert returncode == 0, stderr
+    assert b"Traceback" not in stderr
+
+def test_entry_of_early_closed_run_is_complete(home):
+    run_closed_early(home)
+    result = subprocess.run([sys.executable, "-m", "app.main", "exec", "count"], cwd=REPO_ROOT,
+                            env=dict(os.environ, HOME=home), stdout=subprocess.PIPE, timeout=60)
+    assert result.returncode == 0
+    assert result.stdout.count(b"\n") == LINES